@@ -0,0 +1,324 @@
+"""
+Benchmark of the determine_change diff path with synthetic Atlas entities.
+
+Every event runs the work DetermineChange.map does for an entity update: parsing the enriched kafka notification,
+parsing the current and the previous entity version, the attribute and relationship diff, and the construction and
+serialization of the resulting entity messages. Elastic search and Atlas are not called: the previous entity version
+is taken from the synthetic event and the direct change lookup is replaced by a constant.
+
+Run from the repository root, for example:
+
+    python benchmarks/determine_change_benchmark.py
+    python benchmarks/determine_change_benchmark.py --attributes 50 --relationships 5000 --events 200
+    python benchmarks/determine_change_benchmark.py --output results.json
+    python benchmarks/determine_change_benchmark.py --baseline results.json --tolerance 0.2
+
+With --baseline the script exits with status 1 in case the events per second of any scenario dropped by more than the tolerance.
+"""
+import argparse
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional
+
+from m4i_atlas_core import AtlasChangeMessage, Entity
+
+from m4i_flink_tasks import diff_entities, get_update_messages
+from m4i_flink_tasks.codec import dumps, loads
+
+
+@dataclass
+class Scenario:
+    name: str
+    attributes: int
+    relationships: int
+    list_length: int
+    changed_attributes: float = 0.1
+    changed_relationships: float = 0.01
+# END Scenario
+
+
+@dataclass
+class BenchmarkResult:
+    scenario: str
+    stage: str
+    events: int
+    events_per_second: float
+    p50_ms: float
+    p99_ms: float
+    peak_memory_kb: float
+# END BenchmarkResult
+
+
+DEFAULT_SCENARIOS = [
+    Scenario(name="small", attributes=20, relationships=10, list_length=5),
+    Scenario(name="medium", attributes=100, relationships=200, list_length=50),
+    Scenario(name="dataset", attributes=50, relationships=5000, list_length=100),
+]
+
+
+def make_relationship(index: int) -> dict:
+    return {
+        "guid": f"field-{index:08d}",
+        "typeName": "m4i_field",
+        "entityStatus": "ACTIVE",
+        "displayText": f"Field {index}",
+        "relationshipType": "m4i_dataset_field",
+        "relationshipGuid": f"relationship-{index:08d}",
+        "relationshipStatus": "ACTIVE",
+        "relationshipAttributes": {"typeName": "m4i_dataset_field"}
+    }
+# END make_relationship
+
+
+def make_entity(scenario: Scenario, update_time: int, attribute_values: Dict[str, str], relationship_indices: List[int]) -> dict:
+    relationships = [make_relationship(index) for index in relationship_indices]
+    return {
+        "typeName": "m4i_dataset",
+        "guid": "5c1cd9a4-0c8a-4b0b-a7bb-1c1a0d9bb001",
+        "status": "ACTIVE",
+        "createTime": 1655718000000,
+        "updateTime": update_time,
+        "createdBy": "admin",
+        "updatedBy": "admin",
+        "version": 0,
+        "attributes": {
+            "qualifiedName": "benchmark--dataset",
+            "name": "Benchmark dataset",
+            **attribute_values,
+            "parent": {"guid": "collection-00000001", "typeName": "m4i_collection"},
+            "replicatedTo": [f"cluster-{index}" for index in range(scenario.list_length)],
+            "tags": [f"tag-{index}" for index in range(scenario.list_length)],
+            "fields": [{"guid": relationship["guid"], "typeName": "m4i_field"} for relationship in relationships]
+        },
+        "relationshipAttributes": {
+            "fields": relationships,
+            "collections": [],
+            "meanings": []
+        },
+        "classifications": [],
+        "labels": [],
+        "meanings": []
+    }
+# END make_entity
+
+
+def make_event(scenario: Scenario, seed: int) -> dict:
+    """This function generates an enriched entity update notification and the previous version of its entity."""
+    rng = random.Random(seed)
+
+    previous_values = {f"attribute{index}": f"value {index}" for index in range(scenario.attributes)}
+    current_values = dict(previous_values)
+    for key in rng.sample(sorted(previous_values), int(scenario.attributes * scenario.changed_attributes)):
+        current_values[key] = f"{previous_values[key]} changed {seed}"
+
+    previous_relationships = list(range(scenario.relationships))
+    churn = int(scenario.relationships * scenario.changed_relationships)
+    removed = set(rng.sample(previous_relationships, churn))
+    current_relationships = [index for index in previous_relationships if index not in removed]
+    current_relationships += list(range(scenario.relationships, scenario.relationships + churn))
+
+    previous_entity = make_entity(scenario, 1655718090000, previous_values, previous_relationships)
+    current_entity = make_entity(scenario, 1655718090946, current_values, current_relationships)
+
+    kafka_notification = {
+        "version": {"version": "1.0.0", "versionParts": [1]},
+        "msgCompressionKind": "NONE",
+        "msgSplitIdx": 1,
+        "msgSplitCount": 1,
+        "msgSourceIP": "127.0.1.1",
+        "msgCreatedBy": "",
+        "msgCreationTime": 1655718091920,
+        "message": {
+            "eventTime": 1655718090946,
+            "operationType": "ENTITY_UPDATE",
+            "type": "ENTITY_NOTIFICATION_V2",
+            "entity": {
+                "typeName": current_entity["typeName"],
+                "guid": current_entity["guid"],
+                "attributes": {"qualifiedName": "benchmark--dataset", "name": "Benchmark dataset"}
+            },
+            "relationship": None
+        }
+    }
+
+    return {
+        "notification": json.dumps({"kafka_notification": kafka_notification, "atlas_entity": current_entity}),
+        "previous_entity": previous_entity
+    }
+# END make_event
+
+
+def run_diff(event: dict):
+    """This stage only runs the attribute and relationship diff."""
+    notification = event["parsed_notification"]
+    diff_entities(notification["atlas_entity"], event["previous_entity"])
+# END run_diff
+
+
+def run_full(event: dict):
+    """This stage runs the parsing, the diff and the creation and serialization of the entity messages, like DetermineChange.map does for an update."""
+    kafka_notification_json = loads(event["notification"])
+
+    atlas_kafka_notification = AtlasChangeMessage.from_dict(kafka_notification_json["kafka_notification"])
+    atlas_entity_json = kafka_notification_json["atlas_entity"]
+    atlas_entity_parsed = Entity.from_dict(atlas_entity_json)
+    # The current version is kept in keyed state as a json string.
+    dumps(atlas_entity_json)
+
+    previous_atlas_entity_json = event["previous_entity"]
+    previous_entity_parsed = Entity.from_dict(previous_atlas_entity_json)
+
+    entity_diff = diff_entities(atlas_entity_json, previous_atlas_entity_json)
+
+    get_update_messages(
+        atlas_entity_parsed=atlas_entity_parsed,
+        previous_entity_parsed=previous_entity_parsed,
+        entity_diff=entity_diff,
+        original_event_type=atlas_kafka_notification.message.operation_type,
+        direct_change=True
+    )
+# END run_full
+
+
+STAGES: Dict[str, Callable[[dict], None]] = {
+    "diff": run_diff,
+    "full": run_full,
+}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+# END percentile
+
+
+def run_benchmark(scenario: Scenario, stage: str, events: int, warmup: int) -> BenchmarkResult:
+    """This function runs the given stage for the given number of synthetic events and measures latency, throughput and peak memory."""
+    stage_function = STAGES[stage]
+
+    generated = [make_event(scenario, seed) for seed in range(events)]
+    for event in generated:
+        event["parsed_notification"] = json.loads(event["notification"])
+
+    for event in generated[:warmup]:
+        stage_function(event)
+
+    gc.collect()
+    latencies = []
+    started = time.perf_counter()
+    for event in generated:
+        event_started = time.perf_counter()
+        stage_function(event)
+        latencies.append(time.perf_counter() - event_started)
+    elapsed = time.perf_counter() - started
+
+    # Memory is measured in a separate pass, since tracing allocations slows down the measured code considerably.
+    gc.collect()
+    tracemalloc.start()
+    for event in generated[:max(1, min(events, 20))]:
+        stage_function(event)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+
+    return BenchmarkResult(
+        scenario=scenario.name,
+        stage=stage,
+        events=events,
+        events_per_second=events / elapsed,
+        p50_ms=percentile(latencies, 0.50) * 1000,
+        p99_ms=percentile(latencies, 0.99) * 1000,
+        peak_memory_kb=peak_memory / 1024
+    )
+# END run_benchmark
+
+
+def compare_to_baseline(results: List[BenchmarkResult], baseline_path: str, tolerance: float) -> List[str]:
+    """This function returns a description of every scenario of which the throughput regressed by more than the tolerance compared to the baseline."""
+    with open(baseline_path) as baseline_file:
+        baseline = {(result["scenario"], result["stage"]): result for result in json.load(baseline_file)}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get((result.scenario, result.stage))
+        if previous is None:
+            continue
+        if result.events_per_second < previous["events_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{result.scenario}/{result.stage}: {result.events_per_second:.1f} events/s, baseline {previous['events_per_second']:.1f} events/s")
+    return regressions
+# END compare_to_baseline
+
+
+def print_results(results: List[BenchmarkResult]):
+    print(f"{'scenario':<12}{'stage':<8}{'events':>8}{'events/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'peak KiB':>12}")
+    for result in results:
+        print(f"{result.scenario:<12}{result.stage:<8}{result.events:>8}{result.events_per_second:>12.1f}"
+              f"{result.p50_ms:>10.3f}{result.p99_ms:>10.3f}{result.peak_memory_kb:>12.1f}")
+# END print_results
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the determine_change diff path with synthetic Atlas entities.")
+    parser.add_argument("--attributes", type=int, help="number of attributes per entity; runs a single custom scenario")
+    parser.add_argument("--relationships", type=int, default=100, help="relationship fan-out of the custom scenario")
+    parser.add_argument("--list-length", type=int, default=10, help="length of the list valued attributes of the custom scenario")
+    parser.add_argument("--changed-attributes", type=float, default=0.1, help="fraction of attributes changed per event")
+    parser.add_argument("--changed-relationships", type=float, default=0.01, help="fraction of relationships replaced per event")
+    parser.add_argument("--stage", choices=[*STAGES, "all"], default="all")
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--output", help="write the results as json to this file")
+    parser.add_argument("--baseline", help="json results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed throughput drop compared to the baseline")
+    return parser.parse_args(argv)
+# END parse_arguments
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arguments = parse_arguments(argv)
+
+    if arguments.attributes is not None:
+        scenarios = [Scenario(
+            name="custom",
+            attributes=arguments.attributes,
+            relationships=arguments.relationships,
+            list_length=arguments.list_length,
+            changed_attributes=arguments.changed_attributes,
+            changed_relationships=arguments.changed_relationships
+        )]
+    else:
+        scenarios = DEFAULT_SCENARIOS
+
+    stages = list(STAGES) if arguments.stage == "all" else [arguments.stage]
+
+    results = [
+        run_benchmark(scenario, stage, arguments.events, arguments.warmup)
+        for scenario in scenarios
+        for stage in stages
+    ]
+
+    print_results(results)
+
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            json.dump([asdict(result) for result in results], output_file, indent=2)
+
+    if arguments.baseline:
+        regressions = compare_to_baseline(results, arguments.baseline, arguments.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+
+    return 0
+# END main
+
+
+if __name__ == "__main__":
+    sys.exit(main())
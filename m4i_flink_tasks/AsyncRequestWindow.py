@@ -0,0 +1,135 @@
+import asyncio
+import concurrent.futures
+import threading
+from collections import deque
+from typing import Any, Awaitable, Deque, List, Optional, Tuple
+
+CompletedRequest = Tuple[Any, concurrent.futures.Future]
+
+
+async def cancel_tasks():
+    """This function cancels all other tasks on the running event loop and waits for them to finish."""
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class AsyncRequestWindow(object):
+    """
+    This class runs coroutines on an event loop that lives for the lifetime of a task, with at most max_in_flight coroutines running at the same time.
+    Every coroutine is submitted together with the element it belongs to. Completed requests are handed back in the order the
+    elements were submitted when ordered is set, and as soon as they complete otherwise, similar to the async I/O operator of Flink.
+    """
+
+    def __init__(self, max_in_flight: int = 10, ordered: bool = True):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight should be at least 1")
+
+        self.max_in_flight = max_in_flight
+        self.ordered = ordered
+
+        self._pending: Deque[CompletedRequest] = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """This function returns the event loop of the window and starts it in a background thread on first use."""
+        if self._loop is None:
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(started.set)
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name="async-request-window", daemon=True)
+            self._thread.start()
+            started.wait()
+            self._loop = loop
+
+        return self._loop
+
+    def run(self, coroutine: Awaitable, timeout: Optional[float] = None):
+        """This function runs the given coroutine on the event loop of the window and waits for its result."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def submit(self, element: Any, coroutine: Awaitable) -> List[CompletedRequest]:
+        """
+        This function starts the given coroutine and returns the requests that completed in the meantime.
+        In case max_in_flight requests are running already, it blocks until a slot is available.
+        """
+        completed = []
+
+        while len(self._pending) >= self.max_in_flight:
+            completed.extend(self.wait())
+
+        self._pending.append((element, asyncio.run_coroutine_threadsafe(coroutine, self.loop)))
+
+        completed.extend(self.poll())
+        return completed
+
+    def poll(self) -> List[CompletedRequest]:
+        """This function returns the completed requests without blocking."""
+        if self.ordered:
+            completed = []
+            while len(self._pending) > 0 and self._pending[0][1].done():
+                completed.append(self._pending.popleft())
+            return completed
+
+        completed = [request for request in self._pending if request[1].done()]
+        for request in completed:
+            self._pending.remove(request)
+        return completed
+
+    def wait(self, timeout: Optional[float] = None) -> List[CompletedRequest]:
+        """This function blocks until at least one request can be handed back, or until the timeout expires, and returns the completed requests."""
+        if len(self._pending) == 0:
+            return []
+
+        if self.ordered:
+            concurrent.futures.wait([self._pending[0][1]], timeout=timeout)
+        else:
+            concurrent.futures.wait([future for _, future in self._pending], timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+
+        return self.poll()
+
+    def drain(self, timeout: Optional[float] = None) -> List[CompletedRequest]:
+        """This function blocks until all running requests are completed, or until the timeout expires, and returns the completed requests."""
+        concurrent.futures.wait([future for _, future in self._pending], timeout=timeout)
+        return self.poll()
+
+    def close(self, timeout: Optional[float] = None) -> List[CompletedRequest]:
+        """
+        This function cancels the running requests and stops the event loop.
+        The requests that were still pending are returned, so the caller can hand their elements on instead of losing them.
+        """
+        cancelled = list(self._pending)
+        for _, future in cancelled:
+            future.cancel()
+        self._pending.clear()
+
+        if self._loop is None:
+            return cancelled
+
+        # The cancelled coroutines are given the chance to unwind before the event loop stops.
+        try:
+            asyncio.run_coroutine_threadsafe(cancel_tasks(), self._loop).result(timeout)
+        except concurrent.futures.TimeoutError:
+            pass
+
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        if not self._loop.is_running():
+            self._loop.close()
+
+        self._loop = None
+        self._thread = None
+
+        return cancelled
+# END AsyncRequestWindow
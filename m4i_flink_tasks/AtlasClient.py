@@ -0,0 +1,80 @@
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from m4i_atlas_core import ConfigStore, Entity
+
+store = ConfigStore.get_instance()
+
+
+class AtlasClient(object):
+    """
+    This class retrieves entities from the Atlas rest api over one HTTP session, so connections to Atlas are kept alive and reused between requests.
+    The session is bound to the event loop it is first used on and should be closed on that loop.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, connection_limit: int = 10, timeout: float = 30):
+        self.base_url = base_url
+        self.connection_limit = connection_limit
+        self.timeout = timeout
+
+        self._session: Optional[ClientSession] = None
+
+    def get_base_url(self) -> str:
+        base_url = self.base_url or store.get("atlas.server.url")
+        if "://" not in base_url:
+            base_url = f"http://{base_url}"
+        return base_url.rstrip("/")
+
+    def get_session(self) -> ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=TCPConnector(limit=self.connection_limit),
+                timeout=ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def get(self, path: str, access_token: str, params: Optional[Union[dict, List[Tuple[str, str]]]] = None) -> Optional[dict]:
+        """This function sends a GET request to the given Atlas api path and returns the json response, or None in case Atlas responded with 404."""
+        headers = {"Accept": "application/json", "Authorization": f"Bearer {access_token}"}
+
+        async with self.get_session().get(f"{self.get_base_url()}{path}", params=params, headers=headers) as response:
+            if response.status == 404:
+                return None
+            response.raise_for_status()
+            return await response.json()
+
+    async def get_entity_by_guid(self, guid: str, access_token: str, ignore_relationships: bool = False) -> Optional[Entity]:
+        """This function retrieves the entity with the given guid from Atlas, or None in case it does not exist."""
+        params = {"ignoreRelationships": str(ignore_relationships).lower(), "minExtInfo": "true"}
+
+        response = await self.get(f"/v2/entity/guid/{guid}", access_token=access_token, params=params)
+
+        if not response or not response.get("entity"):
+            return None
+
+        return Entity.from_dict(response["entity"])
+
+    async def get_entities_by_guid(self, guids: Iterable[str], access_token: str, ignore_relationships: bool = False) -> Dict[str, Entity]:
+        """
+        This function retrieves the entities with the given guids from Atlas in a single request to the bulk entity api.
+        The entities are returned by guid; guids that do not exist in Atlas are left out.
+        """
+        guids = list(dict.fromkeys(guids))
+
+        if len(guids) == 0:
+            return dict()
+
+        params = [("guid", guid) for guid in guids]
+        params += [("ignoreRelationships", str(ignore_relationships).lower()), ("minExtInfo", "true")]
+
+        response = await self.get("/v2/entity/bulk", access_token=access_token, params=params)
+
+        entities = (response or {}).get("entities") or []
+
+        return {entity["guid"]: Entity.from_dict(entity) for entity in entities}
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+# END AtlasClient
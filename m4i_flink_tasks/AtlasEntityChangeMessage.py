@@ -5,6 +5,10 @@ from dataclasses import dataclass, field
 from typing import List
 from m4i_atlas_core import EntityAuditAction, Entity
 
+# A full payload carries the complete previous and current entity as old_value and new_value.
+# A delta payload carries only the changed attributes, the identifying attributes and the governance role relationships of both versions.
+FULL_PAYLOAD = "full"
+DELTA_PAYLOAD = "delta"
 
 
 @dataclass_json(letter_case=LetterCase.CAMEL)
@@ -29,6 +33,8 @@ class EntityMessage(DataClassJsonMixin):
     old_value: Entity = field(default_factory=dict)
     new_value: Entity = field(default_factory=dict) 
 
+    payload: str = FULL_PAYLOAD
+
     
 @dataclass_json(letter_case=LetterCase.CAMEL)
 @dataclass
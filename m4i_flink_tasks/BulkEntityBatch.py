@@ -0,0 +1,67 @@
+import sys
+import traceback
+from typing import Any, List, Tuple
+
+from m4i_atlas_core import Entity
+
+from .AsyncRequestWindow import AsyncRequestWindow
+from .AtlasClient import AtlasClient
+from .KeycloakTokenProvider import call_with_access_token
+
+
+class BulkEntityBatch(object):
+    """
+    This class collects elements together with the guid of their entity, up to max_size, and retrieves the entities of all
+    collected elements from Atlas in a single request to the bulk entity api when the batch is flushed.
+    """
+
+    def __init__(self, atlas: AtlasClient, window: AsyncRequestWindow, max_size: int = 50):
+        self.atlas = atlas
+        self.window = window
+        self.max_size = max_size
+
+        self._elements: List[Tuple[Any, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._elements)
+
+    def add(self, element: Any, entity_guid: str) -> bool:
+        """This function adds the given element to the batch and returns whether the batch is full."""
+        self._elements.append((element, entity_guid))
+        return len(self._elements) >= self.max_size
+
+    def drain(self) -> List[Any]:
+        """This function empties the batch without retrieving the entities and returns the elements it held."""
+        elements, self._elements = self._elements, []
+        return [element for element, _ in elements]
+
+    def flush(self) -> Tuple[List[Tuple[Any, Entity]], List[Tuple[Any, str]]]:
+        """
+        This function retrieves the entities of the collected elements and empties the batch.
+        It returns the elements together with their entity, and the elements that could not be enriched together with a description of the failure.
+        """
+        elements, self._elements = self._elements, []
+
+        if len(elements) == 0:
+            return [], []
+
+        guids = [entity_guid for _, entity_guid in elements]
+
+        try:
+            entities = self.window.run(call_with_access_token(self.atlas.get_entities_by_guid, guids=guids, ignore_relationships=False))
+        except Exception:
+            description = ''.join(traceback.format_exception(*sys.exc_info()))
+            return [], [(element, description) for element, _ in elements]
+
+        retrieved, failed = [], []
+
+        for element, entity_guid in elements:
+            event_entity = entities.get(entity_guid)
+
+            if event_entity:
+                retrieved.append((element, event_entity))
+            else:
+                failed.append((element, f"No entity could be retreived from Atlas with guid {entity_guid}"))
+
+        return retrieved, failed
+# END BulkEntityBatch
@@ -0,0 +1,123 @@
+import logging
+import time
+from typing import Optional
+
+from kafka import KafkaProducer
+from kafka.errors import KafkaError
+from m4i_atlas_core import ConfigStore
+
+from .DeadLetterBoxMessage import DeadLetterBoxMesage
+from .config_values import parse_int
+
+logger = logging.getLogger(__name__)
+
+store = ConfigStore.get_instance()
+
+
+class DeadLetterBoxProducer(object):
+    """
+    This class forwards notifications that could not be handled to the dead letter box topic.
+    One producer is created per task in open() and reused for every failed message. Messages are batched for linger_ms,
+    the producer buffer is bounded by buffer_memory, and pending messages are flushed when the task closes.
+    Dead letters that cannot be buffered within max.block.ms, if configured, or cannot be delivered are counted as dropped.
+    """
+
+    def __init__(self, job: str):
+        self.job = job
+        self.producer: Optional[KafkaProducer] = None
+        self.topic: Optional[str] = None
+
+        self.sent = 0
+        self.dropped = 0
+
+        self._sent_counter = None
+        self._dropped_counter = None
+
+    def open(self, runtime_context=None):
+        """This function creates the Kafka producer and registers the dead letter counters with the Flink metric group, if given."""
+        (
+            bootstrap_server_hostname,
+            bootstrap_server_port,
+            topic,
+            linger_ms,
+            buffer_memory,
+            max_block_ms
+        ) = store.get_many(
+            "kafka.bootstrap.server.hostname",
+            "kafka.bootstrap.server.port",
+            "exception.events.topic.name",
+            "exception.events.linger.ms",
+            "exception.events.buffer.memory",
+            "exception.events.max.block.ms"
+        )
+
+        producer_config = dict(
+            bootstrap_servers=f"{bootstrap_server_hostname}:{bootstrap_server_port}",
+            value_serializer=str.encode,
+            request_timeout_ms=1000,
+            api_version=(2, 0, 2),
+            retries=1,
+            linger_ms=parse_int(linger_ms, default=1000),
+            buffer_memory=parse_int(buffer_memory, default=8 * 1024 * 1024)
+        )
+
+        # The first send waits for the topic metadata, which easily takes longer than a short max.block.ms after startup or a failover.
+        # The default of kafka-python is therefore kept unless a limit is configured.
+        max_block_ms = parse_int(max_block_ms, default=None)
+        if max_block_ms is not None:
+            producer_config["max_block_ms"] = max_block_ms
+
+        self.topic = topic
+        self.producer = KafkaProducer(**producer_config)
+
+        if runtime_context is not None:
+            metric_group = runtime_context.get_metrics_group()
+            self._sent_counter = metric_group.counter("deadLettersSent")
+            self._dropped_counter = metric_group.counter("deadLettersDropped")
+
+    def _on_sent(self, _):
+        self.sent += 1
+        if self._sent_counter is not None:
+            self._sent_counter.inc()
+
+    def _on_dropped(self, exception):
+        self.dropped += 1
+        if self._dropped_counter is not None:
+            self._dropped_counter.inc()
+        logger.warning(f"Dead letter could not be delivered to {self.topic}: {exception}")
+
+    def send(self, original_notification: str, description: str):
+        """This function sends the given notification together with a description of the failure to the dead letter box."""
+        event = DeadLetterBoxMesage(timestamp=time.time(), original_notification=original_notification, job=self.job, description=description)
+        logger.warning("this goes into dead letter box: ")
+        logger.warning(repr(event))
+
+        if self.producer is None:
+            self._on_dropped("dead letter box producer is not open")
+            return
+
+        try:
+            future = self.producer.send(topic=self.topic, value=event.to_json())
+        except KafkaError as e:
+            self._on_dropped(e)
+            return
+
+        future.add_callback(self._on_sent)
+        future.add_errback(self._on_dropped)
+
+    def flush(self, timeout: Optional[float] = None):
+        """This function blocks until all buffered dead letters are delivered."""
+        if self.producer is not None:
+            self.producer.flush(timeout=timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        """This function flushes the buffered dead letters and closes the Kafka producer."""
+        if self.producer is None:
+            return
+
+        try:
+            self.producer.flush(timeout=timeout)
+        finally:
+            self.producer.close(timeout=timeout)
+            self.producer = None
+# END DeadLetterBoxProducer
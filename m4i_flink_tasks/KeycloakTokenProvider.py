@@ -0,0 +1,165 @@
+import asyncio
+import base64
+import json
+import logging
+import threading
+import time
+from typing import Awaitable, Callable, Optional
+
+from aiohttp.client_exceptions import ClientResponseError
+from m4i_atlas_core import get_keycloak_token
+
+logger = logging.getLogger(__name__)
+
+# Lifetime assumed for tokens of which the expiry time cannot be read.
+DEFAULT_TOKEN_LIFETIME = 60
+
+# A new token is not fetched again within this many seconds, even if it seems expired already, e.g. because of clock skew.
+MIN_REFRESH_INTERVAL = 1.0
+
+
+def get_token_expiry(access_token: str) -> Optional[float]:
+    """This function returns the expiry time (exp claim) of the given JWT access token, or None in case it cannot be read."""
+    try:
+        payload = access_token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class KeycloakTokenProvider(object):
+    """
+    This class caches the Keycloak access token and refreshes it shortly before it expires.
+    A background thread renews the token refresh_margin seconds before its exp claim, so callers rarely wait for Keycloak.
+    The provider is safe to use from several threads and from async code.
+    """
+
+    def __init__(self, fetch_token: Callable[[], str] = get_keycloak_token, refresh_margin: float = 30):
+        self.fetch_token = fetch_token
+        self.refresh_margin = refresh_margin
+
+        self._access_token: Optional[str] = None
+        self._refresh_at: float = 0
+        self._lock = threading.Lock()
+        self._refreshed = threading.Condition(threading.Lock())
+        self._refresher: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def _get_fresh_token(self) -> Optional[str]:
+        """This function returns the cached access token in case it does not need to be renewed yet, None otherwise."""
+        # Both fields are read once, so a concurrent invalidate() cannot clear the token between the check and the return.
+        access_token, refresh_at = self._access_token, self._refresh_at
+        if access_token is not None and time.time() < refresh_at:
+            return access_token
+        return None
+
+    def _refresh(self) -> str:
+        access_token = self.fetch_token()
+
+        now = time.time()
+        lifetime = (get_token_expiry(access_token) or now + DEFAULT_TOKEN_LIFETIME) - now
+
+        self._access_token = access_token
+        # Short lived tokens are renewed halfway through their lifetime instead of refresh_margin seconds before expiry.
+        self._refresh_at = now + max(lifetime - self.refresh_margin, lifetime / 2, MIN_REFRESH_INTERVAL)
+
+        with self._refreshed:
+            self._refreshed.notify_all()
+
+        return access_token
+
+    def get_token(self) -> str:
+        """This function returns a valid access token, fetching a new one from Keycloak only when the cached token is about to expire."""
+        access_token = self._get_fresh_token()
+        if access_token is not None:
+            return access_token
+
+        with self._lock:
+            access_token = self._get_fresh_token()
+            if access_token is None:
+                access_token = self._refresh()
+            self._start()
+            return access_token
+
+    async def get_token_async(self) -> str:
+        """This function returns a valid access token without blocking the event loop while a new token is fetched."""
+        access_token = self._get_fresh_token()
+        if access_token is not None:
+            return access_token
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.get_token)
+
+    def invalidate(self, access_token: Optional[str] = None):
+        """
+        This function discards the cached access token, for example after Atlas responded with 401.
+        In case a token is given, the cache is only cleared when it still holds that token, so concurrent callers renew it only once.
+        """
+        with self._lock:
+            if access_token is None or access_token == self._access_token:
+                self._access_token = None
+                self._refresh_at = 0
+
+    def _start(self):
+        """This function starts the background thread that renews the token before it expires."""
+        if self._refresher is not None:
+            return
+
+        def run():
+            backoff = MIN_REFRESH_INTERVAL
+            # Failed refreshes are retried at least twice within the refresh margin, so the token is renewed before it expires.
+            max_backoff = max(min(self.refresh_margin, DEFAULT_TOKEN_LIFETIME) / 2, MIN_REFRESH_INTERVAL)
+
+            while not self._stopped.is_set():
+                wait = self._refresh_at - time.time()
+
+                if wait > 0:
+                    with self._refreshed:
+                        self._refreshed.wait(wait)
+                    continue
+
+                try:
+                    with self._lock:
+                        if self._get_fresh_token() is None:
+                            self._refresh()
+                    backoff = MIN_REFRESH_INTERVAL
+                except Exception as e:
+                    logger.warning(f"Background refresh of the keycloak token failed, retrying in {backoff} seconds: {e}")
+                    self._stopped.wait(backoff)
+                    backoff = min(backoff * 2, max_backoff)
+
+        self._refresher = threading.Thread(target=run, name="keycloak-token-refresh", daemon=True)
+        self._refresher.start()
+
+    def stop(self):
+        """This function stops the background refresh thread."""
+        self._stopped.set()
+        with self._refreshed:
+            self._refreshed.notify_all()
+# END KeycloakTokenProvider
+
+
+keycloak_token_provider = KeycloakTokenProvider()
+
+
+def get_access_token() -> str:
+    """This function returns the access token shared by all jobs running in this process."""
+    return keycloak_token_provider.get_token()
+
+
+async def call_with_access_token(func: Callable[..., Awaitable], *args, **kwargs):
+    """
+    This function calls the given Atlas api function with the shared access token.
+    In case Atlas rejects the token with 401, the token is renewed and the call is retried once.
+    """
+    access_token = await keycloak_token_provider.get_token_async()
+    try:
+        return await func(*args, access_token=access_token, **kwargs)
+    except ClientResponseError as e:
+        if e.status != 401:
+            raise
+        keycloak_token_provider.invalidate(access_token)
+
+    access_token = await keycloak_token_provider.get_token_async()
+    return await func(*args, access_token=access_token, **kwargs)
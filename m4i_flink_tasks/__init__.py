@@ -1,4 +1,11 @@
 from .synchronize_app_search import *
+from .determine_change import *
+from .AsyncRequestWindow import *
+from .AtlasClient import *
+from .BulkEntityBatch import *
 from .AtlasEntityChangeMessage import *
 from .DeadLetterBoxMessage import *
+from .DeadLetterBoxProducer import *
+from .KeycloakTokenProvider import *
+from .notification_coalescing import *
 #from .set_environment import *
@@ -0,0 +1,105 @@
+import base64
+import json
+import zlib
+from datetime import datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Union
+from uuid import UUID
+
+from dataclasses_json import DataClassJsonMixin
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+JSON_ENCODING = "json"
+COMPACT_ENCODING = "compact"
+
+# Messages in the compact encoding start with a header holding the content type and the version of the encoding, e.g. m4i/msgpack+zlib;v=1:
+# A json document never starts with this header, so consumers detect the encoding of every message by its first characters.
+COMPACT_CONTENT_TYPE = "m4i/msgpack+zlib"
+COMPACT_VERSION = 1
+COMPACT_HEADER_PREFIX = "m4i/"
+COMPACT_HEADER = f"{COMPACT_CONTENT_TYPE};v={COMPACT_VERSION}"
+
+
+def encode_default(value: Any) -> Any:
+    """
+    This function converts the values the json encoder does not support itself, the same way dataclasses_json does in to_json.
+    Dataclasses are converted with to_dict, so messages and entities can be serialized without an intermediate json string.
+    """
+    if isinstance(value, DataClassJsonMixin):
+        return value.to_dict(encode_json=False)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, (UUID, Decimal)):
+        return str(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def json_loads(data: Union[str, bytes]) -> Any:
+        return orjson.loads(data)
+
+    def json_dumps(value: Any) -> str:
+        return orjson.dumps(value, default=encode_default, option=ORJSON_OPTIONS).decode("utf-8")
+else:
+    def json_loads(data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+    def json_dumps(value: Any) -> str:
+        return json.dumps(value, default=encode_default)
+
+
+def compact_loads(data: str) -> Any:
+    """This function decodes a message in the compact encoding, i.e. a header followed by base64 encoded, zlib compressed msgpack."""
+    header, _, payload = data.partition(":")
+
+    if header != COMPACT_HEADER:
+        raise ValueError(f"Unsupported message encoding {header}, expected {COMPACT_HEADER}")
+
+    if msgpack is None:
+        raise ImportError("The msgpack package is required to decode messages with content type " + COMPACT_CONTENT_TYPE)
+
+    return msgpack.unpackb(zlib.decompress(base64.b64decode(payload)), raw=False, strict_map_key=False)
+
+
+def compact_dumps(value: Any, compression_level: int = 6) -> str:
+    """
+    This function encodes the given value with msgpack and zlib. The result is a string, so it can be carried by SimpleStringSchema,
+    and starts with a header that holds the content type and the version of the encoding.
+    """
+    if msgpack is None:
+        raise ImportError("The msgpack package is required for the compact message encoding, install m4i_flink_tasks[compact]")
+
+    payload = zlib.compress(msgpack.packb(value, default=encode_default, use_bin_type=True), compression_level)
+    return f"{COMPACT_HEADER}:{base64.b64encode(payload).decode('ascii')}"
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """This function parses the given message, which is either a json document or a message in the compact encoding."""
+    if isinstance(data, str) and data.startswith(COMPACT_HEADER_PREFIX):
+        return compact_loads(data)
+    return json_loads(data)
+
+
+def dumps(value: Any, encoding: str = JSON_ENCODING) -> str:
+    """This function serializes the given value, which may contain dataclasses, with the given encoding: json (default) or compact."""
+    if encoding == COMPACT_ENCODING:
+        return compact_dumps(value)
+    if encoding in (JSON_ENCODING, None, ""):
+        return json_dumps(value)
+    raise ValueError(f"Unknown message encoding {encoding}, expected {JSON_ENCODING} or {COMPACT_ENCODING}")
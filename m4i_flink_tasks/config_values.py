@@ -0,0 +1,31 @@
+from typing import Any, Optional
+
+TRUE_VALUES = {"true", "yes", "on", "1"}
+FALSE_VALUES = {"false", "no", "off", "0", ""}
+
+
+def parse_bool(value: Any, default: bool = False) -> bool:
+    """
+    This function interprets the given config value as a bool. Strings such as "true" and "false" are parsed, so values
+    read from the environment or a properties file behave the same as python booleans. None returns the default.
+    """
+    if value is None:
+        return default
+
+    if isinstance(value, str):
+        normalized = value.strip().lower()
+        if normalized in TRUE_VALUES:
+            return True
+        if normalized in FALSE_VALUES:
+            return False
+        raise ValueError(f"{value!r} is not a valid boolean config value")
+
+    return bool(value)
+
+
+def parse_int(value: Any, default: Optional[int]) -> Optional[int]:
+    """This function interprets the given config value as an int. None and empty strings return the default, while 0 is kept."""
+    if value is None or (isinstance(value, str) and value.strip() == ""):
+        return default
+
+    return int(value)
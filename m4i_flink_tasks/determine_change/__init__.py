@@ -0,0 +1,3 @@
+from .entity_diff import *
+from .entity_messages import *
+from .entity_state import *
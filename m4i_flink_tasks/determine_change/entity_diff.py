@@ -0,0 +1,137 @@
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+# Marks an attribute that is absent in one of the compared entity versions.
+MISSING = object()
+
+
+@dataclass
+class EntityDiff:
+    """This data class describes the differences between two versions of an Atlas entity."""
+
+    inserted_attributes: List[str] = field(default_factory=list)
+    changed_attributes: List[str] = field(default_factory=list)
+    deleted_attributes: List[str] = field(default_factory=list)
+
+    inserted_relationships: Dict[str, list] = field(default_factory=dict)
+    deleted_relationships: Dict[str, list] = field(default_factory=dict)
+
+    def has_attribute_changes(self) -> bool:
+        return len(self.inserted_attributes) + len(self.changed_attributes) + len(self.deleted_attributes) > 0
+
+    def has_relationship_changes(self) -> bool:
+        return len(self.inserted_relationships) + len(self.deleted_relationships) > 0
+
+
+def flatten_attributes(attributes: Optional[dict], prefix: str = "", result: Optional[dict] = None) -> dict:
+    """
+    This function flattens nested dictionaries into a single level dictionary with dot separated keys, e.g. parent.guid.
+    Lists are kept as values and empty nested dictionaries are dropped.
+    """
+    if result is None:
+        result = dict()
+
+    for key, value in (attributes or {}).items():
+        if isinstance(value, dict):
+            flatten_attributes(value, f"{prefix}{key}.", result)
+        else:
+            result[f"{prefix}{key}"] = value
+
+    return result
+
+
+def is_empty(value: Any) -> bool:
+    return value is None or value is MISSING or value == []
+
+
+def diff_attributes(current_attributes: Optional[dict], previous_attributes: Optional[dict]) -> Tuple[List[str], List[str], List[str]]:
+    """
+    This function compares the attributes of two entity versions in a single walk and returns the inserted, changed and deleted attribute names.
+    List valued attributes are ignored, since these hold relationships. A list is only considered changed when it gained elements.
+    Every attribute that differs is reported as changed; attributes that became filled or empty are reported as inserted or deleted as well.
+    """
+    current = flatten_attributes({key: value for key, value in (current_attributes or {}).items() if not isinstance(value, list)})
+    previous = flatten_attributes({key: value for key, value in (previous_attributes or {}).items() if not isinstance(value, list)})
+
+    inserted, changed, deleted = [], [], []
+
+    for key in {**previous, **current}:
+        current_value = current.get(key, MISSING)
+        previous_value = previous.get(key, MISSING)
+
+        if current_value is not MISSING and previous_value is not MISSING and current_value == previous_value:
+            continue
+
+        if isinstance(current_value, list) and isinstance(previous_value, list) and all(element in previous_value for element in current_value):
+            continue
+
+        changed.append(key)
+
+        if is_empty(previous_value):
+            inserted.append(key)
+
+        if is_empty(current_value):
+            deleted.append(key)
+
+    return inserted, changed, deleted
+
+
+def get_relationship_key(relationship: Any) -> Hashable:
+    """This function returns the identity of a relationship end point, i.e. its relationship guid and status."""
+    if isinstance(relationship, dict):
+        relationship_guid = relationship.get("relationshipGuid") or relationship.get("guid")
+        if relationship_guid is not None:
+            return (relationship_guid, relationship.get("relationshipStatus"))
+    return json.dumps(relationship, sort_keys=True, default=str)
+
+
+def diff_relationships(current_relationships: Optional[dict], previous_relationships: Optional[dict]) -> Tuple[Dict[str, list], Dict[str, list]]:
+    """
+    This function compares the relationship attributes of two entity versions and returns the inserted and deleted relationship end points per attribute.
+    End points are compared as sets keyed on relationship guid. Only attributes holding a list in both versions are compared.
+    """
+    current = flatten_attributes(current_relationships)
+    previous = flatten_attributes(previous_relationships)
+
+    inserted, deleted = dict(), dict()
+
+    for key, current_value in current.items():
+        previous_value = previous.get(key)
+
+        if not isinstance(current_value, list) or not isinstance(previous_value, list):
+            continue
+
+        current_keys = {get_relationship_key(relationship) for relationship in current_value}
+        previous_keys = {get_relationship_key(relationship) for relationship in previous_value}
+
+        if current_keys == previous_keys:
+            continue
+
+        inserted_relationships = [relationship for relationship in current_value if get_relationship_key(relationship) not in previous_keys]
+        deleted_relationships = [relationship for relationship in previous_value if get_relationship_key(relationship) not in current_keys]
+
+        if len(inserted_relationships) > 0:
+            inserted[key] = inserted_relationships
+
+        if len(deleted_relationships) > 0:
+            deleted[key] = deleted_relationships
+
+    return inserted, deleted
+
+
+def diff_entities(current_entity: dict, previous_entity: dict) -> EntityDiff:
+    """This function returns the attribute and relationship differences between the current and the previous version of an Atlas entity."""
+    inserted_attributes, changed_attributes, deleted_attributes = diff_attributes(
+        current_entity.get("attributes"), previous_entity.get("attributes"))
+
+    inserted_relationships, deleted_relationships = diff_relationships(
+        current_entity.get("relationshipAttributes"), previous_entity.get("relationshipAttributes"))
+
+    return EntityDiff(
+        inserted_attributes=inserted_attributes,
+        changed_attributes=changed_attributes,
+        deleted_attributes=deleted_attributes,
+        inserted_relationships=inserted_relationships,
+        deleted_relationships=deleted_relationships
+    )
@@ -0,0 +1,110 @@
+from typing import Iterable, List, Optional
+
+from m4i_atlas_core import Entity, EntityAuditAction
+
+from ..AtlasEntityChangeMessage import DELTA_PAYLOAD, FULL_PAYLOAD, EntityMessage
+from ..codec import JSON_ENCODING, dumps
+from .entity_diff import EntityDiff
+
+
+def serialize_entity_message(entity_message: EntityMessage, encoding: str = JSON_ENCODING) -> str:
+    """This function serializes the given entity message to the string that is published to kafka, in json or in the compact encoding."""
+    return dumps(entity_message, encoding)
+
+
+# Attributes that identify an entity and are kept in delta payloads, since consumers use them to build and name documents.
+IDENTITY_ATTRIBUTES = ["qualifiedName", "name", "definition", "email"]
+
+# Relationships from which the governance roles of an entity are derived together. A delta payload keeps all of them when one changed.
+GOVERNANCE_ROLE_RELATIONSHIPS = ["domainLead", "businessOwner", "dataSteward"]
+
+
+def trim_entity(entity_json: dict, attribute_names: Iterable[str], relationship_names: Iterable[str]) -> dict:
+    """
+    This function returns a copy of the given entity that holds only the given attributes and relationships, next to the identifying attributes.
+    Attribute names may be flattened names such as parent.guid, in which case the complete top level attribute is kept.
+    """
+    attribute_names = {attribute_name.split(".")[0] for attribute_name in attribute_names}.union(IDENTITY_ATTRIBUTES)
+    relationship_names = set(relationship_names)
+
+    attributes = entity_json.get("attributes") or {}
+    relationship_attributes = entity_json.get("relationshipAttributes") or {}
+
+    return {
+        **entity_json,
+        "attributes": {key: value for key, value in attributes.items() if key in attribute_names},
+        "relationshipAttributes": {key: value for key, value in relationship_attributes.items() if key in relationship_names}
+    }
+
+
+def get_delta_relationship_names(changed_relationship_names: Iterable[str]) -> List[str]:
+    """This function returns the relationships a delta payload keeps in full: all governance roles in case one of them changed."""
+    if any(relationship_name in GOVERNANCE_ROLE_RELATIONSHIPS for relationship_name in changed_relationship_names):
+        return GOVERNANCE_ROLE_RELATIONSHIPS
+    return []
+
+
+def get_update_messages(atlas_entity_parsed: Entity, previous_entity_parsed: Entity, entity_diff: EntityDiff, original_event_type: EntityAuditAction, direct_change: bool,
+                        encoding: str = JSON_ENCODING, payload: str = FULL_PAYLOAD, atlas_entity_json: Optional[dict] = None, previous_atlas_entity_json: Optional[dict] = None) -> List[str]:
+    """
+    This function creates the serialized messages for an entity update: an EntityAttributeAudit in case attributes changed
+    and an EntityRelationshipAudit in case relationships changed. An empty list is returned when nothing changed.
+    With a delta payload, old_value and new_value are trimmed versions of the given entity dictionaries instead of the full entities.
+    """
+    result = []
+
+    if payload == DELTA_PAYLOAD and (atlas_entity_json is None or previous_atlas_entity_json is None):
+        raise ValueError("A delta payload requires the current and the previous entity as dictionaries")
+
+    def get_values(attribute_names: Iterable[str], relationship_names: Iterable[str]):
+        if payload != DELTA_PAYLOAD:
+            return previous_entity_parsed, atlas_entity_parsed
+
+        relationship_names = get_delta_relationship_names(relationship_names)
+        return (
+            trim_entity(previous_atlas_entity_json, attribute_names, relationship_names),
+            trim_entity(atlas_entity_json, attribute_names, relationship_names)
+        )
+
+    def create_message(event_type: str, attribute_names: Iterable[str] = (), relationship_names: Iterable[str] = (), **changes) -> str:
+        old_value, new_value = get_values(attribute_names, relationship_names)
+        entity_message = EntityMessage(
+            type_name=atlas_entity_parsed.type_name,
+            qualified_name=atlas_entity_parsed.attributes.unmapped_attributes["qualifiedName"],
+            guid=atlas_entity_parsed.guid,
+            old_value=old_value,
+            new_value=new_value,
+            payload=payload or FULL_PAYLOAD,
+            original_event_type=original_event_type,
+            direct_change=direct_change,
+            event_type=event_type,
+            **{
+                "inserted_attributes": [],
+                "changed_attributes": [],
+                "deleted_attributes": [],
+                "inserted_relationships": {},
+                "changed_relationships": {},
+                "deleted_relationships": {},
+                **changes
+            }
+        )
+        return serialize_entity_message(entity_message, encoding)
+
+    if entity_diff.has_attribute_changes():
+        result.append(create_message(
+            "EntityAttributeAudit",
+            attribute_names=[*entity_diff.inserted_attributes, *entity_diff.changed_attributes, *entity_diff.deleted_attributes],
+            inserted_attributes=entity_diff.inserted_attributes,
+            changed_attributes=entity_diff.changed_attributes,
+            deleted_attributes=entity_diff.deleted_attributes
+        ))
+
+    if entity_diff.has_relationship_changes():
+        result.append(create_message(
+            "EntityRelationshipAudit",
+            relationship_names=[*entity_diff.inserted_relationships, *entity_diff.deleted_relationships],
+            inserted_relationships=entity_diff.inserted_relationships,
+            deleted_relationships=entity_diff.deleted_relationships
+        ))
+
+    return result
@@ -0,0 +1,46 @@
+from typing import Optional
+
+from ..codec import loads
+
+
+def precedes(update_time: Optional[int], other_update_time: Optional[int]) -> bool:
+    """
+    This function determines whether an entity version with the given update time is older than a version with the other update time.
+    In case either update time is missing, the versions cannot be ordered by time and the version seen first is taken as the older one.
+    """
+    if update_time is None or other_update_time is None:
+        return True
+    return update_time < other_update_time
+
+
+def get_previous_entity(state, update_time: Optional[int]) -> Optional[dict]:
+    """
+    This function returns the entity version kept in the given keyed state in case it is older than the version with the given update time.
+    None is returned in case the state is empty or holds the same or a more recent version, so the caller falls back to the audit index.
+    """
+    previous_entity = state.value()
+
+    if previous_entity is None:
+        return None
+
+    previous_entity_json = loads(previous_entity)
+    if precedes(previous_entity_json.get("updateTime"), update_time):
+        return previous_entity_json
+
+    return None
+
+
+def update_entity_state(state, atlas_entity: str, update_time: Optional[int]) -> bool:
+    """
+    This function keeps the given entity version in the given keyed state, unless the state already holds a more recent version
+    because the events of the entity arrived out of order. It returns whether the state was updated.
+    """
+    previous_entity = state.value()
+
+    if previous_entity is not None and update_time is not None:
+        previous_update_time = loads(previous_entity).get("updateTime")
+        if previous_update_time is not None and previous_update_time > update_time:
+            return False
+
+    state.update(atlas_entity)
+    return True
@@ -0,0 +1,263 @@
+from copy import copy, deepcopy
+
+import pytest
+
+from .entity_diff import diff_attributes, diff_entities, diff_relationships, flatten_attributes
+
+pd = pytest.importorskip("pandas")
+
+
+# Reference implementation of the pandas based comparison that was used by the determine_change job before the
+# dictionary based diff. The equivalence tests below assert that both produce the same changes.
+
+def delete_list_values_from_dict(input_dict: dict):
+    dict_keys = copy(list(input_dict.keys()))
+    for key in dict_keys:
+        if type(input_dict[key]) == list:
+            del input_dict[key]
+    return input_dict
+
+def get_attributes_df(atlas_entity: dict, column: str):
+    atlas_entity = pd.DataFrame.from_dict(atlas_entity, orient = "index").transpose()
+    attributes = pd.json_normalize(atlas_entity[column].tolist())
+    return attributes
+
+def get_non_matching_fields(current_entity, previous_entity):
+    comparison = current_entity.iloc[0].eq(previous_entity.iloc[0])
+    changed_attributes = comparison[comparison==False].index.to_list()
+
+    for changed_attribute in copy(changed_attributes):
+        if type(current_entity[changed_attribute].iloc[0])==list and type(previous_entity[changed_attribute].iloc[0])==list:
+            
+            list_is_idential = True
+            for element in (current_entity[changed_attribute].iloc[0]):
+                if element not in ((previous_entity[changed_attribute].iloc[0])):
+                    list_is_idential = False
+            
+            if list_is_idential:
+                changed_attributes.remove(changed_attribute)
+
+    return set(changed_attributes)
+
+def get_added_relationships(current_entity, previous_entity):
+    comparison = current_entity.iloc[0].eq(previous_entity.iloc[0])
+    changed_attributes = comparison[comparison==False].index.to_list()
+    
+    result  = dict()
+    for changed_attribute in copy(changed_attributes):
+        element_list = []
+        if type(current_entity[changed_attribute].iloc[0])==list and type(previous_entity[changed_attribute].iloc[0])==list:
+            list_is_idential = True
+            for element in (current_entity[changed_attribute].iloc[0]):
+                if element not in (previous_entity[changed_attribute].iloc[0]):
+                    list_is_idential = False
+                    element_list.append(element)
+        
+            if list_is_idential:
+                changed_attributes.remove(changed_attribute)
+            else:
+                result[changed_attribute] = element_list
+
+    return (result)
+
+def get_deleted_relationships(current_entity, previous_entity):
+    comparison = current_entity.iloc[0].eq(previous_entity.iloc[0])
+    changed_attributes = comparison[comparison==False].index.to_list()
+    
+    result  = dict()
+    for changed_attribute in copy(changed_attributes):
+        element_list = []
+        if type(current_entity[changed_attribute].iloc[0])==list and type(previous_entity[changed_attribute].iloc[0])==list:
+            list_is_idential = True
+            for element in (previous_entity[changed_attribute].iloc[0]):
+                if element not in (current_entity[changed_attribute].iloc[0]):
+                    list_is_idential = False
+                    element_list.append(element)
+        
+            if list_is_idential:
+                changed_attributes.remove(changed_attribute)
+            else:
+                result[changed_attribute] = element_list
+
+    return  (result)
+
+def get_changed_fields(current_entity_df, previous_entity_df):
+    result = []
+    non_matching_fields = get_non_matching_fields(current_entity_df, previous_entity_df)
+    for field in non_matching_fields:
+        if (previous_entity_df[field].iloc[0] != [] or previous_entity_df[field].iloc[0] != None) and (current_entity_df[field].iloc[0] != [] or current_entity_df[field].iloc[0]  != None):
+            result.append(field)
+    return list(set(result))
+
+def get_added_fields(current_entity_df, previous_entity_df):
+    result = []
+    non_matching_fields = get_non_matching_fields(current_entity_df, previous_entity_df)
+    for field in non_matching_fields:
+        if (previous_entity_df[field].iloc[0]  == [] or previous_entity_df[field].iloc[0]  == None) and (current_entity_df[field].iloc[0]  != [] or current_entity_df[field].iloc[0]  != None):
+            result.append(field)
+    return list(set(result))
+
+def get_deleted_fields(current_entity_df, previous_entity_df):
+    result = []
+    non_matching_fields = get_non_matching_fields(current_entity_df, previous_entity_df)
+    for field in non_matching_fields:
+        if (previous_entity_df[field].iloc[0]  != [] or previous_entity_df[field].iloc[0]  != None) and (current_entity_df[field].iloc[0]  == [] or current_entity_df[field].iloc[0]  == None):
+            result.append(field)
+    return list(set(result))
+
+def legacy_diff(atlas_entity_json: dict, previous_atlas_entity_json: dict):
+    atlas_entity_json = deepcopy(atlas_entity_json)
+    previous_atlas_entity_json = deepcopy(previous_atlas_entity_json)
+
+    previous_atlas_entity_json["attributes"] = delete_list_values_from_dict(previous_atlas_entity_json["attributes"])
+    atlas_entity_json["attributes"] = delete_list_values_from_dict(atlas_entity_json["attributes"])
+
+    previous_entity_attributes = get_attributes_df(previous_atlas_entity_json, "attributes")
+    current_entity_attributes = get_attributes_df(atlas_entity_json, "attributes")
+
+    previous_entity_relationships = get_attributes_df(previous_atlas_entity_json, "relationshipAttributes")
+    current_entity_relationships = get_attributes_df(atlas_entity_json, "relationshipAttributes")
+
+    return (
+        get_added_fields(current_entity_attributes, previous_entity_attributes),
+        get_changed_fields(current_entity_attributes, previous_entity_attributes),
+        get_deleted_fields(current_entity_attributes, previous_entity_attributes),
+        get_added_relationships(current_entity_relationships, previous_entity_relationships),
+        get_deleted_relationships(current_entity_relationships, previous_entity_relationships)
+    )
+# END legacy_diff
+
+
+def make_relationship(guid: str, relationship_guid: str, type_name: str = "m4i_data_entity"):
+    return {
+        "guid": guid,
+        "typeName": type_name,
+        "entityStatus": "ACTIVE",
+        "displayText": f"Entity {guid}",
+        "relationshipType": "m4i_data_entity_assignment",
+        "relationshipGuid": relationship_guid,
+        "relationshipStatus": "ACTIVE",
+        "relationshipAttributes": {"typeName": "m4i_data_entity_assignment"}
+    }
+# END make_relationship
+
+
+def make_entity(name="Finance", definition="Finance data", domain_lead=None, data_entities=None, parent=None, update_time=1):
+    data_entities = data_entities if data_entities is not None else [make_relationship("e1", "r1")]
+    return {
+        "typeName": "m4i_data_domain",
+        "guid": "ad49630e-7885-4560-aad3-8fbe743eb0ec",
+        "updateTime": update_time,
+        "attributes": {
+            "qualifiedName": "finance",
+            "name": name,
+            "definition": definition,
+            "replicatedTo": None,
+            "parent": parent,
+            "dataEntity": [{"guid": relationship["guid"], "typeName": "m4i_data_entity"} for relationship in data_entities],
+        },
+        "relationshipAttributes": {
+            "domainLead": domain_lead if domain_lead is not None else [],
+            "dataEntity": data_entities,
+            "source": [],
+            "meanings": []
+        }
+    }
+# END make_entity
+
+
+def assert_equivalent(current: dict, previous: dict):
+    inserted_attributes, changed_attributes, deleted_attributes, inserted_relationships, deleted_relationships = legacy_diff(current, previous)
+
+    entity_diff = diff_entities(current, previous)
+
+    assert set(entity_diff.inserted_attributes) == set(inserted_attributes)
+    assert set(entity_diff.changed_attributes) == set(changed_attributes)
+    assert set(entity_diff.deleted_attributes) == set(deleted_attributes)
+    assert entity_diff.inserted_relationships == inserted_relationships
+    assert entity_diff.deleted_relationships == deleted_relationships
+
+    return entity_diff
+# END assert_equivalent
+
+
+def test__no_changes():
+    entity_diff = assert_equivalent(make_entity(update_time=2), make_entity())
+
+    assert not entity_diff.has_attribute_changes()
+    assert not entity_diff.has_relationship_changes()
+# END test__no_changes
+
+
+def test__changed_attribute():
+    entity_diff = assert_equivalent(make_entity(name="Financial"), make_entity())
+
+    assert entity_diff.changed_attributes == ["name"]
+# END test__changed_attribute
+
+
+def test__inserted_attribute():
+    entity_diff = assert_equivalent(make_entity(definition="Finance data"), make_entity(definition=None))
+
+    assert entity_diff.inserted_attributes == ["definition"]
+# END test__inserted_attribute
+
+
+def test__deleted_attribute():
+    entity_diff = assert_equivalent(make_entity(definition=None), make_entity(definition="Finance data"))
+
+    assert entity_diff.deleted_attributes == ["definition"]
+# END test__deleted_attribute
+
+
+def test__changed_nested_attribute():
+    assert_equivalent(
+        make_entity(parent={"guid": "p2", "typeName": "m4i_data_domain"}),
+        make_entity(parent={"guid": "p1", "typeName": "m4i_data_domain"})
+    )
+# END test__changed_nested_attribute
+
+
+def test__inserted_and_deleted_relationships():
+    entity_diff = assert_equivalent(
+        make_entity(data_entities=[make_relationship("e1", "r1"), make_relationship("e3", "r3")], domain_lead=[make_relationship("p1", "r4", "m4i_person")]),
+        make_entity(data_entities=[make_relationship("e1", "r1"), make_relationship("e2", "r2")])
+    )
+
+    assert [relationship["guid"] for relationship in entity_diff.inserted_relationships["dataEntity"]] == ["e3"]
+    assert [relationship["guid"] for relationship in entity_diff.deleted_relationships["dataEntity"]] == ["e2"]
+    assert [relationship["guid"] for relationship in entity_diff.inserted_relationships["domainLead"]] == ["p1"]
+# END test__inserted_and_deleted_relationships
+
+
+def test__reordered_relationships_are_not_a_change():
+    assert_equivalent(
+        make_entity(data_entities=[make_relationship("e2", "r2"), make_relationship("e1", "r1")]),
+        make_entity(data_entities=[make_relationship("e1", "r1"), make_relationship("e2", "r2")])
+    )
+# END test__reordered_relationships_are_not_a_change
+
+
+def test__flatten_attributes():
+    assert flatten_attributes({"a": {"b": {"c": 1}}, "d": [], "e": {}, "f": None}) == {"a.b.c": 1, "d": [], "f": None}
+# END test__flatten_attributes
+
+
+def test__attribute_missing_in_previous_version_is_inserted():
+    inserted, changed, deleted = diff_attributes({"name": "Finance"}, {})
+
+    assert inserted == ["name"]
+    assert changed == ["name"]
+    assert deleted == []
+# END test__attribute_missing_in_previous_version_is_inserted
+
+
+def test__relationships_are_compared_on_relationship_guid():
+    updated_relationship = make_relationship("e1", "r1")
+    updated_relationship["displayText"] = "Renamed entity"
+
+    inserted, deleted = diff_relationships({"dataEntity": [updated_relationship]}, {"dataEntity": [make_relationship("e1", "r1")]})
+
+    assert inserted == {}
+    assert deleted == {}
+# END test__relationships_are_compared_on_relationship_guid
@@ -0,0 +1,51 @@
+from .entity_messages import GOVERNANCE_ROLE_RELATIONSHIPS, get_delta_relationship_names, trim_entity
+
+
+def make_entity() -> dict:
+    return {
+        "typeName": "m4i_dataset",
+        "guid": "5c1cd9a4-0c8a-4b0b-a7bb-1c1a0d9bb001",
+        "updateTime": 1655718090946,
+        "attributes": {
+            "qualifiedName": "finance--dataset",
+            "name": "Dataset",
+            "definition": "A dataset",
+            "source": "source system",
+            "parent": {"guid": "collection-1", "typeName": "m4i_collection"}
+        },
+        "relationshipAttributes": {
+            "fields": [{"guid": f"field-{index}"} for index in range(1000)],
+            "businessOwner": [{"guid": "person-1"}],
+            "dataSteward": [{"guid": "person-2"}]
+        }
+    }
+# END make_entity
+
+
+def test__trim_entity_keeps_changed_and_identifying_attributes():
+    trimmed = trim_entity(make_entity(), ["parent.guid"], [])
+
+    assert trimmed["guid"] == "5c1cd9a4-0c8a-4b0b-a7bb-1c1a0d9bb001"
+    assert trimmed["typeName"] == "m4i_dataset"
+    assert sorted(trimmed["attributes"]) == ["definition", "name", "parent", "qualifiedName"]
+    assert trimmed["relationshipAttributes"] == {}
+# END test__trim_entity_keeps_changed_and_identifying_attributes
+
+
+def test__trim_entity_does_not_modify_the_entity():
+    entity = make_entity()
+
+    trim_entity(entity, [], [])
+
+    assert entity == make_entity()
+# END test__trim_entity_does_not_modify_the_entity
+
+
+def test__delta_keeps_all_governance_roles_when_one_changed():
+    assert get_delta_relationship_names(["fields"]) == []
+    assert get_delta_relationship_names(["fields", "dataSteward"]) == GOVERNANCE_ROLE_RELATIONSHIPS
+
+    trimmed = trim_entity(make_entity(), [], get_delta_relationship_names(["dataSteward"]))
+
+    assert sorted(trimmed["relationshipAttributes"]) == ["businessOwner", "dataSteward"]
+# END test__delta_keeps_all_governance_roles_when_one_changed
@@ -0,0 +1,105 @@
+from typing import Optional
+
+from ..codec import dumps, loads
+from .entity_state import get_previous_entity, precedes, update_entity_state
+
+
+class FakeValueState(object):
+
+    def __init__(self, value: Optional[str] = None):
+        self._value = value
+
+    def value(self) -> Optional[str]:
+        return self._value
+
+    def update(self, value: str):
+        self._value = value
+
+    def clear(self):
+        self._value = None
+# END FakeValueState
+
+
+def make_entity(update_time: Optional[int], name: str = "name") -> str:
+    entity = {"guid": "a", "attributes": {"name": name}}
+    if update_time is not None:
+        entity["updateTime"] = update_time
+    return dumps(entity)
+# END make_entity
+
+
+def test__precedes_orders_by_update_time():
+    assert precedes(1, 2) is True
+    assert precedes(2, 1) is False
+    assert precedes(1, 1) is False
+# END test__precedes_orders_by_update_time
+
+
+def test__precedes_orders_missing_update_times_by_arrival():
+    assert precedes(None, 1) is True
+    assert precedes(1, None) is True
+    assert precedes(None, None) is True
+# END test__precedes_orders_missing_update_times_by_arrival
+
+
+def test__first_event_for_key_has_no_previous_entity():
+    state = FakeValueState()
+
+    assert get_previous_entity(state, 1) is None
+    assert update_entity_state(state, make_entity(1), 1) is True
+    assert loads(state.value())["updateTime"] == 1
+# END test__first_event_for_key_has_no_previous_entity
+
+
+def test__in_order_events_use_state_as_previous_entity():
+    state = FakeValueState()
+    update_entity_state(state, make_entity(1, "first"), 1)
+
+    previous_entity = get_previous_entity(state, 2)
+    update_entity_state(state, make_entity(2, "second"), 2)
+
+    assert previous_entity["attributes"]["name"] == "first"
+    assert loads(state.value())["attributes"]["name"] == "second"
+# END test__in_order_events_use_state_as_previous_entity
+
+
+def test__out_of_order_event_keeps_the_most_recent_version():
+    state = FakeValueState(make_entity(2, "second"))
+
+    # The state holds a more recent version, so it cannot serve as the previous version of the late event.
+    assert get_previous_entity(state, 1) is None
+    assert update_entity_state(state, make_entity(1, "first"), 1) is False
+    assert loads(state.value())["attributes"]["name"] == "second"
+# END test__out_of_order_event_keeps_the_most_recent_version
+
+
+def test__replayed_event_does_not_use_itself_as_previous_entity():
+    state = FakeValueState(make_entity(1))
+
+    assert get_previous_entity(state, 1) is None
+    assert update_entity_state(state, make_entity(1), 1) is True
+# END test__replayed_event_does_not_use_itself_as_previous_entity
+
+
+def test__missing_update_times_do_not_fail():
+    state = FakeValueState(make_entity(None, "first"))
+
+    assert get_previous_entity(state, 2)["attributes"]["name"] == "first"
+    assert update_entity_state(state, make_entity(2, "second"), 2) is True
+
+    assert get_previous_entity(state, None)["attributes"]["name"] == "second"
+    assert update_entity_state(state, make_entity(None, "third"), None) is True
+    assert loads(state.value())["attributes"]["name"] == "third"
+# END test__missing_update_times_do_not_fail
+
+
+def test__deleted_entity_starts_over():
+    state = FakeValueState()
+    update_entity_state(state, make_entity(1), 1)
+
+    # Deleting an entity clears its state, so a later create for the same guid is a first event again.
+    state.clear()
+
+    assert get_previous_entity(state, 2) is None
+    assert update_entity_state(state, make_entity(2), 2) is True
+# END test__deleted_entity_starts_over
@@ -0,0 +1,53 @@
+from typing import List, Optional
+
+from .codec import dumps, loads
+
+# Key under which a coalesced notification lists the operation types of all notifications it replaces, in arrival order.
+COLLAPSED_OPERATION_TYPES_KEY = "collapsedOperationTypes"
+
+ENTITY_CREATE = "ENTITY_CREATE"
+ENTITY_UPDATE = "ENTITY_UPDATE"
+ENTITY_DELETE = "ENTITY_DELETE"
+
+
+def get_operation_type(kafka_notification_json: dict) -> Optional[str]:
+    return (kafka_notification_json.get("message") or {}).get("operationType")
+
+
+def get_effective_operation_type(operation_types: List[str]) -> str:
+    """
+    This function determines the operation type of a sequence of notifications for the same entity.
+    A sequence ending with a delete is a delete, a sequence that contains a create is a create, otherwise the last operation type applies.
+    """
+    if operation_types[-1] == ENTITY_DELETE:
+        return ENTITY_DELETE
+    if ENTITY_CREATE in operation_types:
+        return ENTITY_CREATE
+    return operation_types[-1]
+
+
+def get_collapsed_operation_types(kafka_notification_json: dict) -> Optional[List[str]]:
+    """This function returns the operation types of the notifications that were coalesced into the given notification, if any."""
+    return kafka_notification_json.get(COLLAPSED_OPERATION_TYPES_KEY)
+
+
+def coalesce_notification(pending_notification: Optional[str], kafka_notification: str) -> str:
+    """
+    This function merges a notification into the pending notification for the same entity.
+    The result is the latest notification with the effective operation type of all merged notifications,
+    and the operation types of all merged notifications listed under collapsedOperationTypes.
+    """
+    kafka_notification_json = loads(kafka_notification)
+
+    if pending_notification is None:
+        operation_types = []
+    else:
+        pending_notification_json = loads(pending_notification)
+        operation_types = pending_notification_json.get(COLLAPSED_OPERATION_TYPES_KEY) or [get_operation_type(pending_notification_json)]
+
+    operation_types = [*operation_types, get_operation_type(kafka_notification_json)]
+
+    kafka_notification_json["message"]["operationType"] = get_effective_operation_type(operation_types)
+    kafka_notification_json[COLLAPSED_OPERATION_TYPES_KEY] = operation_types
+
+    return dumps(kafka_notification_json)
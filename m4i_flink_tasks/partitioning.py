@@ -0,0 +1,76 @@
+import re
+from typing import Optional
+
+from m4i_atlas_core import ConfigStore
+
+from .codec import loads
+
+store = ConfigStore.get_instance()
+
+# The parallelism of every operator that has no parallelism of its own configured.
+DEFAULT_PARALLELISM_KEY = "flink.parallelism"
+
+# Enriched notifications in the json encoding start with the guid of their entity, so the key is read without parsing the whole message.
+LEADING_GUID_PATTERN = re.compile(r'\{\s*"guid"\s*:\s*"([^"\\]*)"')
+
+
+def get_notification_entity_guid(kafka_notification: str) -> str:
+    """This function returns the guid of the entity the Atlas kafka notification belongs to. The guid is used to key the stream."""
+    try:
+        return loads(kafka_notification)["message"]["entity"]["guid"] or ""
+    except (ValueError, KeyError, TypeError):
+        return ""
+
+
+def get_atlas_entity_guid(kafka_notification: str) -> str:
+    """
+    This function returns the guid of the atlas entity in the enriched kafka notification. The guid is used to key the stream.
+    The guid is taken from the start of the notification, the notification is only parsed in full when it does not start with the guid.
+    """
+    match = LEADING_GUID_PATTERN.match(kafka_notification)
+    if match is not None:
+        return match.group(1)
+
+    try:
+        return loads(kafka_notification).get("atlas_entity", {}).get("guid") or ""
+    except (ValueError, AttributeError):
+        return ""
+
+
+def get_entity_message_guid(entity_message: str) -> str:
+    """This function returns the guid of the entity the determined change message belongs to. The guid is used to key the stream."""
+    try:
+        return loads(entity_message).get("guid") or ""
+    except (ValueError, AttributeError):
+        return ""
+
+
+def get_document_change_id(document_change: str) -> str:
+    """This function returns the id of the app search document the document change belongs to. The id is used to key the stream."""
+    try:
+        return loads(document_change).get("id") or ""
+    except (ValueError, AttributeError):
+        return ""
+
+
+def get_default_parallelism() -> int:
+    """This function returns the default parallelism of the operators of a job, configured as flink.parallelism, which is 1 unless configured."""
+    return int(store.get(DEFAULT_PARALLELISM_KEY) or 1)
+
+
+def get_parallelism(operator_name: str) -> Optional[int]:
+    """
+    This function returns the parallelism configured for the operator with the given name as <operator_name>.parallelism,
+    or else the default parallelism configured as flink.parallelism. None is returned in case neither is configured.
+    """
+    operator_parallelism, default_parallelism = store.get_many(f"{operator_name}.parallelism", DEFAULT_PARALLELISM_KEY)
+    parallelism = operator_parallelism or default_parallelism
+    return int(parallelism) if parallelism else None
+
+
+def set_parallelism(data_stream, operator_name: str):
+    """This function applies the configured parallelism of the operator with the given name to the data stream and returns the data stream."""
+    parallelism = get_parallelism(operator_name)
+    if parallelism is not None:
+        data_stream = data_stream.set_parallelism(parallelism)
+    return data_stream
@@ -0,0 +1,82 @@
+import concurrent.futures
+import queue
+import threading
+from typing import Any, Callable, Iterator
+
+# The producer checks this often whether the consumer went away while it waits for room in the queue.
+POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+Emit = Callable[[Any], None]
+
+
+class ConsumerClosedError(Exception):
+    """This exception is raised by emit in case the consumer stopped iterating, so the producer stops as well."""
+
+
+def iter_emitted(start: Callable[[Emit], concurrent.futures.Future], max_pending: int = 1000) -> Iterator[Any]:
+    """
+    This function yields the items passed to emit by a producer that runs elsewhere, as soon as they are emitted.
+    The producer is started by calling start with emit, which returns a future that completes once the producer is done.
+    At most max_pending items are held at the same time: emit blocks while the consumer is behind, so memory use does not grow with the output.
+    An exception raised by the producer is raised again by the iterator once the items emitted before it are consumed.
+    In case the consumer stops iterating early, emit raises ConsumerClosedError and the iterator waits for the producer to stop.
+    """
+    items = queue.Queue(maxsize=max_pending)
+    closed = threading.Event()
+
+    def put(item):
+        while not closed.is_set():
+            try:
+                items.put(item, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+        raise ConsumerClosedError()
+
+    def done(_):
+        try:
+            put(_DONE)
+        except ConsumerClosedError:
+            pass
+
+    future = start(put)
+    future.add_done_callback(done)
+
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                break
+            yield item
+    finally:
+        closed.set()
+        concurrent.futures.wait([future])
+
+    if future.cancelled():
+        raise concurrent.futures.CancelledError()
+
+    failure = future.exception()
+    if failure is not None and not isinstance(failure, ConsumerClosedError):
+        raise failure
+
+
+def iter_in_background(produce: Callable[[Emit], None], max_pending: int = 1000) -> Iterator[Any]:
+    """
+    This function runs produce in a background thread and yields the items it passes to its emit argument, as soon as they are emitted.
+    The items are handed over as described for iter_emitted.
+    """
+    def start(emit: Emit) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+
+        def run():
+            try:
+                future.set_result(produce(emit))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="background-iteration", daemon=True).start()
+        return future
+
+    return iter_emitted(start, max_pending)
@@ -0,0 +1,230 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+from elastic_enterprise_search import AppSearch
+
+logger = logging.getLogger(__name__)
+
+# App Search accepts at most 100 documents per index or delete request.
+APP_SEARCH_MAX_BATCH_SIZE = 100
+
+INDEX_ACTION = "index"
+PATCH_ACTION = "patch"
+DELETE_ACTION = "delete"
+
+
+def chunks(input_list: list, chunk_size: int = APP_SEARCH_MAX_BATCH_SIZE):
+    """This function yields consecutive slices of the input list having at most chunk_size elements."""
+    for index in range(0, len(input_list), chunk_size):
+        yield input_list[index:index + chunk_size]
+
+
+class AppSearchDocumentBuffer(object):
+    """
+    This class collects app search document changes across many messages and writes them in bulk.
+    Changes are keyed by document id, so a later change of the same document within a window replaces the earlier one.
+    Partial updates of the same document are merged, and a partial update of a pending full document is applied to it.
+    The buffer is flushed when it holds flush_size changes or when its oldest change is older than flush_interval seconds.
+    The optional on_rejected callback receives the index results of the documents app search rejected during a flush.
+    """
+
+    def __init__(self, app_search: AppSearch, engine_name: str, flush_size: int = APP_SEARCH_MAX_BATCH_SIZE, flush_interval: float = 1.0,
+                 on_rejected: Optional[Callable[[List[dict]], None]] = None):
+        self.app_search = app_search
+        self.engine_name = engine_name
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.on_rejected = on_rejected
+
+        self._documents: Dict[str, dict] = dict()
+        self._patches: Dict[str, dict] = dict()
+        self._deleted: Set[str] = set()
+        self._window_start: Optional[float] = None
+        self._lock = threading.RLock()
+        # Only one flush runs at a time, so the writes reach app search in the order the changes were buffered.
+        self._flush_lock = threading.Lock()
+        self._timer: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._documents) + len(self._patches) + len(self._deleted)
+
+    def _start_window(self):
+        if self._window_start is None:
+            self._window_start = time.monotonic()
+
+    def index(self, document: dict):
+        """This function schedules the given document to be indexed, replacing any pending change of the same document."""
+        with self._lock:
+            self._start_window()
+            self._deleted.discard(document["id"])
+            self._patches.pop(document["id"], None)
+            self._documents[document["id"]] = document
+
+    def patch(self, document: dict):
+        """
+        This function schedules a partial update holding the id and the changed fields of a document.
+        The update is merged into a pending update of the same document, and is dropped in case the document is pending deletion.
+        """
+        with self._lock:
+            document_id = document["id"]
+
+            if document_id in self._deleted:
+                return
+
+            self._start_window()
+
+            if document_id in self._documents:
+                self._documents[document_id] = {**self._documents[document_id], **document}
+            else:
+                self._patches[document_id] = {**self._patches.get(document_id, {}), **document}
+
+    def delete(self, document_id: str):
+        """This function schedules the document with the given id to be deleted, discarding any pending update of it."""
+        with self._lock:
+            self._start_window()
+            self._documents.pop(document_id, None)
+            self._patches.pop(document_id, None)
+            self._deleted.add(document_id)
+
+    def apply(self, change: dict):
+        """This function schedules a document change having the structure {"action": ..., "id": ..., "document": ...}."""
+        action = change.get("action")
+        if action == INDEX_ACTION:
+            self.index(change["document"])
+        elif action == PATCH_ACTION:
+            self.patch(change["document"])
+        elif action == DELETE_ACTION:
+            self.delete(change["id"])
+        else:
+            raise ValueError(f"Unknown app search document action: {action}")
+
+    def should_flush(self) -> bool:
+        """This function determines whether the buffer reached its flush size or its flush interval."""
+        with self._lock:
+            if self._window_start is None:
+                return False
+            if len(self._documents) + len(self._patches) + len(self._deleted) >= self.flush_size:
+                return True
+            return time.monotonic() - self._window_start >= self.flush_interval
+
+    def flush(self) -> List[dict]:
+        """
+        This function writes all pending changes to app search in chunks of at most 100 documents.
+        Partial updates are sent with the patch documents API.
+        This function returns the index results of the documents that app search rejected.
+        Concurrent flushes wait for each other, so a document is never overwritten with an older version of it.
+        """
+        with self._flush_lock:
+            with self._lock:
+                documents = list(self._documents.values())
+                patches = list(self._patches.values())
+                deleted = list(self._deleted)
+                self._documents = dict()
+                self._patches = dict()
+                self._deleted = set()
+                self._window_start = None
+
+            failed = []
+
+            for index, chunk in enumerate(chunks(documents)):
+                try:
+                    results = self.app_search.index_documents(
+                        engine_name=self.engine_name, documents=chunk)
+                except Exception:
+                    self._requeue(documents[index * APP_SEARCH_MAX_BATCH_SIZE:], deleted, patches)
+                    raise
+
+                failed += [result for result in results if result.get("errors")]
+
+            for index, chunk in enumerate(chunks(patches)):
+                try:
+                    results = self.app_search.put_documents(
+                        engine_name=self.engine_name, documents=chunk)
+                except Exception:
+                    self._requeue([], deleted, patches[index * APP_SEARCH_MAX_BATCH_SIZE:])
+                    raise
+
+                failed += [result for result in results if result.get("errors")]
+
+            for index, chunk in enumerate(chunks(deleted)):
+                try:
+                    self.app_search.delete_documents(
+                        engine_name=self.engine_name, document_ids=chunk)
+                except Exception:
+                    self._requeue([], deleted[index * APP_SEARCH_MAX_BATCH_SIZE:])
+                    raise
+
+            for result in failed:
+                logger.warning(
+                    f"App search rejected document {result.get('id')}: {result.get('errors')}")
+
+            if failed and self.on_rejected is not None:
+                self.on_rejected(failed)
+
+            return failed
+
+    def drain(self) -> List[dict]:
+        """
+        This function empties the buffer without writing it and returns the pending changes,
+        each having the structure {"action": ..., "id": ..., "document": ...} accepted by apply.
+        """
+        with self._lock:
+            changes = [{"action": INDEX_ACTION, "id": document["id"], "document": document} for document in self._documents.values()]
+            changes += [{"action": PATCH_ACTION, "id": document["id"], "document": document} for document in self._patches.values()]
+            changes += [{"action": DELETE_ACTION, "id": document_id} for document_id in self._deleted]
+
+            self._documents = dict()
+            self._patches = dict()
+            self._deleted = set()
+            self._window_start = None
+
+        return changes
+
+    def flush_if_due(self) -> List[dict]:
+        """This function flushes the buffer in case it reached its flush size or its flush interval."""
+        if self.should_flush():
+            return self.flush()
+        return []
+
+    def _requeue(self, documents: List[dict], deleted: List[str], patches: Optional[List[dict]] = None):
+        """This function puts unwritten changes back into the buffer without overriding changes that arrived in the meantime."""
+        with self._lock:
+            self._start_window()
+            for document in documents:
+                if document["id"] not in self._documents and document["id"] not in self._deleted:
+                    self._documents[document["id"]] = {**document, **self._patches.pop(document["id"], {})}
+            for document in patches or []:
+                if document["id"] not in self._documents and document["id"] not in self._deleted:
+                    self._patches[document["id"]] = {**document, **self._patches.get(document["id"], {})}
+            for document_id in deleted:
+                if document_id not in self._documents:
+                    self._deleted.add(document_id)
+
+    def start(self):
+        """This function starts a background thread which flushes the buffer once the flush interval has passed."""
+        if self._timer is not None:
+            return
+
+        def run():
+            while not self._stopped.wait(self.flush_interval / 2):
+                try:
+                    self.flush_if_due()
+                except Exception as e:
+                    logger.warning(f"Periodic flush to app search failed: {e}")
+
+        self._stopped.clear()
+        self._timer = threading.Thread(target=run, name="app-search-flush", daemon=True)
+        self._timer.start()
+
+    def close(self):
+        """This function stops the background flush thread and writes all pending changes."""
+        self._stopped.set()
+        if self._timer is not None:
+            self._timer.join()
+            self._timer = None
+        self.flush()
+# END AppSearchDocumentBuffer
@@ -0,0 +1,180 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from elastic_enterprise_search import AppSearch
+
+from .AppSearchDocumentBuffer import chunks
+from .SchemaCache import schema_cache
+
+
+def copy_document(document: dict) -> dict:
+    """This function copies the given document. The handlers change list fields in place, so the lists are copied as well."""
+    return {key: list(value) if isinstance(value, list) else value for key, value in document.items()}
+
+
+def diff_documents(document_id: str, original: dict, document: dict) -> dict:
+    """This function returns the id and the fields of the document that differ from the original. Fields that were removed are set to None."""
+    patch = {"id": document_id}
+    for key in document.keys() | original.keys():
+        if document.get(key) != original.get(key):
+            patch[key] = document.get(key)
+    return patch
+
+
+class DocumentCache(object):
+    """
+    This class is a unit of work for the app search documents touched while handling a single event.
+    Every document is retrieved from app search at most once: repeated reads return the same document, so changes made by one handler
+    are seen by the next. Documents that are not cached yet are retrieved together in a single request.
+    Changed documents are marked dirty and can be written back once the event is handled, either in full or as a patch
+    holding only the fields that differ from the document as it was retrieved.
+    Large sets of documents, such as subtrees, can be streamed through the cache instead of being stored in it. In case on_streamed is given,
+    a streamed document that is written is passed to it as a patch right away, so only the documents being handled are held in memory.
+    The changed fields of written streamed documents are kept and applied whenever the document is read again, so later handlers
+    see the changes of earlier ones.
+    """
+
+    def __init__(self, app_search: AppSearch, engine_name: str, on_streamed: Optional[Callable[[dict], None]] = None):
+        self.app_search = app_search
+        self.engine_name = engine_name
+        self.on_streamed = on_streamed
+
+        self.documents: Dict[str, Optional[dict]] = dict()
+        self.dirty: Dict[str, dict] = dict()
+        self.originals: Dict[str, dict] = dict()
+        self.streamed: Dict[str, dict] = dict()
+        self.streamed_changes: Dict[str, dict] = dict()
+        self.requests = 0
+
+    def fetch(self, document_ids: Iterable[str]):
+        """This function retrieves the given documents that are not cached yet from app search."""
+        missing = [document_id for document_id in dict.fromkeys(document_ids) if document_id not in self.documents]
+
+        for chunk in chunks(missing):
+            self.requests += 1
+            documents = self.app_search.get_documents(engine_name=self.engine_name, document_ids=chunk)
+            for document_id, document in zip(chunk, documents):
+                self.store(document_id, document)
+
+    def store(self, document_id: str, document: Optional[dict]):
+        """This function stores a document retrieved from app search, or None in case it does not exist, without marking it dirty."""
+        schema_cache.observe_document(self.engine_name, document)
+
+        if document is not None:
+            document = self.apply_streamed_changes(document)
+
+        self.documents[document_id] = document
+
+        if document is not None:
+            self.originals[document_id] = copy_document(document)
+
+    def stream(self, documents: Iterable[dict]) -> Iterator[dict]:
+        """
+        This function yields the given documents retrieved from app search without storing them in the cache.
+        A copy of the document being handled is kept until the next document is requested, so write can pass on its changes as a patch.
+        Documents that are in the cache already are yielded as they are. Without on_streamed, the documents are stored in the cache instead.
+        """
+        for document in documents:
+            document_id = document["id"]
+
+            if document_id in self.documents:
+                yield document
+                continue
+
+            if self.on_streamed is None:
+                self.store(document_id, document)
+                yield document
+                continue
+
+            schema_cache.observe_document(self.engine_name, document)
+            document = self.apply_streamed_changes(document)
+            self.streamed[document_id] = copy_document(document)
+            try:
+                yield document
+            finally:
+                self.streamed.pop(document_id, None)
+
+    def write(self, document: dict):
+        """
+        This function marks the given changed document dirty.
+        A document that is being streamed is passed to on_streamed as a patch instead, unless nothing changed.
+        """
+        document_id = document["id"]
+        original = self.streamed.pop(document_id, None)
+
+        if original is None:
+            self.put(document)
+            return
+
+        patch = diff_documents(document_id, original, document)
+        if len(patch) > 1:
+            self.streamed_changes[document_id] = {**self.streamed_changes.get(document_id, {}), **patch}
+            self.on_streamed(patch)
+
+    def apply_streamed_changes(self, document: dict) -> dict:
+        """This function returns the given document retrieved from app search with the changes already written while it was streamed."""
+        changes = self.streamed_changes.get(document["id"])
+        if changes is None:
+            return document
+        return {**document, **copy_document(changes)}
+
+    def get(self, document_id: str) -> Optional[dict]:
+        """This function returns the document with the given id, or None in case it does not exist."""
+        self.fetch([document_id])
+        return self.documents[document_id]
+
+    def get_many(self, document_ids: List[str]) -> List[Optional[dict]]:
+        """This function returns the documents with the given ids, in the same order, retrieving all missing documents in one go."""
+        self.fetch(document_ids)
+        return [self.documents[document_id] for document_id in document_ids]
+
+    def put(self, document: dict):
+        """This function stores the given document in the cache and marks it dirty."""
+        self.documents[document["id"]] = document
+        self.dirty[document["id"]] = document
+
+    def mark_dirty(self, documents: Dict[str, dict]):
+        """This function marks the given documents, keyed by id, as changed."""
+        for document in documents.values():
+            if document is not None:
+                self.put(document)
+
+    def discard(self, document_id: str):
+        """This function forgets the document with the given id, e.g. after it has been deleted."""
+        self.documents[document_id] = None
+        self.dirty.pop(document_id, None)
+        self.originals.pop(document_id, None)
+
+    def get_patch(self, document_id: str) -> Optional[dict]:
+        """
+        This function returns the id and the changed fields of the given document compared to the document retrieved from app search.
+        Fields that were removed are set to None. None is returned in case the document was not retrieved, e.g. because it is new.
+        """
+        original = self.originals.get(document_id)
+        document = self.documents.get(document_id)
+
+        if original is None or document is None:
+            return None
+
+        return diff_documents(document_id, original, document)
+# END DocumentCache
+
+
+current_document_cache: ContextVar[Optional[DocumentCache]] = ContextVar("current_document_cache", default=None)
+
+
+def get_document_cache() -> Optional[DocumentCache]:
+    """This function returns the document cache of the event that is being handled, if any."""
+    return current_document_cache.get()
+
+
+@contextmanager
+def document_cache_scope(app_search: AppSearch, engine_name: str, on_streamed: Optional[Callable[[dict], None]] = None):
+    """This function opens a document cache for the duration of the with block. get_document and get_documents are served from it."""
+    document_cache = DocumentCache(app_search, engine_name, on_streamed)
+    token = current_document_cache.set(document_cache)
+    try:
+        yield document_cache
+    finally:
+        current_document_cache.reset(token)
@@ -0,0 +1,136 @@
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from elasticsearch import Elasticsearch, helpers
+
+logger = logging.getLogger(__name__)
+
+FailureHandler = Callable[[str, str], None]
+
+
+def get_bulk_action_size(index: str, document_id: str, document: dict) -> int:
+    """This function returns the number of bytes the index action of the given document takes in a _bulk request, i.e. its action and source lines."""
+    action = json.dumps({"index": {"_index": index, "_id": document_id}}, separators=(",", ":"))
+    source = json.dumps(document, separators=(",", ":"), ensure_ascii=False, default=str)
+    return len(action.encode("utf-8")) + len(source.encode("utf-8")) + 2
+
+
+class ElasticBulkBuffer(object):
+    """
+    This class buffers documents and writes them to an Elasticsearch index through the _bulk api.
+    The buffer is flushed when it holds flush_size documents, when the serialized bulk actions of the buffered documents exceed flush_bytes,
+    or when its oldest document is older than flush_interval seconds.
+    Failures are handled per document: on_failure is called with the original message and the error of every document that could not be indexed.
+    """
+
+    def __init__(self, elastic: Elasticsearch, index: str, on_failure: FailureHandler, flush_size: int = 500, flush_bytes: int = 5 * 1024 * 1024, flush_interval: float = 1.0):
+        self.elastic = elastic
+        self.index = index
+        self.on_failure = on_failure
+        self.flush_size = flush_size
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+
+        self._documents: Dict[str, Tuple[dict, str, int]] = dict()
+        self._size = 0
+        self._window_start: Optional[float] = None
+        self._lock = threading.RLock()
+        self._timer: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._documents)
+
+    def add(self, document_id: str, document: dict, original_message: str):
+        """This function buffers the given document. The original message is reported to on_failure in case the document cannot be indexed."""
+        with self._lock:
+            if self._window_start is None:
+                self._window_start = time.monotonic()
+            size = get_bulk_action_size(self.index, document_id, document)
+            if document_id in self._documents:
+                self._size -= self._documents[document_id][2]
+            self._documents[document_id] = (document, original_message, size)
+            self._size += size
+
+    def should_flush(self) -> bool:
+        """This function determines whether the buffer reached its flush size, its byte size or its flush interval."""
+        with self._lock:
+            if self._window_start is None:
+                return False
+            if len(self._documents) >= self.flush_size or self._size >= self.flush_bytes:
+                return True
+            return time.monotonic() - self._window_start >= self.flush_interval
+
+    def flush(self) -> int:
+        """This function writes all buffered documents with the _bulk api and returns the number of documents indexed."""
+        with self._lock:
+            documents = self._documents
+            self._documents = dict()
+            self._size = 0
+            self._window_start = None
+
+        if len(documents) == 0:
+            return 0
+
+        actions = (
+            {"_op_type": "index", "_index": self.index, "_id": document_id, "_source": document}
+            for document_id, (document, _, _) in documents.items()
+        )
+
+        try:
+            success, errors = helpers.bulk(
+                self.elastic,
+                actions,
+                chunk_size=self.flush_size,
+                max_chunk_bytes=self.flush_bytes,
+                raise_on_error=False,
+                raise_on_exception=False
+            )
+        except Exception as e:
+            # The documents are not kept for a retry, so every document of the failed request is reported.
+            for _, original_message, _ in documents.values():
+                self.on_failure(original_message, repr(e))
+            return 0
+
+        for error in errors:
+            item = error.get("index", error)
+            document_id = item.get("_id")
+            _, original_message, _ = documents.get(document_id, (None, json.dumps(item.get("data"), default=str), 0))
+            self.on_failure(original_message, json.dumps(item.get("error", item), default=str))
+
+        return success
+
+    def flush_if_due(self) -> int:
+        """This function flushes the buffer in case it reached one of its limits."""
+        if self.should_flush():
+            return self.flush()
+        return 0
+
+    def start(self):
+        """This function starts a background thread which flushes the buffer once the flush interval has passed."""
+        if self._timer is not None:
+            return
+
+        def run():
+            while not self._stopped.wait(self.flush_interval / 2):
+                try:
+                    self.flush_if_due()
+                except Exception as e:
+                    logger.warning(f"Periodic bulk flush to elastic search failed: {e}")
+
+        self._stopped.clear()
+        self._timer = threading.Thread(target=run, name="elastic-bulk-flush", daemon=True)
+        self._timer.start()
+
+    def close(self):
+        """This function stops the background flush thread and writes all buffered documents."""
+        self._stopped.set()
+        if self._timer is not None:
+            self._timer.join()
+            self._timer = None
+        self.flush()
+# END ElasticBulkBuffer
@@ -0,0 +1,116 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import Any, Callable, Iterator, Optional
+
+from elastic_enterprise_search import AppSearch
+
+from ..codec import dumps
+from ..AsyncRequestWindow import cancel_tasks
+from ..streaming import iter_emitted
+from .AppSearchDocumentBuffer import DELETE_ACTION, INDEX_ACTION, PATCH_ACTION
+from .DocumentCache import document_cache_scope
+from .HierarchyIndex import HierarchyIndex, hierarchy_index
+from .synchronize_app_search import handle_entity_message
+
+
+class EntityMessageHandler(object):
+    """
+    This class applies entity messages to the app search documents and emits the resulting document changes, serialized as
+    {"action": ..., "id": ..., "document": ...}. All entity messages are handled on one event loop, which runs on a dedicated thread
+    from open() until close(). Entity messages are handled one at a time.
+    The documents of subtrees are streamed: every changed document is emitted as a patch as soon as it is handled.
+    The documents the handlers retrieved directly are emitted once the entity message is handled, in full or as a patch when patch_enabled is set.
+    """
+
+    def __init__(self, app_search: AppSearch, engine_name: str, patch_enabled: bool = True, index: HierarchyIndex = hierarchy_index):
+        self.app_search = app_search
+        self.engine_name = engine_name
+        self.patch_enabled = patch_enabled
+        self.hierarchy_index = index
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def open(self):
+        """This function starts the event loop of the handler on its own thread."""
+        if self.loop is not None:
+            return
+
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(started.set)
+            loop.run_forever()
+
+        self.thread = threading.Thread(target=run, name="entity-message-handler", daemon=True)
+        self.thread.start()
+        started.wait()
+        self.loop = loop
+
+    def submit(self, entity_message, emit: Callable[[str], Any]):
+        """This function starts handling the given entity message on the event loop of the handler and returns a future of the result."""
+        if self.loop is None:
+            raise RuntimeError("The entity message handler is not open")
+
+        return asyncio.run_coroutine_threadsafe(self.handle_async(entity_message, emit), self.loop)
+
+    def handle(self, entity_message, emit: Callable[[str], Any]):
+        """This function applies the given entity message and passes every document change to emit."""
+        self.submit(entity_message, emit).result()
+
+    async def handle_async(self, entity_message, emit: Callable[[str], Any]):
+        """This function applies the given entity message on the event loop of the handler and passes every document change to emit."""
+        on_streamed = lambda patch: emit(dumps({"action": PATCH_ACTION, "id": patch["id"], "document": patch}))
+
+        with document_cache_scope(self.app_search, self.engine_name, on_streamed) as document_cache:
+            await handle_entity_message(entity_message, self.app_search)
+
+            logging.warning(f"{document_cache.requests} app search document requests for {len(document_cache.documents)} documents.")
+
+        if self.hierarchy_index.loaded:
+            for updated_doc in document_cache.dirty.values():
+                self.hierarchy_index.update_document(updated_doc)
+            if entity_message.event_type == "EntityDeleted":
+                self.hierarchy_index.remove(entity_message.guid)
+
+        for key, updated_doc in document_cache.dirty.items():
+            patch = document_cache.get_patch(key) if self.patch_enabled else None
+
+            if patch is None:
+                emit(dumps({"action": INDEX_ACTION, "id": key, "document": updated_doc}))
+            elif len(patch) > 1:
+                emit(dumps({"action": PATCH_ACTION, "id": key, "document": patch}))
+
+        if entity_message.event_type == "EntityDeleted":
+            emit(dumps({"action": DELETE_ACTION, "id": entity_message.guid}))
+
+    def iter_changes(self, entity_message, max_pending: int = 1000) -> Iterator[str]:
+        """
+        This function handles the given entity message on the event loop of the handler and yields the document changes as soon as they are emitted,
+        so they are passed on while large subtrees are still being read. At most max_pending changes are held at the same time.
+        In case the iterator is closed early, handling stops before the next entity message is submitted.
+        """
+        return iter_emitted(lambda emit: self.submit(entity_message, emit), max_pending)
+
+    def close(self, timeout: Optional[float] = None):
+        """This function cancels the remaining work on the event loop, stops the loop, joins its thread and closes the loop."""
+        if self.loop is None:
+            return
+
+        try:
+            asyncio.run_coroutine_threadsafe(cancel_tasks(), self.loop).result(timeout)
+        except concurrent.futures.TimeoutError:
+            pass
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+        if not self.loop.is_running():
+            self.loop.close()
+
+        self.loop = None
+        self.thread = None
+# END EntityMessageHandler
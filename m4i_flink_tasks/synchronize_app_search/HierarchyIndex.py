@@ -0,0 +1,166 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from dataclasses import field as dataclass_field
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .parameters import breadcrumb_guid, guid, name, parent_guid, type_name
+
+
+@dataclass
+class HierarchyNode:
+    guid: str
+    name: Optional[str] = None
+    type_name: Optional[str] = None
+    parent_guid: Optional[str] = None
+    children: Set[str] = dataclass_field(default_factory=set)
+# END HierarchyNode
+
+
+class HierarchyIndex(object):
+    """
+    This class holds the parent and children of every entity in the app search engine, together with its name and type.
+    Subtrees and breadcrumbs are resolved from the index in O(subtree) and O(depth) time, so they do not require search queries.
+    The index is bootstrapped from the app search documents and kept up to date with the documents the job writes.
+    The index is shared by all tasks running in the same process and is safe to use from several threads.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.loaded_at: Optional[float] = None
+
+        self._nodes: Dict[str, HierarchyNode] = dict()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._nodes)
+
+    def __contains__(self, entity_guid: str) -> bool:
+        with self._lock:
+            return entity_guid in self._nodes
+
+    def get(self, entity_guid: str) -> Optional[HierarchyNode]:
+        """This function returns the node of the given entity, or None in case it is not in the index."""
+        with self._lock:
+            return self._nodes.get(entity_guid)
+
+    def _get_or_create(self, entity_guid: str) -> HierarchyNode:
+        node = self._nodes.get(entity_guid)
+        if node is None:
+            node = self._nodes[entity_guid] = HierarchyNode(entity_guid)
+        return node
+
+    def put(self, entity_guid: str, entity_name: Optional[str] = None, entity_type_name: Optional[str] = None):
+        """This function adds the given entity to the index or updates its name and type."""
+        with self._lock:
+            node = self._get_or_create(entity_guid)
+            node.name = entity_name
+            node.type_name = entity_type_name
+
+    def set_parent(self, entity_guid: str, parent_entity_guid: Optional[str]):
+        """This function moves the given entity below the given parent, or makes it a root in case no parent is given."""
+        with self._lock:
+            node = self._get_or_create(entity_guid)
+
+            if node.parent_guid == parent_entity_guid:
+                return
+
+            # An entity cannot be moved below one of its own descendants.
+            if parent_entity_guid is not None and (parent_entity_guid == entity_guid or parent_entity_guid in self._iter_subtree(entity_guid)):
+                raise ValueError(f"Moving entity {entity_guid} below {parent_entity_guid} would create a cycle")
+
+            if node.parent_guid is not None and node.parent_guid in self._nodes:
+                self._nodes[node.parent_guid].children.discard(entity_guid)
+
+            node.parent_guid = parent_entity_guid
+
+            if parent_entity_guid is not None:
+                self._get_or_create(parent_entity_guid).children.add(entity_guid)
+
+    def remove(self, entity_guid: str):
+        """This function removes the given entity from the index. Its children become roots."""
+        with self._lock:
+            node = self._nodes.pop(entity_guid, None)
+
+            if node is None:
+                return
+
+            if node.parent_guid is not None and node.parent_guid in self._nodes:
+                self._nodes[node.parent_guid].children.discard(entity_guid)
+
+            for child_guid in node.children:
+                if child_guid in self._nodes:
+                    self._nodes[child_guid].parent_guid = None
+
+    def update_document(self, document: dict):
+        """
+        This function updates the index with the given app search document.
+        The parent is taken from the parent guid of the document, or else from the last entry of its breadcrumb.
+        """
+        breadcrumb = document.get(breadcrumb_guid) or []
+        parent_entity_guid = document.get(parent_guid) or (breadcrumb[-1] if breadcrumb else None)
+
+        with self._lock:
+            self.put(document[guid], document.get(name), document.get(type_name))
+            try:
+                self.set_parent(document[guid], parent_entity_guid)
+            except ValueError:
+                # The engine holds an inconsistent hierarchy, keep the entity where it is.
+                pass
+
+    def bootstrap(self, documents: Iterable[dict]):
+        """
+        This function replaces the contents of the index with the hierarchy of the given app search documents.
+        The new hierarchy is built aside, so the index remains usable while the documents are read.
+        """
+        index = HierarchyIndex()
+        for document in documents:
+            index.update_document(document)
+
+        with self._lock:
+            self._nodes = index._nodes
+            self.loaded = True
+            self.loaded_at = time.monotonic()
+
+    def is_expired(self, refresh_interval: Optional[float]) -> bool:
+        """This function determines whether the index should be bootstrapped again, i.e. it is not loaded or older than the refresh interval."""
+        if not self.loaded:
+            return True
+        return bool(refresh_interval) and time.monotonic() - self.loaded_at >= refresh_interval
+
+    def _iter_subtree(self, entity_guid: str) -> Iterator[str]:
+        node = self._nodes.get(entity_guid)
+        queue = deque(node.children if node is not None else [])
+
+        while queue:
+            child_guid = queue.popleft()
+            yield child_guid
+            queue.extend(self._nodes[child_guid].children)
+
+    def get_subtree(self, entity_guid: str) -> List[str]:
+        """This function returns the guids of all descendants of the given entity, breadth first."""
+        with self._lock:
+            return list(self._iter_subtree(entity_guid))
+
+    def get_breadcrumb(self, entity_guid: str) -> Tuple[List[str], List[Optional[str]], List[Optional[str]]]:
+        """This function returns the guids, names and types of the ancestors of the given entity, starting at the root."""
+        guids, names, type_names = [], [], []
+
+        with self._lock:
+            node = self._nodes.get(entity_guid)
+
+            while node is not None and node.parent_guid is not None:
+                node = self._nodes.get(node.parent_guid)
+                if node is None:
+                    break
+                guids.insert(0, node.guid)
+                names.insert(0, node.name)
+                type_names.insert(0, node.type_name)
+
+        return guids, names, type_names
+# END HierarchyIndex
+
+
+hierarchy_index = HierarchyIndex()
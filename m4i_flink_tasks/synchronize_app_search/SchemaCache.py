@@ -0,0 +1,95 @@
+import logging
+import threading
+import time
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+from elastic_enterprise_search import AppSearch
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaCache(object):
+    """
+    This class holds the field names of app search engine schemas keyed by engine name, so the schema is not retrieved for every message.
+    A schema is retrieved again once it is older than refresh_interval seconds, or earlier when a schema change is detected:
+    a document holding a field the cached schema does not know, or a document that app search rejected because of one of its fields.
+    The cache is shared by all tasks running in the same process and is safe to use from several threads.
+    """
+
+    def __init__(self, refresh_interval: float = 300):
+        self.refresh_interval = refresh_interval
+
+        self._entries: Dict[str, Tuple[float, FrozenSet[str]]] = dict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def peek(self, engine_name: str) -> Optional[FrozenSet[str]]:
+        """This function returns the cached field names of the given engine, or None in case they are missing or expired."""
+        with self._lock:
+            entry = self._entries.get(engine_name)
+
+            if entry is None:
+                return None
+
+            expires_at, schema_keys = entry
+
+            if time.monotonic() >= expires_at:
+                del self._entries[engine_name]
+                return None
+
+            return schema_keys
+
+    def get(self, app_search: AppSearch, engine_name: str) -> FrozenSet[str]:
+        """This function returns the field names of the schema of the given engine, retrieving the schema from app search when needed."""
+        schema_keys = self.peek(engine_name)
+
+        if schema_keys is None:
+            schema_keys = frozenset(app_search.get_schema(engine_name=engine_name).keys())
+            self.put(engine_name, schema_keys)
+
+        return schema_keys
+
+    def put(self, engine_name: str, schema_keys: Iterable[str]):
+        """This function stores the field names of the schema of the given engine."""
+        with self._lock:
+            self._entries[engine_name] = (time.monotonic() + self.refresh_interval, frozenset(schema_keys))
+
+    def invalidate(self, engine_name: Optional[str] = None):
+        """This function removes the schema of the given engine from the cache, or all schemas in case no engine name is given."""
+        with self._lock:
+            if engine_name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(engine_name, None)
+
+    def observe_document(self, engine_name: str, document: Optional[dict]):
+        """This function invalidates the schema of the given engine in case the given document holds a field the cached schema does not know."""
+        if not document:
+            return
+
+        schema_keys = self.peek(engine_name)
+
+        # The id of a document is not part of the schema of the engine.
+        if schema_keys is not None and not schema_keys.issuperset(key for key in document if key != "id"):
+            logger.info(f"Document {document.get('id')} holds fields unknown to the cached schema of {engine_name}")
+            self.invalidate(engine_name)
+
+    def observe_rejected(self, engine_name: str, rejected: Iterable[dict]):
+        """This function invalidates the schema of the given engine in case app search rejected a document because of one of its fields."""
+        for result in rejected:
+            if any("field" in str(error).lower() for error in result.get("errors") or []):
+                logger.info(f"App search rejected document {result.get('id')} because of its fields, the schema of {engine_name} is retrieved again")
+                self.invalidate(engine_name)
+                return
+# END SchemaCache
+
+
+schema_cache = SchemaCache()
+
+
+def get_schema_keys(app_search: AppSearch, engine_name: str) -> FrozenSet[str]:
+    """This function returns the field names of the schema of the given app search engine from the schema cache."""
+    return schema_cache.get(app_search, engine_name)
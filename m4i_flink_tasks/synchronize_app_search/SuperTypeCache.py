@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from m4i_atlas_core import EntityDef
+
+
+class SuperTypeCache(object):
+    """
+    This class holds the resolved super type chains of Atlas types keyed by type name.
+    Entries expire after ttl seconds and the least recently used entry is evicted once the cache holds max_size entries.
+    The cache is shared by all tasks running in the same process and is safe to use from several threads.
+    """
+
+    def __init__(self, ttl: float = 3600, max_size: int = 1024):
+        self.ttl = ttl
+        self.max_size = max_size
+
+        self._entries: "OrderedDict[str, Tuple[float, List[EntityDef]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, type_name: str) -> Optional[List[EntityDef]]:
+        """This function returns the cached super type chain of the given type, or None in case it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(type_name)
+
+            if entry is None:
+                return None
+
+            expires_at, super_types = entry
+
+            if time.monotonic() >= expires_at:
+                del self._entries[type_name]
+                return None
+
+            self._entries.move_to_end(type_name)
+            return list(super_types)
+
+    def put(self, type_name: str, super_types: List[EntityDef]):
+        """This function stores the super type chain of the given type."""
+        with self._lock:
+            self._entries[type_name] = (time.monotonic() + self.ttl, list(super_types))
+            self._entries.move_to_end(type_name)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, type_name: Optional[str] = None):
+        """
+        This function removes every chain containing the given type from the cache.
+        All chains are removed in case no type name is given, for example after a bulk typedef update.
+        """
+        with self._lock:
+            if type_name is None:
+                self._entries.clear()
+                return
+
+            stale_type_names = [
+                key for key, (_, super_types) in self._entries.items()
+                if key == type_name or any(super_type.name == type_name for super_type in super_types)
+            ]
+
+            for key in stale_type_names:
+                del self._entries[key]
+# END SuperTypeCache
+
+
+super_type_cache = SuperTypeCache()
+
+
+def invalidate_super_types(type_name: Optional[str] = None):
+    """This function should be called when typedefs change in Atlas, so the super type chains are resolved again."""
+    super_type_cache.invalidate(type_name)
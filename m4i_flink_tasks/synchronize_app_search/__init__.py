@@ -1,2 +1,10 @@
 from .synchronize_app_search import *
-from .elastic import *
\ No newline at end of file
+from .elastic import *
+from .AppSearchDocumentBuffer import *
+from .SuperTypeCache import *
+from .ElasticBulkBuffer import *
+from .DocumentCache import *
+from .SchemaCache import *
+from .HierarchyIndex import *
+from .derived_fields import *
+from .EntityMessageHandler import *
@@ -0,0 +1,107 @@
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+from .HierarchyMapping import hierarchy_mapping
+from .parameters import *
+
+
+@dataclass(frozen=True)
+class DerivedField:
+    """This class describes a pair of document fields holding the name and the guid of a related entity of the source type."""
+    source_type: str
+    name_field: str
+    guid_field: str
+# END DerivedField
+
+
+# The derived fields that hold the names and guids of entities of each type.
+DERIVED_FIELDS: Dict[str, List[DerivedField]] = {
+    data_domain: [DerivedField(data_domain, derived_data_domain, derived_data_domain_guid)],
+    data_entity: [
+        DerivedField(data_entity, derived_data_entity, derived_data_entity_guid),
+        DerivedField(data_entity, derived_entity_names, derived_entity_guids)
+    ],
+    data_attribute: [DerivedField(data_attribute, derived_data_attribute, derived_data_attribute_guid)],
+    system: [DerivedField(system, derived_system, derived_system_guid)],
+    collection: [DerivedField(collection, derived_collection, derived_collection_guid)],
+    dataset: [
+        DerivedField(dataset, derived_dataset, derived_dataset_guid),
+        DerivedField(dataset, derived_dataset_names, derived_dataset_guids)
+    ],
+    field: [DerivedField(field, derived_field, derived_field_guid)],
+    person: [DerivedField(person, derived_person, derived_person_guid)]
+}
+
+# The governance role fields, which every entity inherits from the nearest ancestor that defines them.
+GOVERNANCE_ROLE_FIELDS = [
+    derived_domain_lead_guid,
+    derived_data_owner_guid,
+    derived_data_steward_guid,
+    derived_person,
+    derived_person_guid
+]
+
+
+def get_ancestor_types(type_name: str) -> List[str]:
+    """This function returns the types above the given m4i source type in the hierarchy, starting at its parent type."""
+    ancestor_types = []
+    parent_type = hierarchy_mapping.get(type_name)
+
+    while parent_type is not None and parent_type not in ancestor_types:
+        ancestor_types.append(parent_type)
+        parent_type = hierarchy_mapping.get(parent_type)
+
+    return ancestor_types
+
+
+def get_derived_fields(source_type: str) -> List[DerivedField]:
+    """This function returns the derived fields that hold the names and guids of entities of the given type."""
+    return DERIVED_FIELDS.get(source_type, [])
+
+
+def build_propagation_table() -> Dict[str, FrozenSet[str]]:
+    """
+    This function builds the table of the derived fields that documents of each m4i source type inherit from their parent:
+    the fields describing the ancestor types of the type, and the governance role fields.
+    """
+    source_types = set(hierarchy_mapping.keys()).union(hierarchy_mapping.values())
+
+    return {
+        source_type: frozenset(
+            field_name
+            for ancestor_type in get_ancestor_types(source_type)
+            for derived_field in get_derived_fields(ancestor_type)
+            for field_name in (derived_field.name_field, derived_field.guid_field)
+        ).union(GOVERNANCE_ROLE_FIELDS)
+        for source_type in source_types
+    }
+
+
+PROPAGATION_TABLE = build_propagation_table()
+
+
+def get_inherited_fields(document: dict) -> Optional[FrozenSet[str]]:
+    """
+    This function returns the derived fields the given document inherits from its parent, based on its m4i source types.
+    None is returned in case the document has no source type in the hierarchy, in which case all derived fields are inherited.
+    """
+    source_types = [source_type for source_type in document.get("m4isourcetype") or [] if source_type in PROPAGATION_TABLE]
+
+    if not source_types:
+        return None
+
+    return frozenset().union(*(PROPAGATION_TABLE[source_type] for source_type in source_types))
+
+
+def is_derived_field(field_name: str) -> bool:
+    """This function determines whether the given document field is a derived field."""
+    return field_name.startswith("derived")
+
+
+def select_inherited_fields(document: dict, field_names: Iterable[str]) -> List[str]:
+    """This function returns the given field names that are derived fields the given document inherits from its parent."""
+    inherited_fields = get_inherited_fields(document)
+    return [
+        field_name for field_name in field_names
+        if is_derived_field(field_name) and (inherited_fields is None or field_name in inherited_fields)
+    ]
@@ -1,25 +1,55 @@
 
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import count, islice
+from typing import Callable, Iterable, Iterator, List, Optional
+
 from elasticsearch import Elasticsearch
 from elastic_enterprise_search import AppSearch
 
 from m4i_atlas_core import ConfigStore
 
+from .AppSearchDocumentBuffer import APP_SEARCH_MAX_BATCH_SIZE
+from .DocumentCache import DocumentCache, get_document_cache
+
 config_store = ConfigStore.get_instance()
 
+# App Search returns at most 1000 results per page and at most 100 pages per query.
+APP_SEARCH_MAX_PAGE_SIZE = 1000
+APP_SEARCH_MAX_PAGE = 100
+# The list documents api of App Search returns at most 100 documents per page.
+APP_SEARCH_MAX_LIST_PAGE_SIZE = 100
+
+
+class QueryResultsTruncatedError(Exception):
+    """This exception is raised when app search cannot return all results of a query because of its page limit."""
 
 
 def make_elastic_connection() -> Elasticsearch:
     """
-    Returns a connection with the ElasticSearch database
+    Returns a pooled connection with the ElasticSearch database.
+    The connection is long-lived: operators create it once in open() and close it in close().
     """
 
-    elastic_search_endpoint, username, password = config_store.get_many(
+    (
+        elastic_search_endpoint,
+        username,
+        password,
+        pool_size,
+        request_timeout
+    ) = config_store.get_many(
         "elastic.search.endpoint",
         "elastic.cloud.username",
-        "elastic.cloud.password"
+        "elastic.cloud.password",
+        "elastic.connection.pool.size",
+        "elastic.connection.request.timeout"
     )
 
-    connection = Elasticsearch(elastic_search_endpoint, basic_auth=(username, password))
+    connection = Elasticsearch(
+        elastic_search_endpoint,
+        basic_auth=(username, password),
+        connections_per_node=int(pool_size or 10),
+        request_timeout=float(request_timeout or 10)
+    )
 
     return connection
 
@@ -41,8 +71,12 @@ def make_elastic_app_search_connectpm() -> AppSearch:
     return app_search
 
 def get_document(entity_guid : str, app_search : AppSearch) -> dict:
-    """This function returns a document corresponding to the entity guid from elastic app search."""
-    
+    """This function returns a document corresponding to the entity guid from elastic app search, or from the document cache of the current event."""
+
+    document_cache = get_document_cache()
+    if document_cache is not None:
+        return document_cache.get(entity_guid)
+
     engine_name = config_store.get_many("elastic.app.search.engine.name")
 
     doc_list = app_search.get_documents(
@@ -51,43 +85,231 @@ def get_document(entity_guid : str, app_search : AppSearch) -> dict:
         return doc_list[0]
 
 
-def list_all_documents(app_search : AppSearch, engine_name : str = None, current_page: int = 1, page_size: int = 1000) -> list:
-    """This function lists all documents and returns the result"""
-    all_doc_list = []
+def iter_pages(fetch_page: Callable[[int], list], page_size: int, first_page: int = 1, last_page: Optional[int] = APP_SEARCH_MAX_PAGE) -> Iterator[list]:
+    """
+    This function yields the pages returned by fetch_page, starting at first_page, until a page holds fewer than page_size results or last_page is reached.
+    Without a last_page, pages are retrieved until a page holds fewer than page_size results.
+    The next page is retrieved in the background while the current page is being consumed.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        next_page = executor.submit(fetch_page, first_page)
+
+        for current_page in count(first_page):
+            page = next_page.result()
+
+            is_last_page = len(page) < page_size or current_page == last_page
+            if not is_last_page:
+                next_page = executor.submit(fetch_page, current_page + 1)
+
+            yield page
+
+            if is_last_page:
+                return
+
+
+def has_more_results(total_results: Optional[int], results_read: int) -> bool:
+    """
+    This function determines whether a query matched more results than were read, based on the total reported by app search.
+    In case app search does not report the total, the results are assumed to continue, since the last page read was full.
+    """
+    return total_results is None or total_results > results_read
+
+
+def add_filter(body: dict, extra_filter: dict) -> dict:
+    """This function returns a copy of the query body in which the given filter is combined with the filters of the body."""
+    filters = body.get("filters")
+    return {**body, "filters": {"all": [filters, extra_filter]} if filters else extra_filter}
+
+
+def iter_query_results(app_search: AppSearch, body: dict, engine_name: str = None, page_size: int = APP_SEARCH_MAX_PAGE_SIZE, partition_field: Optional[str] = None,
+                       current_page: int = 1) -> Iterator[dict]:
+    """
+    This function streams the results of a query to app search page by page, so memory use does not grow with the number of results.
+    App search returns at most 100 pages per query. In case a partition field is given, the results are sorted on it and
+    a query that runs out of pages is continued with a range filter starting at the last value seen.
+    The partition field must be a number or date field, since app search supports range filters on those only.
+    A QueryResultsTruncatedError is raised in case app search reports more results than fit in the pages it returns, and the remaining
+    results cannot be retrieved, i.e. when no partition field is given or when more than 100 pages of results share one value of the partition field.
+    """
+    meta = dict()
+
+    def search(query_body: dict) -> Callable[[int], list]:
+        def fetch_page(current_page: int) -> list:
+            response = app_search.search(engine_name=engine_name, body=query_body, current_page=current_page, page_size=page_size).body
+            meta["total_results"] = response.get("meta", {}).get("page", {}).get("total_results")
+            return response.get("results")
+        return fetch_page
+
+    if partition_field is None:
+        last_page, results_read = [], (current_page - 1) * page_size
+        for page in iter_pages(search(body), page_size, first_page=current_page):
+            last_page, results_read = page, results_read + len(page)
+            yield from page
+
+        if len(last_page) == page_size and has_more_results(meta["total_results"], results_read):
+            raise QueryResultsTruncatedError(
+                f"Query results on {engine_name} exceed {APP_SEARCH_MAX_PAGE} pages, configure elastic.app.search.partition.field to retrieve all results")
+        return
+
+    body = {**body, "sort": [{partition_field: "asc"}]}
+    partition_start = None
+    boundary_ids = set()
+
+    while True:
+        partition_body = body if partition_start is None else add_filter(body, {partition_field: {"from": partition_start}})
+
+        last_value, last_page = partition_start, []
+        pages_read = 0
+
+        for page in iter_pages(search(partition_body), page_size):
+            pages_read += 1
+            last_page = page
+
+            for result in page:
+                document_id = result["id"]["raw"]
+                value = result.get(partition_field, {}).get("raw")
+
+                # The range filter includes its start value, so results having that value were already yielded by the previous partition.
+                if value == partition_start and document_id in boundary_ids:
+                    continue
+
+                if value != last_value:
+                    last_value, boundary_ids = value, set()
+
+                boundary_ids.add(document_id)
+                yield result
 
-    doc_list = app_search.list_documents(
-        engine_name=engine_name, current_page = current_page, page_size = page_size)["results"]
+        if pages_read < APP_SEARCH_MAX_PAGE or len(last_page) < page_size or not has_more_results(meta["total_results"], pages_read * page_size):
+            return
 
-    while len(doc_list) != 0:
-        all_doc_list = all_doc_list + doc_list
+        if last_value == partition_start:
+            raise QueryResultsTruncatedError(
+                f"More than {APP_SEARCH_MAX_PAGE * page_size} results on {engine_name} have {partition_field} {last_value}, use a more selective partition field")
 
-        current_page = current_page + 1
-        doc_list = app_search.list_documents(
-            engine_name=engine_name, current_page=current_page)["results"]
+        partition_start = last_value
 
-    return all_doc_list
 
-def send_query(app_search : AppSearch, body: dict, engine_name: str = None, current_page: int = 1, page_size: int = 1000) -> list:
+def iter_query_ids(app_search: AppSearch, body: dict, engine_name: str = None, page_size: int = APP_SEARCH_MAX_PAGE_SIZE, partition_field: Optional[str] = None,
+                   current_page: int = 1) -> Iterator[str]:
+    """This function streams the ids of the documents matching a query to app search."""
+    for result in iter_query_results(app_search, {**body, "result_fields": {"id": {"raw": {}}, **({partition_field: {"raw": {}}} if partition_field else {})}},
+                                     engine_name=engine_name, page_size=page_size, partition_field=partition_field, current_page=current_page):
+        yield result["id"]["raw"]
+
+
+def iter_listed_documents(app_search: AppSearch, engine_name: str = None, current_page: int = 1, page_size: int = APP_SEARCH_MAX_LIST_PAGE_SIZE) -> Iterator[dict]:
+    """This function streams all documents of the engine through the list documents api, starting at current_page and reading pages until they run out."""
+
+    def fetch_page(page: int) -> list:
+        return app_search.list_documents(engine_name=engine_name, current_page=page, page_size=page_size)["results"]
+
+    for page in iter_pages(fetch_page, page_size, first_page=current_page, last_page=None):
+        yield from page
+
+
+def iter_all_documents(app_search: AppSearch, engine_name: str = None, page_size: Optional[int] = None, partition_field: Optional[str] = None) -> Iterator[dict]:
+    """
+    This function streams all documents of the engine.
+    In case a partition field is given or configured as elastic.app.search.partition.field, the documents are read with partitioned search queries
+    and the raw field values of the search results are returned as plain documents. Otherwise the documents are read through the list documents api.
+    """
+    if partition_field is None:
+        partition_field = config_store.get("elastic.app.search.partition.field")
+
+    if partition_field is None:
+        yield from iter_listed_documents(app_search, engine_name=engine_name, page_size=page_size or APP_SEARCH_MAX_LIST_PAGE_SIZE)
+        return
+
+    for result in iter_query_results(app_search, {"query": ""}, engine_name=engine_name, page_size=page_size or APP_SEARCH_MAX_PAGE_SIZE, partition_field=partition_field):
+        yield {key: value.get("raw") for key, value in result.items() if key != "_meta"}
+
+
+def list_all_documents(app_search : AppSearch, engine_name : str = None, current_page: int = 1, page_size: int = APP_SEARCH_MAX_LIST_PAGE_SIZE) -> list:
+    """This function lists all documents and returns the result. Use iter_all_documents to process large engines document by document."""
+    return list(iter_listed_documents(app_search, engine_name=engine_name, current_page=current_page, page_size=page_size))
+
+def send_query(app_search : AppSearch, body: dict, engine_name: str = None, current_page: int = 1, page_size: int = APP_SEARCH_MAX_PAGE_SIZE, partition_field: Optional[str] = None) -> list:
     """This function sends a query to the app search and returns a list of retrieved document ids."""
-    # engine_name = config_store.get_many("elastic.app.search.engine.name")
-    
-    documents = app_search.search(engine_name = engine_name, body = body, current_page = current_page, page_size = page_size).body.get("results")
-    
-    result =  [document["id"].get("raw") for document in documents]
-
-    if len(result) >= page_size:
-        result += send_query(
-            app_search = app_search,
-            engine_name = engine_name,
-            body = body,
-            current_page = current_page + 1,
-            page_size = page_size
-        )
-    return result
+    if partition_field is None:
+        partition_field = config_store.get("elastic.app.search.partition.field")
+
+    return list(iter_query_ids(app_search, body, engine_name=engine_name, page_size=page_size, partition_field=partition_field, current_page=current_page))
 
 def get_documents(app_search : AppSearch, engine_name : str, entity_guid_list: list) -> list:
-    """This function returns a list of documents having the input guids as ids."""
-    
+    """This function returns a list of documents having the input guids as ids. Within an event the documents are served from its document cache."""
+
+    document_cache = get_document_cache()
+    if document_cache is not None:
+        return document_cache.get_many(entity_guid_list)
+
     documents_list = app_search.get_documents(
         engine_name=engine_name, document_ids=entity_guid_list)
-    return documents_list
\ No newline at end of file
+    return documents_list
+
+
+def iter_chunks(items: Iterable, chunk_size: int) -> Iterator[list]:
+    """This function yields consecutive lists of at most chunk_size items, consuming the given iterable lazily."""
+    iterator = iter(items)
+    chunk = list(islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, chunk_size))
+
+
+def iter_documents(app_search: AppSearch, engine_name: str, document_ids: Iterable[str], max_workers: int = 4, chunk_size: int = APP_SEARCH_MAX_BATCH_SIZE) -> Iterator[dict]:
+    """
+    This function streams the documents having the given ids, which may be a lazy iterable such as the result of iter_query_ids.
+    The ids are retrieved in chunks of at most 100, with at most max_workers requests in flight, and documents are yielded as their chunk arrives.
+    Documents that do not exist are skipped. Within an event, cached documents are served from the document cache and
+    retrieved documents are streamed through it, so they are not held in memory once they are handled.
+    """
+    document_cache = get_document_cache()
+    documents = iter_retrieved_documents(app_search, engine_name, document_ids, document_cache, max_workers, chunk_size)
+
+    if document_cache is not None:
+        return document_cache.stream(documents)
+
+    return documents
+
+
+def iter_retrieved_documents(app_search: AppSearch, engine_name: str, document_ids: Iterable[str], document_cache: Optional[DocumentCache],
+                             max_workers: int, chunk_size: int) -> Iterator[dict]:
+    """This function retrieves the documents for iter_documents. Documents in the given document cache are not retrieved again."""
+    seen = set()
+    cached: List[Optional[dict]] = []
+    pending = set()
+
+    def missing_ids() -> Iterator[str]:
+        for document_id in document_ids:
+            if document_id in seen:
+                continue
+            seen.add(document_id)
+
+            if document_cache is not None and document_id in document_cache.documents:
+                cached.append(document_cache.documents[document_id])
+            else:
+                yield document_id
+
+    def fetch(chunk: List[str]) -> list:
+        return app_search.get_documents(engine_name=engine_name, document_ids=chunk)
+
+    def collect(futures) -> Iterator[dict]:
+        for future in futures:
+            yield from filter(None, future.result())
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for chunk in iter_chunks(missing_ids(), chunk_size):
+            yield from filter(None, cached)
+            cached.clear()
+
+            pending.add(executor.submit(fetch, chunk))
+
+            if len(pending) >= max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from collect(done)
+
+        yield from filter(None, cached)
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            yield from collect(done)
@@ -1,13 +1,19 @@
 import asyncio
 import logging
-from typing import Callable, Dict, List, Optional, Union
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Union
 
-from m4i_atlas_core import (ConfigStore, Entity, EntityDef, get_type_def, get_keycloak_token)
+from m4i_atlas_core import (ConfigStore, Entity, EntityDef, get_type_def)
 from m4i_atlas_core.entities.atlas.core.relationship.Relationship import Relationship
 from elastic_enterprise_search import AppSearch
 from .HierarchyMapping import hierarchy_mapping
 from .parameters import *
-from .elastic import get_document, send_query, get_documents
+from .elastic import get_document, send_query, get_documents, iter_query_ids, iter_documents
+from .SuperTypeCache import super_type_cache
+from .SchemaCache import get_schema_keys
+from .HierarchyIndex import hierarchy_index
+from .DocumentCache import get_document_cache
+from .derived_fields import get_derived_fields, is_derived_field, select_inherited_fields
+from ..KeycloakTokenProvider import call_with_access_token
 
 ActionHandler = Callable[[Optional[Union[Entity, Relationship]]], None]
 logger = logging.getLogger(__name__)
@@ -18,18 +24,17 @@ update_attributes = [definition, email]
 
 engine_name = config.get_many("elastic.app.search.engine.name")
 
-updated_docs: Dict[str, dict] = dict()
-breadcrumb_dict: Dict[str, list] = dict()
-derived_entity_dict: Dict[str, list] = dict()
-docs_dict: Dict[str, dict] = dict()
-
 
 async def get_super_types(input_type: str) -> List[EntityDef]:
-    """This function returns all supertypes of the input type given"""
-    access_token = get_keycloak_token()
-    entity_def = await get_type_def(input_type, access_token=access_token)
+    """This function returns all supertypes of the input type given. Resolved chains are served from the super type cache."""
+    cached_super_types = super_type_cache.get(input_type)
+    if cached_super_types is not None:
+        return cached_super_types
+
+    entity_def = await call_with_access_token(get_type_def, input_type)
 
     if len(entity_def.super_types) == 0:
+        super_type_cache.put(input_type, [entity_def])
         return [entity_def]
 
     requests = [
@@ -44,6 +49,7 @@ async def get_super_types(input_type: str) -> List[EntityDef]:
         for super_type in response
     ]
 
+    super_type_cache.put(input_type, [entity_def, *super_types])
     return [entity_def, *super_types]
 # END get_super_types
 
@@ -64,7 +70,7 @@ def get_source_type_from_app_search(input_document: dict) -> list:
     return input_document.get("m4isourcetype")
 
 
-def fill_in_dq_scores(schema_keys: list, input_document : dict) -> dict:
+def fill_in_dq_scores(schema_keys: Iterable[str], input_document : dict) -> dict:
     """This function fills in and sets all dq scores to zero in the given document and returns the  updated document."""
     for key in schema_keys:
         if key.startswith("dq_score"):
@@ -98,9 +104,10 @@ def get_m4i_source_types(super_types : list) -> list:
                     data_attribute, field, dataset, collection, system]
     return list(filter(lambda super_type: super_type in source_types, super_types))
 
-def get_child_entity_docs(entity_guid : str, app_search : AppSearch, engine_name : str = None):
-
-    engine_name = config.get_many("elastic.app.search.engine.name")
+def get_descendant_guids(entity_guid : str, app_search : AppSearch, engine_name : str = None) -> Iterable[str]:
+    """This function returns the guids of all entities having the given entity in their breadcrumb, from the hierarchy index or else from app search."""
+    if hierarchy_index.loaded and entity_guid in hierarchy_index:
+        return hierarchy_index.get_subtree(entity_guid)
 
     body = {
         "query":"",
@@ -111,8 +118,16 @@ def get_child_entity_docs(entity_guid : str, app_search : AppSearch, engine_name
         }
     }
 
-    breadcrumb_guid_list = send_query(app_search=app_search, body = body, engine_name = engine_name)
-    return get_documents(app_search, engine_name, breadcrumb_guid_list)
+    return iter_query_ids(app_search=app_search, body = body, engine_name = engine_name, partition_field = config.get("elastic.app.search.partition.field"))
+
+def get_child_entity_docs(entity_guid : str, app_search : AppSearch, engine_name : str = None) -> Iterator[dict]:
+    """This function streams the documents of all entities having the given entity in their breadcrumb. The documents are retrieved in parallel chunks."""
+
+    engine_name = config.get_many("elastic.app.search.engine.name")
+    fetch_workers = config.get("elastic.app.search.fetch.workers")
+
+    breadcrumb_guids = get_descendant_guids(entity_guid, app_search, engine_name)
+    return iter_documents(app_search, engine_name, breadcrumb_guids, max_workers = int(fetch_workers or 4))
 
 async def is_parent_child_relationship(input_document : dict, relationship_key :str, input_relationship : dict):
     """This function determines whether the entity belonging to the input document and the entity corresponding to the end point of the relationship are a parent child pair."""
@@ -229,7 +244,7 @@ async def get_parent_child_entity_guid(doc, key, input_relationship):
 
 
 def insert_prefix_to_breadcrumbs_of_child_entities(doc, child_entity_docs):
-    """This function updates the breadcrumb of all child entity documents and returns the updated documents in case of an inserted relationship."""
+    """This function updates the breadcrumb of each child entity document in case of an inserted relationship and yields the updated documents."""
     for child_doc in child_entity_docs:
         if doc[guid] not in child_doc["breadcrumbguid"]:
 
@@ -241,11 +256,11 @@ def insert_prefix_to_breadcrumbs_of_child_entities(doc, child_entity_docs):
         if doc["typename"] not in child_doc["breadcrumbtype"]:
             child_doc["breadcrumbtype"].insert(0, doc["typename"])
 
-    return child_entity_docs
+        yield child_doc
 
 
 def delete_prefix_from_breadcrumbs_of_child_entities(doc, child_entity_docs):
-    """This function updates the breadcrumb of all child entity documents and returns the updated documents in case of a deleted relationship."""
+    """This function updates the breadcrumb of each child entity document in case of a deleted relationship and yields the updated documents."""
     for child_doc in child_entity_docs:
         if doc[guid] in child_doc["breadcrumbguid"]:
             guid_index = child_doc["breadcrumbguid"].index(doc[guid])
@@ -257,23 +272,49 @@ def delete_prefix_from_breadcrumbs_of_child_entities(doc, child_entity_docs):
         if doc["typename"] in child_doc["breadcrumbtype"]:
             child_doc["breadcrumbtype"] = child_doc["breadcrumbtype"][guid_index::]
 
-    return child_entity_docs
+        yield child_doc
 
 
-def update_derived_entity_fields_of_child_entities(doc, child_entity_docs):
-    """This function updates the derived entity fields of all child entity documents and returns the updated documents"""
+def write_document(doc, updated_docs: Dict[str, dict]):
+    """
+    This function hands a changed document over to the document cache of the current event. Documents that are streamed, such as
+    the documents of a subtree, are passed on as soon as they are changed, so they are not collected in memory.
+    Without a document cache, the document is collected in updated_docs.
+    """
+    document_cache = get_document_cache()
+
+    if document_cache is None:
+        updated_docs[doc[guid]] = doc
+    else:
+        document_cache.write(doc)
+
+
+def get_changed_derived_fields(doc) -> List[str]:
+    """This function returns the derived fields of the document that changed while handling the current event, or all its derived fields in case that is unknown."""
+    document_cache = get_document_cache()
+    patch = document_cache.get_patch(doc[guid]) if document_cache is not None else None
+    field_names = patch.keys() if patch is not None else doc.keys()
+    return [key for key in field_names if is_derived_field(key)]
+
+
+def update_derived_entity_fields_of_child_entities(doc, child_entity_docs, field_names: Optional[Iterable[str]] = None):
+    """
+    This function updates the derived entity fields of each child entity document and yields the updated documents.
+    Only the given fields, by default all derived fields of the document, are copied, and only to children that inherit them according to the propagation table.
+    """
+    field_names = list(doc.keys() if field_names is None else field_names)
+
     for child_doc in child_entity_docs:
-        for key in doc:
-            if key.startswith("derived"):
-                child_doc[key] = doc[key]
+        for key in select_inherited_fields(child_doc, field_names):
+            child_doc[key] = doc.get(key)
 
-    return child_entity_docs
+        yield child_doc
 
 
 def delete_derived_entities(doc, parent_entity_guid, app_search):
     parent_entity_doc = get_document(parent_entity_guid, app_search)
-    for key in parent_entity_doc:
-        if key.startswith("derived") and parent_entity_doc.get(key) == doc.get(key):
+    for key in select_inherited_fields(doc, parent_entity_doc):
+        if parent_entity_doc.get(key) == doc.get(key):
             if type(doc[key]) == list:
                 doc[key] = []
             else:
@@ -283,8 +324,8 @@ def delete_derived_entities(doc, parent_entity_guid, app_search):
 
 def update_derived_entiies(doc, parent_entity_guid, app_search):
     parent_entity_doc = get_document(parent_entity_guid, app_search)
-    for key in parent_entity_doc:
-        if key.startswith("derived") and parent_entity_doc.get(key):
+    for key in select_inherited_fields(doc, parent_entity_doc):
+        if parent_entity_doc.get(key):
             doc[key] = parent_entity_doc[key]
     return doc
 
@@ -334,8 +375,7 @@ def delete_breadcrumb(new_doc, parent_entity_guid, app_search):
 async def handle_inserted_relationships(entity_message, new_input_entity, inserted_relationships, app_search, doc=None):
     updated_docs: Dict[str, dict] = dict()
     engine_name = config.get("elastic_search_index")
-    schema_keys = sorted(
-        list(app_search.get_schema(engine_name=engine_name).keys()))
+    schema_keys = get_schema_keys(app_search, engine_name)
     input_entity_guid = new_input_entity.guid
     parent_child_dict = dict()
 
@@ -368,21 +408,25 @@ async def handle_inserted_relationships(entity_message, new_input_entity, insert
                 child_docs = insert_prefix_to_breadcrumbs_of_child_entities(
                     doc, child_docs)
                 child_docs = update_derived_entity_fields_of_child_entities(
-                    doc, child_docs)
+                    doc, child_docs, get_changed_derived_fields(doc))
 
                 for child_doc in child_docs:
-                    updated_docs[child_doc[guid]] = child_doc
+                    write_document(child_doc, updated_docs)
 
             if is_governance_role_relationship(key):
                 doc = update_governance_role_derived_entity_fields(
                     doc, key, new_input_entity)
-                child_docs = get_child_entity_docs(
-                    input_entity_guid, app_search, engine_name)
-                child_docs = update_derived_entity_fields_of_child_entities(
-                    doc, child_docs)
+                changed_derived_fields = get_changed_derived_fields(doc)
 
-                for child_doc in child_docs:
-                    updated_docs[child_doc[guid]] = child_doc
+                # The children are only retrieved in case a derived field they inherit changed.
+                if changed_derived_fields:
+                    child_docs = get_child_entity_docs(
+                        input_entity_guid, app_search, engine_name)
+                    child_docs = update_derived_entity_fields_of_child_entities(
+                        doc, child_docs, changed_derived_fields)
+
+                    for child_doc in child_docs:
+                        write_document(child_doc, updated_docs)
 
             if await is_attribute_field_relationship(doc, inserted_relationship):
 
@@ -400,8 +444,7 @@ async def handle_inserted_relationships(entity_message, new_input_entity, insert
 
 async def handle_deleted_relationships(entity_message, input_entity, deleted_relationships, app_search, doc=None):
     updated_docs: Dict[str, dict] = dict()
-    schema_keys = sorted(
-        list(app_search.get_schema(engine_name=engine_name).keys()))
+    schema_keys = get_schema_keys(app_search, engine_name)
     input_entity_guid = input_entity.guid
     parent_child_dict = dict()
 
@@ -434,21 +477,25 @@ async def handle_deleted_relationships(entity_message, input_entity, deleted_rel
                 child_docs = delete_prefix_from_breadcrumbs_of_child_entities(
                     doc, child_docs)
                 child_docs = update_derived_entity_fields_of_child_entities(
-                    doc, child_docs)
+                    doc, child_docs, get_changed_derived_fields(doc))
 
                 for child_doc in child_docs:
-                    updated_docs[child_doc[guid]] = child_doc
+                    write_document(child_doc, updated_docs)
 
             if is_governance_role_relationship(key):
                 doc = update_governance_role_derived_entity_fields(
                     doc, key, input_entity)
-                child_docs = get_child_entity_docs(
-                    input_entity_guid, app_search, engine_name)
-                child_docs = update_derived_entity_fields_of_child_entities(
-                    doc, child_docs)
+                changed_derived_fields = get_changed_derived_fields(doc)
 
-                for child_doc in child_docs:
-                    updated_docs[child_doc[guid]] = child_doc
+                # The children are only retrieved in case a derived field they inherit changed.
+                if changed_derived_fields:
+                    child_docs = get_child_entity_docs(
+                        input_entity_guid, app_search, engine_name)
+                    child_docs = update_derived_entity_fields_of_child_entities(
+                        doc, child_docs, changed_derived_fields)
+
+                    for child_doc in child_docs:
+                        write_document(child_doc, updated_docs)
 
             if is_attribute_field_relationship(doc, deleted_relationship):
 
@@ -468,6 +515,15 @@ def define_breadcrumb(new_doc, parent_entity_guid, app_search):
     """This function defines the breadcrumb of a entity given that its parent entity has a correct guid defined."""
     if not parent_entity_guid:
         return new_doc
+
+    parent_node = hierarchy_index.get(parent_entity_guid) if hierarchy_index.loaded else None
+    if parent_node is not None and parent_node.name is not None:
+        guids, names, type_names = hierarchy_index.get_breadcrumb(parent_entity_guid)
+        new_doc["breadcrumbguid"] = guids + [parent_entity_guid]
+        new_doc["breadcrumbname"] = names + [parent_node.name]
+        new_doc["breadcrumbtype"] = type_names + [parent_node.type_name]
+        return new_doc
+
     parent_entity_doc = get_document(parent_entity_guid, app_search)
     if parent_entity_doc:
         new_doc["breadcrumbguid"] = parent_entity_doc["breadcrumbguid"] + \
@@ -493,8 +549,7 @@ def handle_updated_attributes(entity_message, input_entity, updated_attributes,
     This function returns a dictionary with all updated documents as output with the following structure: guid -> app search document"""
 
     updated_docs: Dict[str, dict] = dict()
-    schema_keys = sorted(
-        list(app_search.get_schema(engine_name=engine_name).keys()))
+    schema_keys = get_schema_keys(app_search, engine_name)
     input_entity_guid = input_entity.guid
 
     if not doc:
@@ -530,8 +585,7 @@ def handle_deleted_attributes(entity_message, input_entity, deleted_attributes,
     This function returns a dictionary with all updated documents as output with the following structure: guid -> app search document"""
 
     updated_docs: Dict[str, dict] = dict()
-    schema_keys = sorted(
-        list(app_search.get_schema(engine_name=engine_name).keys()))
+    schema_keys = get_schema_keys(app_search, engine_name)
     input_entity_guid = input_entity.guid
 
     if not doc:
@@ -567,8 +621,7 @@ async def create_doc(entity_message, app_search) -> dict:
     The output document has the standard fields that could be infered directly from the entity message filled in.
     The dq scores are all equal to zero"""
 
-    schema_keys = sorted(
-        list(app_search.get_schema(engine_name=engine_name).keys()))
+    schema_keys = get_schema_keys(app_search, engine_name)
     new_doc = {}
 
     input_entity = entity_message.new_value
@@ -600,38 +653,15 @@ def update_name_in_breadcrumbs(input_entity_name: str, current_doc, app_search,
     doc_entity_name = current_doc[name]
     doc_entity_guid = current_doc[guid]
 
-    # This is the old query:
+    breadcrumb_guid_list = get_descendant_guids(doc_entity_guid, app_search, engine_name)
 
-    # results = app_search.search(engine_name = engine_name, body = {
-    # "query":"",
-    # "filters":{
-    #    breadcrumb_guid:[
-    #         doc_entity_guid
-    #     ]
-    # }
-    # }).body.get("results")
-
-    # breadcrumb_guid_list = [result["id"].get("raw") for result in results]
-
-    results = app_search.search(engine_name=engine_name, query=doc_entity_guid, options={
-        {
-            "search_fields": {breadcrumb_guid: {}}
-        }
-    }).get("results")
-
-    breadcrumb_guid_list = [result["id"].get("raw") for result in results]
-
-    if len(breadcrumb_guid_list) == 0:
-        return updated_docs
-
-    for entity_guid in breadcrumb_guid_list:
-        doc = get_document(entity_guid, app_search)
+    for doc in iter_documents(app_search, engine_name, breadcrumb_guid_list):
         if breadcrumb_guid in doc.keys() and doc_entity_guid in doc[breadcrumb_guid]:
 
             if breadcrumb_name in doc.keys() and doc_entity_name in doc[breadcrumb_name]:
                 doc[breadcrumb_name] = [input_entity_name if entity_name ==
                                         doc_entity_name else entity_name for entity_name in doc[breadcrumb_name]]
-                updated_docs[doc[guid]] = doc
+                write_document(doc, updated_docs)
 
     return updated_docs
 
@@ -643,82 +673,26 @@ def update_name_in_derived_entity_fields(input_entity, current_doc, app_search,
     input_entity_name = input_entity.attributes.unmapped_attributes[name]
     input_entity_guid = input_entity.guid
 
-    input_entity_data_type = input_entity.type_name
-    # This is the old approach. An alternative approach is to loop over all document fiels having "derived"as prefix. Adjusting this has the lowest priorty.
-    if input_entity_data_type == data_domain:
-        derived_types = [derived_data_domain]
-        derived_guids = [derived_data_domain_guid]
-
-    elif input_entity_data_type == data_entity:
-        derived_types = [derived_data_entity, derived_entity_names]
-        derived_guids = [derived_data_entity_guid, derived_entity_guids]
-
-    elif input_entity_data_type == data_attribute:
-        derived_types = [derived_data_attribute]
-        derived_guids = [derived_data_attribute_guid]
-
-    elif input_entity_data_type == system:
-        derived_types = [derived_system]
-        derived_guids = [derived_system_guid]
-
-    elif input_entity_data_type == collection:
-        derived_types = [derived_collection]
-        derived_guids = [derived_collection_guid]
-
-    elif input_entity_data_type == dataset:
-        derived_types = [derived_dataset, derived_dataset_names]
-        derived_guids = [derived_dataset_guid, derived_dataset_guids]
-
-    elif input_entity_data_type == field:
-        derived_types = [derived_field]
-        derived_guids = [derived_field_guid]
-
-    elif input_entity_data_type == person:
-        derived_types = [derived_person]
-        derived_guids = [derived_person_guid]
-
-    # This is the old query:
-
-    # results = app_search.search(engine_name = engine_name, body =
-    # {   "query":"",
-    #     "filters":{
-    #         "any" :
-    #         [
-    #             {derived_data_domain_guid:      [doc_entity_guid]},
-    #             {derived_data_entity_guid:      [doc_entity_guid]},
-    #             {derived_entity_guids:          [doc_entity_guid]},
-    #             {derived_data_attribute_guid:   [doc_entity_guid]},
-    #             {derived_system_guid:           [doc_entity_guid]},
-    #             {derived_collection_guid:       [doc_entity_guid]},
-    #             {derived_dataset_guid:          [doc_entity_guid]},
-    #             {derived_dataset_guids:         [doc_entity_guid]},
-    #             {derived_field_guid:            [doc_entity_guid]},
-    #             {derived_person_guid:           [doc_entity_guid]}
-    #         ]
-    #     }
-    # }).body.get("results")
-
-    results = app_search.search(engine_name=engine_name, query=doc_entity_guid, options={
-        "search_fields":    {derived_data_domain_guid:     {},
-                             derived_data_entity_guid:      {},
-                             derived_entity_guids:          {},
-                             derived_data_attribute_guid:   {},
-                             derived_system_guid:           {},
-                             derived_collection_guid:       {},
-                             derived_dataset_guid:          {},
-                             derived_dataset_guids:         {},
-                             derived_field_guid:            {},
-                             derived_person_guid:           {}}
-    }).get("results")
-
-    derived_entity_guid_list = [result["id"].get("raw") for result in results]
-
-    if len(derived_entity_guid_list) == 0:
+    derived_fields = get_derived_fields(input_entity.type_name)
+    derived_types = [derived_field.name_field for derived_field in derived_fields]
+    derived_guids = [derived_field.guid_field for derived_field in derived_fields]
+
+    if len(derived_fields) == 0:
         return updated_docs
 
-    for entity_guid in derived_entity_guid_list:
-        doc = get_document(entity_guid, app_search)
+    # Only the derived guid fields of the type of the entity can hold its guid, so the filter is limited to those.
+    body = {
+        "query": "",
+        "filters": {
+            "any": [
+                {derived_guid_field: [doc_entity_guid]} for derived_guid_field in derived_guids
+            ]
+        }
+    }
 
+    derived_entity_guid_list = iter_query_ids(app_search, body, engine_name=engine_name, partition_field=config.get("elastic.app.search.partition.field"))
+
+    for doc in iter_documents(app_search, engine_name, derived_entity_guid_list):
         for index in range(len(derived_types)):
             derived_type_field = derived_types[index]
             derived_guid_field = derived_guids[index]
@@ -733,7 +707,7 @@ def update_name_in_derived_entity_fields(input_entity, current_doc, app_search,
 
                 if(entity_guid_index == entity_name_index):
                     doc[derived_type_field][entity_name_index] = input_entity_name
-                    updated_docs[doc[guid]] = doc
+                    write_document(doc, updated_docs)
 
                 else:
                     print(
@@ -761,4 +735,71 @@ def get_parent_entity_guid(input_entity : Entity):
                 print(f"several parent entities are found for the input entit: {input_entity}.")
                 # The code should never reach this part!
             else:
-                return val[0]["guid"]
\ No newline at end of file
+                return val[0]["guid"]
+
+def get_related_entities(entity_message) -> Dict[str, Optional[str]]:
+    """This function returns the guids of the entity and of all entities at the other end of its inserted or deleted relationships, mapped to their type names."""
+    related_entities = {entity_message.guid: entity_message.type_name}
+
+    for relationships in [entity_message.inserted_relationships, entity_message.deleted_relationships]:
+        for relationship_list in (relationships or {}).values():
+            for relationship in relationship_list or []:
+                if relationship.get(guid):
+                    related_entities[relationship[guid]] = relationship.get("typeName")
+
+    return related_entities
+
+
+async def prefetch_entity_message(entity_message, app_search):
+    """
+    This function retrieves the app search documents, the type definitions and the engine schema the handlers of the entity message need, concurrently.
+    Failures are ignored here, since the handlers retrieve whatever is missing again and report the error.
+    """
+    loop = asyncio.get_running_loop()
+    related_entities = get_related_entities(entity_message)
+
+    lookups = [
+        get_super_types_names(type_name)
+        for type_name in set(related_entities.values()) if type_name
+    ]
+    lookups.append(loop.run_in_executor(None, get_schema_keys, app_search, engine_name))
+
+    document_cache = get_document_cache()
+    if document_cache is not None:
+        lookups.append(loop.run_in_executor(None, document_cache.fetch, list(related_entities.keys())))
+
+    await asyncio.gather(*lookups, return_exceptions=True)
+
+
+async def handle_entity_message(entity_message, app_search):
+    """
+    This function applies the entity message to the app search documents. The documents, type definitions and schema are retrieved concurrently first.
+    The handlers then run in order, since later handlers build on the document changes of earlier ones, and all changed documents are collected in the document cache.
+    This function must be called within a document_cache_scope.
+    """
+    document_cache = get_document_cache()
+    entity_doc = None
+
+    await prefetch_entity_message(entity_message, app_search)
+
+    if entity_message.event_type == "EntityCreated":
+        entity_doc = await create_doc(entity_message, app_search)
+        document_cache.put(entity_doc)
+
+    if entity_message.inserted_attributes != []:
+        document_cache.mark_dirty(handle_updated_attributes(entity_message, entity_message.new_value, entity_message.inserted_attributes, app_search, entity_doc))
+
+    if entity_message.changed_attributes != []:
+        document_cache.mark_dirty(handle_updated_attributes(entity_message, entity_message.new_value, entity_message.changed_attributes, app_search))
+
+    if entity_message.deleted_attributes != []:
+        document_cache.mark_dirty(handle_deleted_attributes(entity_message, entity_message.new_value, entity_message.deleted_attributes, app_search, entity_doc))
+
+    if entity_message.deleted_relationships != {}:
+        document_cache.mark_dirty(await handle_deleted_relationships(entity_message, entity_message.old_value, entity_message.deleted_relationships, app_search, entity_doc))
+
+    if entity_message.inserted_relationships != {}:
+        document_cache.mark_dirty(await handle_inserted_relationships(entity_message, entity_message.new_value, entity_message.inserted_relationships, app_search, entity_doc))
+
+    if entity_message.event_type == "EntityDeleted":
+        document_cache.discard(entity_message.guid)
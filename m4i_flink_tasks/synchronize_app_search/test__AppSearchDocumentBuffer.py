@@ -0,0 +1,173 @@
+import threading
+import time
+
+import pytest
+from mock import MagicMock
+
+from .AppSearchDocumentBuffer import AppSearchDocumentBuffer
+
+
+def make_buffer(**kwargs):
+    app_search = MagicMock()
+    app_search.index_documents.side_effect = lambda engine_name, documents: [
+        {"id": document["id"], "errors": []} for document in documents
+    ]
+    return AppSearchDocumentBuffer(app_search, "test-engine", **kwargs), app_search
+# END make_buffer
+
+
+class SlowAppSearch(object):
+    """This fake app search client stores the documents it receives, and holds its first request for a while before storing them."""
+
+    def __init__(self, delay: float = 0.1):
+        self.delay = delay
+        self.documents = dict()
+        self.first_request_started = threading.Event()
+
+    def index_documents(self, engine_name, documents):
+        if not self.first_request_started.is_set():
+            self.first_request_started.set()
+            time.sleep(self.delay)
+        for document in documents:
+            self.documents[document["id"]] = document
+        return [{"id": document["id"], "errors": []} for document in documents]
+# END SlowAppSearch
+
+
+def test__later_update_replaces_earlier_update():
+    buffer, app_search = make_buffer()
+
+    buffer.index({"id": "a", "name": "first"})
+    buffer.index({"id": "a", "name": "second"})
+
+    assert len(buffer) == 1
+
+    buffer.flush()
+
+    app_search.index_documents.assert_called_once_with(
+        engine_name="test-engine", documents=[{"id": "a", "name": "second"}])
+# END test__later_update_replaces_earlier_update
+
+
+def test__flush_writes_chunks_of_at_most_100_documents():
+    buffer, app_search = make_buffer(flush_size=1000)
+
+    for index in range(250):
+        buffer.index({"id": str(index)})
+
+    buffer.flush()
+
+    chunk_sizes = [len(call.kwargs["documents"])
+                   for call in app_search.index_documents.call_args_list]
+    assert chunk_sizes == [100, 100, 50]
+    assert len(buffer) == 0
+# END test__flush_writes_chunks_of_at_most_100_documents
+
+
+def test__delete_discards_pending_update():
+    buffer, app_search = make_buffer()
+
+    buffer.index({"id": "a"})
+    buffer.delete("a")
+    buffer.flush()
+
+    app_search.index_documents.assert_not_called()
+    app_search.delete_documents.assert_called_once_with(
+        engine_name="test-engine", document_ids=["a"])
+# END test__delete_discards_pending_update
+
+
+def test__should_flush_on_size():
+    buffer, _ = make_buffer(flush_size=2, flush_interval=3600)
+
+    buffer.index({"id": "a"})
+    assert not buffer.should_flush()
+
+    buffer.index({"id": "b"})
+    assert buffer.should_flush()
+# END test__should_flush_on_size
+
+
+def test__failed_write_keeps_documents_in_buffer():
+    buffer, app_search = make_buffer()
+    app_search.index_documents.side_effect = ConnectionError()
+
+    buffer.index({"id": "a"})
+
+    with pytest.raises(ConnectionError):
+        buffer.flush()
+
+    assert len(buffer) == 1
+# END test__failed_write_keeps_documents_in_buffer
+
+
+def test__patches_are_merged_and_sent_with_put_documents():
+    buffer, app_search = make_buffer()
+    app_search.put_documents.side_effect = lambda engine_name, documents: [
+        {"id": document["id"], "errors": []} for document in documents
+    ]
+
+    buffer.patch({"id": "a", "breadcrumbname": ["x"]})
+    buffer.patch({"id": "a", "derivedsystem": ["y"]})
+    buffer.flush()
+
+    app_search.index_documents.assert_not_called()
+    app_search.put_documents.assert_called_once_with(
+        engine_name="test-engine", documents=[{"id": "a", "breadcrumbname": ["x"], "derivedsystem": ["y"]}])
+# END test__patches_are_merged_and_sent_with_put_documents
+
+
+def test__patch_is_applied_to_pending_document():
+    buffer, app_search = make_buffer()
+
+    buffer.index({"id": "a", "name": "A", "breadcrumbname": []})
+    buffer.patch({"id": "a", "breadcrumbname": ["x"]})
+    buffer.delete("b")
+    buffer.patch({"id": "b", "name": "B"})
+    buffer.flush()
+
+    app_search.put_documents.assert_not_called()
+    app_search.index_documents.assert_called_once_with(
+        engine_name="test-engine", documents=[{"id": "a", "name": "A", "breadcrumbname": ["x"]}])
+# END test__patch_is_applied_to_pending_document
+
+
+def test__drain_returns_pending_changes_without_writing():
+    buffer, app_search = make_buffer()
+
+    buffer.index({"id": "a"})
+    buffer.patch({"id": "b", "name": "b"})
+    buffer.delete("c")
+
+    changes = buffer.drain()
+
+    assert changes == [
+        {"action": "index", "id": "a", "document": {"id": "a"}},
+        {"action": "patch", "id": "b", "document": {"id": "b", "name": "b"}},
+        {"action": "delete", "id": "c"}
+    ]
+    assert len(buffer) == 0
+    assert not buffer.should_flush()
+    app_search.index_documents.assert_not_called()
+# END test__drain_returns_pending_changes_without_writing
+
+
+def test__concurrent_flushes_keep_the_latest_version():
+    app_search = SlowAppSearch()
+    buffer = AppSearchDocumentBuffer(app_search, "test-engine")
+
+    buffer.index({"id": "a", "name": "first"})
+    first_flush = threading.Thread(target=buffer.flush)
+    first_flush.start()
+    app_search.first_request_started.wait()
+
+    # The second flush starts while the first one is still writing the older version of the document.
+    buffer.index({"id": "a", "name": "second"})
+    second_flush = threading.Thread(target=buffer.flush)
+    second_flush.start()
+
+    first_flush.join()
+    second_flush.join()
+
+    assert app_search.documents["a"]["name"] == "second"
+# END test__concurrent_flushes_keep_the_latest_version
@@ -0,0 +1,128 @@
+from mock import MagicMock
+
+from .DocumentCache import document_cache_scope, get_document_cache
+from .elastic import get_document, get_documents
+
+STORED_DOCUMENTS = {
+    "a": {"id": "a", "name": "A"},
+    "b": {"id": "b", "name": "B"},
+    "c": {"id": "c", "name": "C"},
+}
+
+
+def make_app_search():
+    app_search = MagicMock()
+    app_search.get_documents.side_effect = lambda engine_name, document_ids: [
+        dict(STORED_DOCUMENTS[document_id]) if document_id in STORED_DOCUMENTS else None for document_id in document_ids
+    ]
+    return app_search
+# END make_app_search
+
+
+def test__repeated_reads_are_served_from_the_cache():
+    app_search = make_app_search()
+
+    with document_cache_scope(app_search, "test-engine"):
+        first = get_document("a", app_search)
+        first["name"] = "changed"
+
+        assert get_document("a", app_search)["name"] == "changed"
+        assert get_document("missing", app_search) is None
+        assert get_document("missing", app_search) is None
+
+    assert app_search.get_documents.call_count == 2
+    assert get_document_cache() is None
+# END test__repeated_reads_are_served_from_the_cache
+
+
+def test__misses_are_retrieved_in_one_request():
+    app_search = make_app_search()
+
+    with document_cache_scope(app_search, "test-engine") as document_cache:
+        get_document("a", app_search)
+        documents = get_documents(app_search, "test-engine", ["a", "b", "c", "b"])
+
+    assert [document["id"] for document in documents] == ["a", "b", "c", "b"]
+    assert document_cache.requests == 2
+    app_search.get_documents.assert_called_with(engine_name="test-engine", document_ids=["b", "c"])
+# END test__misses_are_retrieved_in_one_request
+
+
+def test__dirty_documents_are_tracked():
+    app_search = make_app_search()
+
+    with document_cache_scope(app_search, "test-engine") as document_cache:
+        document = get_document("a", app_search)
+        document["name"] = "changed"
+        document_cache.mark_dirty({"a": document})
+        document_cache.put({"id": "new", "name": "New"})
+        document_cache.put({"id": "b", "name": "deleted"})
+        document_cache.discard("b")
+
+    assert document_cache.dirty == {"a": {"id": "a", "name": "changed"}, "new": {"id": "new", "name": "New"}}
+    assert document_cache.get("new") == {"id": "new", "name": "New"}
+# END test__dirty_documents_are_tracked
+
+
+def test__get_patch_holds_changed_fields_only():
+    app_search = make_app_search()
+
+    with document_cache_scope(app_search, "test-engine") as document_cache:
+        document, _ = get_documents(app_search, "test-engine", ["a", "b"])
+        document["breadcrumbname"] = ["System"]
+        document_cache.put(document)
+        document_cache.put({"id": "new", "name": "New"})
+
+        assert document_cache.get_patch("a") == {"id": "a", "breadcrumbname": ["System"]}
+        assert document_cache.get_patch("b") == {"id": "b"}
+        assert document_cache.get_patch("new") is None
+# END test__get_patch_holds_changed_fields_only
+
+
+def test__streamed_document_is_only_held_while_it_is_handled():
+    app_search = make_app_search()
+    patches = []
+
+    with document_cache_scope(app_search, "test-engine", on_streamed=patches.append) as document_cache:
+        documents = document_cache.stream(dict(STORED_DOCUMENTS[document_id]) for document_id in ["a", "b"])
+
+        first = next(documents)
+        assert list(document_cache.streamed) == ["a"]
+
+        second = next(documents)
+        assert list(document_cache.streamed) == ["b"]
+
+        second["name"] = "changed"
+        document_cache.write(second)
+        assert list(documents) == []
+
+    assert first["id"] == "a"
+    assert patches == [{"id": "b", "name": "changed"}]
+    assert document_cache.streamed == {}
+    assert document_cache.dirty == {}
+# END test__streamed_document_is_only_held_while_it_is_handled
+
+
+def test__streamed_changes_are_seen_by_later_handlers():
+    app_search = make_app_search()
+    patches = []
+
+    def rewrite_subtree(document_cache, field, value):
+        # Every handler streams the subtree from app search again, as elastic.iter_documents does.
+        for document in document_cache.stream(dict(STORED_DOCUMENTS[document_id]) for document_id in ["a", "b"]):
+            document.setdefault("breadcrumb", []).append(value)
+            document[field] = value
+            document_cache.write(document)
+
+    with document_cache_scope(app_search, "test-engine", on_streamed=patches.append) as document_cache:
+        rewrite_subtree(document_cache, "name", "renamed")
+        rewrite_subtree(document_cache, "parent", "moved")
+
+        assert get_document("a", app_search)["breadcrumb"] == ["renamed", "moved"]
+
+    assert patches[2:] == [
+        {"id": "a", "breadcrumb": ["renamed", "moved"], "parent": "moved"},
+        {"id": "b", "breadcrumb": ["renamed", "moved"], "parent": "moved"},
+    ]
+    assert document_cache.streamed_changes["a"] == {"id": "a", "breadcrumb": ["renamed", "moved"], "name": "renamed", "parent": "moved"}
+# END test__streamed_changes_are_seen_by_later_handlers
@@ -0,0 +1,161 @@
+import json
+import sys
+
+import pytest
+
+from .ElasticBulkBuffer import ElasticBulkBuffer, get_bulk_action_size
+
+buffer_module = sys.modules[ElasticBulkBuffer.__module__]
+
+
+class FakeBulk(object):
+
+    def __init__(self, errors: list = None, error: Exception = None):
+        self.errors = errors or []
+        self.error = error
+        self.requests = []
+
+    def __call__(self, client, actions, **kwargs):
+        self.requests.append((list(actions), kwargs))
+        if self.error is not None:
+            raise self.error
+        actions, _ = self.requests[-1]
+        return len(actions) - len(self.errors), self.errors
+# END FakeBulk
+
+
+@pytest.fixture
+def failures():
+    return []
+# END failures
+
+
+def make_buffer(failures: list, **kwargs) -> ElasticBulkBuffer:
+    return ElasticBulkBuffer(None, "test-index", on_failure=lambda message, error: failures.append((message, error)), **kwargs)
+# END make_buffer
+
+
+def test__get_bulk_action_size_counts_action_and_source_lines():
+    document = {"name": "é"}
+
+    expected = len('{"index":{"_index":"test-index","_id":"a"}}\n') + len('{"name":"é"}\n'.encode("utf-8"))
+
+    assert get_bulk_action_size("test-index", "a", document) == expected
+# END test__get_bulk_action_size_counts_action_and_source_lines
+
+
+def test__flush_by_size(failures):
+    buffer = make_buffer(failures, flush_size=2, flush_interval=60)
+
+    buffer.add("a", {"id": "a"}, "message a")
+    assert buffer.should_flush() is False
+
+    buffer.add("b", {"id": "b"}, "message b")
+    assert buffer.should_flush() is True
+# END test__flush_by_size
+
+
+def test__flush_by_bytes_measures_the_documents(failures):
+    document = {"id": "a", "name": "x" * 100}
+    size = get_bulk_action_size("test-index", "a", document)
+    buffer = make_buffer(failures, flush_bytes=size + 1, flush_interval=60)
+
+    # The original message is short, only the serialized document reaches the byte limit.
+    buffer.add("a", document, "a")
+    assert buffer.should_flush() is False
+
+    buffer.add("b", {"id": "b"}, "b")
+    assert buffer.should_flush() is True
+# END test__flush_by_bytes_measures_the_documents
+
+
+def test__replaced_document_is_counted_once(failures):
+    document = {"id": "a", "name": "x" * 100}
+    size = get_bulk_action_size("test-index", "a", document)
+    buffer = make_buffer(failures, flush_bytes=size + 1, flush_interval=60)
+
+    buffer.add("a", document, "first")
+    buffer.add("a", document, "second")
+
+    assert len(buffer) == 1
+    assert buffer.should_flush() is False
+# END test__replaced_document_is_counted_once
+
+
+def test__flush_by_interval(monkeypatch, failures):
+    now = [100.0]
+    monkeypatch.setattr(buffer_module.time, "monotonic", lambda: now[0])
+    buffer = make_buffer(failures, flush_interval=1.0)
+
+    assert buffer.should_flush() is False
+
+    buffer.add("a", {"id": "a"}, "message a")
+    assert buffer.should_flush() is False
+
+    now[0] += 1.0
+    assert buffer.should_flush() is True
+# END test__flush_by_interval
+
+
+def test__flush_writes_buffered_documents(monkeypatch, failures):
+    bulk = FakeBulk()
+    monkeypatch.setattr(buffer_module.helpers, "bulk", bulk)
+    buffer = make_buffer(failures, flush_size=10, flush_bytes=1000)
+
+    buffer.add("a", {"id": "a"}, "message a")
+    buffer.add("b", {"id": "b"}, "message b")
+
+    assert buffer.flush() == 2
+    assert len(buffer) == 0
+    assert buffer.should_flush() is False
+
+    [(actions, kwargs)] = bulk.requests
+    assert actions == [
+        {"_op_type": "index", "_index": "test-index", "_id": "a", "_source": {"id": "a"}},
+        {"_op_type": "index", "_index": "test-index", "_id": "b", "_source": {"id": "b"}},
+    ]
+    assert kwargs["chunk_size"] == 10
+    assert kwargs["max_chunk_bytes"] == 1000
+    assert failures == []
+# END test__flush_writes_buffered_documents
+
+
+def test__failed_documents_are_reported(monkeypatch, failures):
+    error = {"index": {"_id": "b", "status": 400, "error": {"type": "mapper_parsing_exception"}}}
+    monkeypatch.setattr(buffer_module.helpers, "bulk", FakeBulk(errors=[error]))
+    buffer = make_buffer(failures)
+
+    buffer.add("a", {"id": "a"}, "message a")
+    buffer.add("b", {"id": "b"}, "message b")
+
+    assert buffer.flush() == 1
+    assert failures == [("message b", json.dumps({"type": "mapper_parsing_exception"}))]
+# END test__failed_documents_are_reported
+
+
+def test__failed_request_reports_every_document(monkeypatch, failures):
+    monkeypatch.setattr(buffer_module.helpers, "bulk", FakeBulk(error=ValueError("serialization failed")))
+    buffer = make_buffer(failures)
+
+    buffer.add("a", {"id": "a"}, "message a")
+    buffer.add("b", {"id": "b"}, "message b")
+
+    assert buffer.flush() == 0
+    assert [message for message, _ in failures] == ["message a", "message b"]
+    assert "serialization failed" in failures[0][1]
+    assert len(buffer) == 0
+# END test__failed_request_reports_every_document
+
+
+def test__close_flushes_pending_documents(monkeypatch, failures):
+    bulk = FakeBulk()
+    monkeypatch.setattr(buffer_module.helpers, "bulk", bulk)
+    buffer = make_buffer(failures, flush_interval=60)
+    buffer.start()
+
+    buffer.add("a", {"id": "a"}, "message a")
+    buffer.close()
+
+    assert len(bulk.requests) == 1
+    assert len(buffer) == 0
+# END test__close_flushes_pending_documents
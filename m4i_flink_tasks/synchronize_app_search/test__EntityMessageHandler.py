@@ -0,0 +1,234 @@
+import asyncio
+import sys
+import threading
+from types import SimpleNamespace
+
+import pytest
+from mock import MagicMock
+
+from ..codec import loads
+from .AppSearchDocumentBuffer import AppSearchDocumentBuffer
+from .EntityMessageHandler import EntityMessageHandler
+from .HierarchyIndex import HierarchyIndex
+from .elastic import iter_documents
+from .DocumentCache import get_document_cache
+from .synchronize_app_search import handle_entity_message
+
+handler_module = sys.modules[EntityMessageHandler.__module__]
+synchronize_module = sys.modules[handle_entity_message.__module__]
+
+STORED_DOCUMENTS = {
+    "a": {"id": "a", "guid": "a", "name": "A"},
+    "b": {"id": "b", "guid": "b", "name": "B"},
+}
+
+
+def make_app_search():
+    app_search = MagicMock()
+    app_search.get_documents.side_effect = lambda engine_name, document_ids: [
+        dict(STORED_DOCUMENTS[document_id]) if document_id in STORED_DOCUMENTS else None for document_id in document_ids
+    ]
+    return app_search
+# END make_app_search
+
+
+def make_entity_message(guid: str = "a", event_type: str = "EntityUpdated", **kwargs):
+    message = dict(
+        guid=guid, type_name="m4i_dataset", event_type=event_type, new_value=None, old_value=None,
+        inserted_attributes=[], changed_attributes=[], deleted_attributes=[], inserted_relationships={}, deleted_relationships={}
+    )
+    return SimpleNamespace(**{**message, **kwargs})
+# END make_entity_message
+
+
+@pytest.fixture
+def entity_message_handler():
+    handler = EntityMessageHandler(make_app_search(), "test-engine", index=HierarchyIndex())
+    handler.open()
+    yield handler
+    handler.close()
+# END entity_message_handler
+
+
+@pytest.fixture
+def no_prefetch(monkeypatch):
+    async def prefetch_entity_message(entity_message, app_search):
+        pass
+
+    monkeypatch.setattr(synchronize_module, "prefetch_entity_message", prefetch_entity_message)
+# END no_prefetch
+
+
+def test__loop_is_reused_across_messages(monkeypatch, entity_message_handler: EntityMessageHandler):
+    loops = []
+    threads = []
+
+    async def handle(entity_message, app_search):
+        loops.append(asyncio.get_running_loop())
+        threads.append(threading.current_thread())
+
+    monkeypatch.setattr(handler_module, "handle_entity_message", handle)
+
+    list(entity_message_handler.iter_changes(make_entity_message("a")))
+    list(entity_message_handler.iter_changes(make_entity_message("b")))
+
+    assert loops == [entity_message_handler.loop, entity_message_handler.loop]
+    assert threads == [entity_message_handler.thread, entity_message_handler.thread]
+# END test__loop_is_reused_across_messages
+
+
+def test__abandoned_iterator_does_not_block_next_message(monkeypatch, entity_message_handler: EntityMessageHandler):
+    async def handle(entity_message, app_search):
+        document_cache = get_document_cache()
+        for document in document_cache.stream([dict(STORED_DOCUMENTS["a"]), dict(STORED_DOCUMENTS["b"])]):
+            document["name"] = entity_message.guid
+            document_cache.write(document)
+
+    monkeypatch.setattr(handler_module, "handle_entity_message", handle)
+
+    changes = entity_message_handler.iter_changes(make_entity_message("first"), max_pending=1)
+    next(changes)
+    changes.close()
+
+    changes = [loads(change) for change in entity_message_handler.iter_changes(make_entity_message("second"))]
+
+    assert [change["document"]["name"] for change in changes] == ["second", "second"]
+# END test__abandoned_iterator_does_not_block_next_message
+
+
+def test__close_stops_the_loop_thread():
+    handler = EntityMessageHandler(make_app_search(), "test-engine", index=HierarchyIndex())
+    handler.open()
+    loop, thread = handler.loop, handler.thread
+
+    handler.close()
+
+    assert not thread.is_alive()
+    assert loop.is_closed()
+    with pytest.raises(RuntimeError):
+        handler.handle(make_entity_message("a"), lambda change: None)
+# END test__close_stops_the_loop_thread
+
+
+def test__changed_documents_are_emitted(monkeypatch, entity_message_handler: EntityMessageHandler):
+    async def handle(entity_message, app_search):
+        document_cache = get_document_cache()
+        document_cache.put({"id": "new", "name": "New"})
+        document_cache.get("a")["name"] = "changed"
+        document_cache.mark_dirty({"a": document_cache.get("a"), "b": document_cache.get("b")})
+
+    monkeypatch.setattr(handler_module, "handle_entity_message", handle)
+
+    changes = [loads(change) for change in entity_message_handler.iter_changes(make_entity_message("c", "EntityDeleted"))]
+
+    assert changes == [
+        {"action": "index", "id": "new", "document": {"id": "new", "name": "New"}},
+        {"action": "patch", "id": "a", "document": {"id": "a", "name": "changed"}},
+        {"action": "delete", "id": "c"}
+    ]
+# END test__changed_documents_are_emitted
+
+
+def test__handler_failure_is_raised_after_streamed_changes(monkeypatch, entity_message_handler: EntityMessageHandler):
+    async def handle(entity_message, app_search):
+        document_cache = get_document_cache()
+        for document in document_cache.stream([dict(STORED_DOCUMENTS["b"])]):
+            document["name"] = "changed"
+            document_cache.write(document)
+        raise ValueError("failed")
+
+    monkeypatch.setattr(handler_module, "handle_entity_message", handle)
+
+    changes = entity_message_handler.iter_changes(make_entity_message("a"))
+
+    assert loads(next(changes)) == {"action": "patch", "id": "b", "document": {"id": "b", "name": "changed"}}
+    with pytest.raises(ValueError):
+        next(changes)
+# END test__handler_failure_is_raised_after_streamed_changes
+
+
+def test__handlers_rewriting_the_same_subtree_see_earlier_changes(monkeypatch, entity_message_handler: EntityMessageHandler):
+    def rewrite_subtree(app_search, breadcrumb_name):
+        document_cache = get_document_cache()
+        for document in iter_documents(app_search, "test-engine", ["b"]):
+            document["breadcrumb_name"] = document.get("breadcrumb_name", []) + [breadcrumb_name]
+            document_cache.write(document)
+
+    async def handle(entity_message, app_search):
+        # A rename followed by a move, both of which rewrite the breadcrumbs of the subtree.
+        rewrite_subtree(app_search, "renamed")
+        rewrite_subtree(app_search, "moved")
+
+    monkeypatch.setattr(handler_module, "handle_entity_message", handle)
+
+    buffer = AppSearchDocumentBuffer(MagicMock(), "test-engine")
+    for change in entity_message_handler.iter_changes(make_entity_message("a")):
+        buffer.apply(loads(change))
+
+    assert buffer.drain() == [
+        {"action": "patch", "id": "b", "document": {"id": "b", "breadcrumb_name": ["renamed", "moved"]}}
+    ]
+# END test__handlers_rewriting_the_same_subtree_see_earlier_changes
+
+
+def test__handlers_run_in_order(monkeypatch, no_prefetch, entity_message_handler: EntityMessageHandler):
+    calls = []
+
+    def handle_attributes(name):
+        def handle(entity_message, input_entity, attributes, app_search, doc=None):
+            calls.append(name)
+            return {}
+        return handle
+
+    def handle_relationships(name):
+        async def handle(entity_message, input_entity, relationships, app_search, doc=None):
+            calls.append(name)
+            return {}
+        return handle
+
+    monkeypatch.setattr(synchronize_module, "handle_updated_attributes", handle_attributes("updated"))
+    monkeypatch.setattr(synchronize_module, "handle_deleted_attributes", handle_attributes("deleted"))
+    monkeypatch.setattr(synchronize_module, "handle_deleted_relationships", handle_relationships("deleted relationships"))
+    monkeypatch.setattr(synchronize_module, "handle_inserted_relationships", handle_relationships("inserted relationships"))
+
+    entity_message = make_entity_message(
+        changed_attributes=["name"], deleted_attributes=["definition"],
+        inserted_relationships={"parent": []}, deleted_relationships={"parent": []}
+    )
+    list(entity_message_handler.iter_changes(entity_message))
+
+    assert calls == ["updated", "deleted", "deleted relationships", "inserted relationships"]
+# END test__handlers_run_in_order
+
+
+def test__handler_error_propagates(monkeypatch, no_prefetch, entity_message_handler: EntityMessageHandler):
+    def handle_updated_attributes(entity_message, input_entity, attributes, app_search, doc=None):
+        raise KeyError("name")
+
+    monkeypatch.setattr(synchronize_module, "handle_updated_attributes", handle_updated_attributes)
+
+    with pytest.raises(KeyError):
+        list(entity_message_handler.iter_changes(make_entity_message(changed_attributes=["name"])))
+# END test__handler_error_propagates
+
+
+def test__prefetch_runs_lookups_concurrently(monkeypatch, entity_message_handler: EntityMessageHandler):
+    started = []
+
+    async def get_super_types_names(type_name):
+        started.append(type_name)
+        # Each lookup only completes once the other one started as well.
+        while len(started) < 2:
+            await asyncio.sleep(0.001)
+        return [type_name]
+
+    monkeypatch.setattr(synchronize_module, "get_super_types_names", get_super_types_names)
+    monkeypatch.setattr(synchronize_module, "get_schema_keys", lambda app_search, engine_name: frozenset())
+
+    entity_message = make_entity_message(inserted_relationships={"parent": [{"guid": "b", "typeName": "m4i_collection"}]})
+
+    asyncio.run_coroutine_threadsafe(
+        synchronize_module.prefetch_entity_message(entity_message, entity_message_handler.app_search), entity_message_handler.loop).result(timeout=1)
+
+    assert sorted(started) == ["m4i_collection", "m4i_dataset"]
+# END test__prefetch_runs_lookups_concurrently
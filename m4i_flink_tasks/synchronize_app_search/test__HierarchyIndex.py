@@ -0,0 +1,63 @@
+import pytest
+
+from .HierarchyIndex import HierarchyIndex
+
+
+def make_document(guid: str, name: str, type_name: str, breadcrumb: list = None, parent_guid: str = None) -> dict:
+    return {"guid": guid, "id": guid, "name": name, "typename": type_name, "breadcrumbguid": breadcrumb or [], "parentguid": parent_guid}
+# END make_document
+
+
+@pytest.fixture
+def hierarchy_index():
+    index = HierarchyIndex()
+    index.bootstrap([
+        make_document("system", "System", "m4i_system"),
+        make_document("collection", "Collection", "m4i_collection", ["system"]),
+        make_document("dataset", "Dataset", "m4i_dataset", ["system", "collection"], "collection"),
+        make_document("field", "Field", "m4i_field", ["system", "collection", "dataset"], "dataset")
+    ])
+    return index
+# END hierarchy_index
+
+
+def test__bootstrap_builds_subtrees(hierarchy_index: HierarchyIndex):
+    assert hierarchy_index.loaded
+    assert hierarchy_index.get_subtree("system") == ["collection", "dataset", "field"]
+    assert hierarchy_index.get_subtree("dataset") == ["field"]
+    assert hierarchy_index.get_subtree("field") == []
+# END test__bootstrap_builds_subtrees
+
+
+def test__get_breadcrumb_starts_at_root(hierarchy_index: HierarchyIndex):
+    assert hierarchy_index.get_breadcrumb("field") == (
+        ["system", "collection", "dataset"],
+        ["System", "Collection", "Dataset"],
+        ["m4i_system", "m4i_collection", "m4i_dataset"]
+    )
+# END test__get_breadcrumb_starts_at_root
+
+
+def test__move_and_rename_are_reflected(hierarchy_index: HierarchyIndex):
+    hierarchy_index.put("other", "Other", "m4i_collection")
+    hierarchy_index.update_document(make_document("dataset", "Renamed", "m4i_dataset", ["other"], "other"))
+
+    assert hierarchy_index.get_subtree("collection") == []
+    assert hierarchy_index.get_subtree("other") == ["dataset", "field"]
+    assert hierarchy_index.get_breadcrumb("field")[1] == ["Other", "Renamed"]
+# END test__move_and_rename_are_reflected
+
+
+def test__cycles_are_rejected(hierarchy_index: HierarchyIndex):
+    with pytest.raises(ValueError):
+        hierarchy_index.set_parent("system", "field")
+# END test__cycles_are_rejected
+
+
+def test__removed_entity_detaches_children(hierarchy_index: HierarchyIndex):
+    hierarchy_index.remove("collection")
+
+    assert "collection" not in hierarchy_index
+    assert hierarchy_index.get_subtree("system") == []
+    assert hierarchy_index.get("dataset").parent_guid is None
+# END test__removed_entity_detaches_children
@@ -0,0 +1,62 @@
+from .SchemaCache import SchemaCache
+
+
+class FakeAppSearch(object):
+
+    def __init__(self, schema: dict):
+        self.schema = schema
+        self.requests = 0
+
+    def get_schema(self, engine_name: str) -> dict:
+        self.requests += 1
+        return dict(self.schema)
+# END FakeAppSearch
+
+
+def test__schema_is_retrieved_once():
+    app_search = FakeAppSearch({"name": "text", "dq_score_accuracy": "number"})
+    cache = SchemaCache()
+
+    assert cache.get(app_search, "engine") == frozenset({"name", "dq_score_accuracy"})
+    assert cache.get(app_search, "engine") == frozenset({"name", "dq_score_accuracy"})
+    assert app_search.requests == 1
+# END test__schema_is_retrieved_once
+
+
+def test__schema_is_refreshed_after_refresh_interval():
+    app_search = FakeAppSearch({"name": "text"})
+    cache = SchemaCache(refresh_interval=0)
+
+    cache.get(app_search, "engine")
+    cache.get(app_search, "engine")
+
+    assert app_search.requests == 2
+# END test__schema_is_refreshed_after_refresh_interval
+
+
+def test__document_with_unknown_field_invalidates_schema():
+    app_search = FakeAppSearch({"name": "text"})
+    cache = SchemaCache()
+    cache.get(app_search, "engine")
+
+    cache.observe_document("engine", {"id": "1", "name": "a"})
+    assert cache.peek("engine") is not None
+
+    app_search.schema["definition"] = "text"
+    cache.observe_document("engine", {"id": "1", "name": "a", "definition": "b"})
+    assert cache.peek("engine") is None
+
+    assert "definition" in cache.get(app_search, "engine")
+# END test__document_with_unknown_field_invalidates_schema
+
+
+def test__rejected_field_invalidates_schema():
+    cache = SchemaCache()
+    cache.put("engine", ["name"])
+
+    cache.observe_rejected("engine", [{"id": "1", "errors": ["Request timed out"]}])
+    assert cache.peek("engine") is not None
+
+    cache.observe_rejected("engine", [{"id": "1", "errors": ["Invalid field value: Value 'a' cannot be parsed as a number"]}])
+    assert cache.peek("engine") is None
+# END test__rejected_field_invalidates_schema
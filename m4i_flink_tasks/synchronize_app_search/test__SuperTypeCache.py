@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+from .SuperTypeCache import SuperTypeCache
+
+
+def make_chain(*type_names):
+    return [SimpleNamespace(name=type_name) for type_name in type_names]
+# END make_chain
+
+
+def test__get_returns_cached_chain():
+    cache = SuperTypeCache()
+    cache.put("m4i_kafka_field", make_chain("m4i_kafka_field", "m4i_field", "Referenceable"))
+
+    super_types = cache.get("m4i_kafka_field")
+
+    assert [super_type.name for super_type in super_types] == ["m4i_kafka_field", "m4i_field", "Referenceable"]
+# END test__get_returns_cached_chain
+
+
+def test__expired_chain_is_not_returned():
+    cache = SuperTypeCache(ttl=0)
+    cache.put("m4i_field", make_chain("m4i_field"))
+
+    assert cache.get("m4i_field") is None
+    assert len(cache) == 0
+# END test__expired_chain_is_not_returned
+
+
+def test__least_recently_used_chain_is_evicted():
+    cache = SuperTypeCache(max_size=2)
+    cache.put("a", make_chain("a"))
+    cache.put("b", make_chain("b"))
+    cache.get("a")
+    cache.put("c", make_chain("c"))
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+# END test__least_recently_used_chain_is_evicted
+
+
+def test__invalidate_removes_chains_containing_type():
+    cache = SuperTypeCache()
+    cache.put("m4i_kafka_field", make_chain("m4i_kafka_field", "m4i_field"))
+    cache.put("m4i_field", make_chain("m4i_field"))
+    cache.put("m4i_dataset", make_chain("m4i_dataset"))
+
+    cache.invalidate("m4i_field")
+
+    assert cache.get("m4i_kafka_field") is None
+    assert cache.get("m4i_field") is None
+    assert cache.get("m4i_dataset") is not None
+# END test__invalidate_removes_chains_containing_type
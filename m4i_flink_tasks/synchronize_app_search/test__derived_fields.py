@@ -0,0 +1,42 @@
+from .derived_fields import (PROPAGATION_TABLE, get_ancestor_types, get_derived_fields, get_inherited_fields,
+                             select_inherited_fields)
+
+
+def test__get_ancestor_types_follows_hierarchy_mapping():
+    assert get_ancestor_types("m4i_field") == ["m4i_dataset", "m4i_collection", "m4i_system"]
+    assert get_ancestor_types("m4i_system") == []
+# END test__get_ancestor_types_follows_hierarchy_mapping
+
+
+def test__get_derived_fields_of_type():
+    derived_fields = get_derived_fields("m4i_dataset")
+
+    assert [(derived_field.name_field, derived_field.guid_field) for derived_field in derived_fields] == [
+        ("deriveddataset", "deriveddatasetguid"),
+        ("deriveddatasetnames", "deriveddatasetguids")
+    ]
+    assert get_derived_fields("unknown") == []
+# END test__get_derived_fields_of_type
+
+
+def test__propagation_table_holds_ancestor_and_governance_role_fields():
+    field_fields = PROPAGATION_TABLE["m4i_field"]
+
+    assert {"derivedsystem", "derivedsystemguid", "derivedcollection", "deriveddataset", "deriveddataownerguid"} <= field_fields
+    assert "derivedfield" not in field_fields
+    assert "deriveddatadomain" not in field_fields
+# END test__propagation_table_holds_ancestor_and_governance_role_fields
+
+
+def test__select_inherited_fields_of_document():
+    dataset_document = {"m4isourcetype": ["m4i_dataset"]}
+    field_names = ["derivedsystem", "deriveddataset", "deriveddatadomain", "name"]
+
+    assert select_inherited_fields(dataset_document, field_names) == ["derivedsystem"]
+# END test__select_inherited_fields_of_document
+
+
+def test__document_without_source_type_inherits_all_derived_fields():
+    assert get_inherited_fields({"m4isourcetype": []}) is None
+    assert select_inherited_fields({}, ["derivedsystem", "name"]) == ["derivedsystem"]
+# END test__document_without_source_type_inherits_all_derived_fields
@@ -0,0 +1,172 @@
+from types import SimpleNamespace
+
+import pytest
+
+from .DocumentCache import document_cache_scope
+from .elastic import (APP_SEARCH_MAX_PAGE, QueryResultsTruncatedError, iter_all_documents, iter_documents, iter_pages, iter_query_ids,
+                      list_all_documents, send_query)
+
+
+class FakeAppSearch(object):
+    """This class answers search requests on a list of documents, with the page limit and the range filters of app search."""
+
+    def __init__(self, documents: list):
+        self.documents = documents
+        self.requests = 0
+
+    def search(self, engine_name: str, body: dict, current_page: int, page_size: int):
+        assert current_page <= APP_SEARCH_MAX_PAGE
+        self.requests += 1
+
+        documents = self.documents
+
+        filters = body.get("filters")
+        for extra_filter in (filters.get("all", [filters]) if filters else []):
+            for field, condition in extra_filter.items():
+                documents = [document for document in documents if document[field] >= condition["from"]]
+
+        for sort in body.get("sort", []):
+            for field in sort:
+                documents = sorted(documents, key=lambda document: document[field])
+
+        page = documents[(current_page - 1) * page_size:current_page * page_size]
+        results = [{key: {"raw": value} for key, value in document.items()} for document in page]
+        return SimpleNamespace(body={"meta": {"page": {"current": current_page, "size": page_size, "total_results": len(documents)}}, "results": results})
+
+    def list_documents(self, engine_name: str, current_page: int, page_size: int) -> dict:
+        self.requests += 1
+        return {"results": self.documents[(current_page - 1) * page_size:current_page * page_size]}
+
+    def get_documents(self, engine_name: str, document_ids: list) -> list:
+        assert len(document_ids) <= 100
+        self.requests += 1
+
+        documents = {document["id"]: document for document in self.documents}
+        return [documents.get(document_id) for document_id in document_ids]
+# END FakeAppSearch
+
+
+def make_documents(count: int, distinct_values: int) -> list:
+    return [{"id": str(index), "modified": index % distinct_values} for index in range(count)]
+# END make_documents
+
+
+def test__iter_pages_stops_at_short_page():
+    pages = list(iter_pages(lambda current_page: [current_page] * (2 if current_page < 3 else 1), page_size=2))
+
+    assert pages == [[1, 1], [2, 2], [3]]
+# END test__iter_pages_stops_at_short_page
+
+
+def test__send_query_returns_all_ids():
+    app_search = FakeAppSearch(make_documents(25, 25))
+
+    ids = send_query(app_search, {"query": ""}, engine_name="engine", page_size=10)
+
+    assert sorted(ids, key=int) == [str(index) for index in range(25)]
+    assert app_search.requests == 3
+# END test__send_query_returns_all_ids
+
+
+def test__query_without_partition_field_fails_at_page_limit():
+    app_search = FakeAppSearch(make_documents(250, 250))
+
+    with pytest.raises(QueryResultsTruncatedError):
+        list(iter_query_ids(app_search, {"query": ""}, engine_name="engine", page_size=2))
+# END test__query_without_partition_field_fails_at_page_limit
+
+
+def test__query_filling_exactly_all_pages_is_not_truncated():
+    app_search = FakeAppSearch(make_documents(APP_SEARCH_MAX_PAGE * 2, 1))
+
+    assert len(list(iter_query_ids(app_search, {"query": ""}, engine_name="engine", page_size=2))) == APP_SEARCH_MAX_PAGE * 2
+    assert len(list(iter_query_ids(app_search, {"query": ""}, engine_name="engine", page_size=2, partition_field="modified"))) == APP_SEARCH_MAX_PAGE * 2
+# END test__query_filling_exactly_all_pages_is_not_truncated
+
+
+def test__query_fails_when_partition_value_exceeds_page_limit():
+    app_search = FakeAppSearch(make_documents(250, 1))
+
+    with pytest.raises(QueryResultsTruncatedError):
+        list(iter_query_ids(app_search, {"query": ""}, engine_name="engine", page_size=2, partition_field="modified"))
+# END test__query_fails_when_partition_value_exceeds_page_limit
+
+
+def test__query_with_partition_field_continues_past_page_limit():
+    app_search = FakeAppSearch(make_documents(450, 150))
+
+    ids = list(iter_query_ids(app_search, {"query": ""}, engine_name="engine", page_size=2, partition_field="modified"))
+
+    assert len(ids) == len(set(ids)) == 450
+# END test__query_with_partition_field_continues_past_page_limit
+
+
+def test__iter_all_documents_returns_plain_documents():
+    app_search = FakeAppSearch(make_documents(3, 3))
+
+    documents = list(iter_all_documents(app_search, engine_name="engine", partition_field="modified"))
+
+    assert documents == [{"id": "0", "modified": 0}, {"id": "1", "modified": 1}, {"id": "2", "modified": 2}]
+# END test__iter_all_documents_returns_plain_documents
+
+
+def test__iter_all_documents_without_partition_field_lists_all_documents():
+    app_search = FakeAppSearch(make_documents(450, 450))
+
+    documents = list(iter_all_documents(app_search, engine_name="engine", page_size=2))
+
+    assert documents == make_documents(450, 450)
+# END test__iter_all_documents_without_partition_field_lists_all_documents
+
+
+def test__list_all_documents_starts_at_current_page():
+    app_search = FakeAppSearch(make_documents(5, 5))
+
+    documents = list_all_documents(app_search, "engine", 2, 2)
+
+    assert [document["id"] for document in documents] == ["2", "3", "4"]
+# END test__list_all_documents_starts_at_current_page
+
+
+def test__iter_documents_retrieves_ids_in_chunks():
+    app_search = FakeAppSearch(make_documents(250, 250))
+
+    documents = list(iter_documents(app_search, "engine", (str(index) for index in range(260)), max_workers=2))
+
+    assert sorted(document["id"] for document in documents) == sorted(str(index) for index in range(250))
+    assert app_search.requests == 3
+# END test__iter_documents_retrieves_ids_in_chunks
+
+
+def test__iter_documents_uses_document_cache():
+    app_search = FakeAppSearch(make_documents(3, 3))
+
+    with document_cache_scope(app_search, "engine") as document_cache:
+        changed = {"id": "0", "modified": 10}
+        document_cache.put(changed)
+
+        documents = list(iter_documents(app_search, "engine", ["0", "1", "1", "2"]))
+
+        assert sorted(documents, key=lambda document: document["id"]) == [changed, {"id": "1", "modified": 1}, {"id": "2", "modified": 2}]
+        assert app_search.requests == 1
+        assert document_cache.get("1") is not None
+        assert app_search.requests == 1
+# END test__iter_documents_uses_document_cache
+
+
+def test__iter_documents_streams_documents_through_document_cache():
+    app_search = FakeAppSearch(make_documents(3, 3))
+    patches = []
+
+    with document_cache_scope(app_search, "engine", on_streamed=patches.append) as document_cache:
+        cached = document_cache.get("0")
+
+        for document in iter_documents(app_search, "engine", ["0", "1", "2"]):
+            document["modified"] = 10
+            document_cache.write(document)
+            assert len(document_cache.streamed) == 0
+
+        assert sorted(document_cache.documents) == ["0"]
+        assert document_cache.dirty == {"0": cached}
+        assert sorted(patches, key=lambda patch: patch["id"]) == [{"id": "1", "modified": 10}, {"id": "2", "modified": 10}]
+# END test__iter_documents_streams_documents_through_document_cache
@@ -0,0 +1,103 @@
+import asyncio
+import threading
+
+import pytest
+
+from .AsyncRequestWindow import AsyncRequestWindow
+
+
+async def respond(value, event: threading.Event = None, delay: float = 0):
+    if event is not None:
+        while not event.is_set():
+            await asyncio.sleep(0.001)
+    await asyncio.sleep(delay)
+    return value
+# END respond
+
+
+@pytest.fixture
+def ordered_window():
+    window = AsyncRequestWindow(max_in_flight=3, ordered=True)
+    yield window
+    window.close()
+# END ordered_window
+
+
+@pytest.fixture
+def unordered_window():
+    window = AsyncRequestWindow(max_in_flight=3, ordered=False)
+    yield window
+    window.close()
+# END unordered_window
+
+
+def test__ordered_window_keeps_submission_order(ordered_window: AsyncRequestWindow):
+    first_released = threading.Event()
+
+    ordered_window.submit("first", respond("first", first_released))
+    ordered_window.submit("second", respond("second"))
+
+    assert ordered_window.wait(timeout=0.05) == []
+
+    first_released.set()
+    completed = ordered_window.drain(timeout=1)
+
+    assert [element for element, _ in completed] == ["first", "second"]
+    assert [future.result() for _, future in completed] == ["first", "second"]
+# END test__ordered_window_keeps_submission_order
+
+
+def test__unordered_window_emits_on_completion(unordered_window: AsyncRequestWindow):
+    first_released = threading.Event()
+
+    completed = unordered_window.submit("first", respond("first", first_released))
+    completed.extend(unordered_window.submit("second", respond("second")))
+
+    # The second request may complete before submit returns.
+    if not completed:
+        completed = unordered_window.wait(timeout=1)
+
+    assert [element for element, _ in completed] == ["second"]
+
+    first_released.set()
+    assert [element for element, _ in unordered_window.drain(timeout=1)] == ["first"]
+# END test__unordered_window_emits_on_completion
+
+
+def test__window_bounds_requests_in_flight(ordered_window: AsyncRequestWindow):
+    completed = []
+    for index in range(10):
+        completed.extend(ordered_window.submit(index, respond(index, delay=0.01)))
+        assert len(ordered_window) <= ordered_window.max_in_flight
+
+    completed.extend(ordered_window.drain(timeout=1))
+
+    assert [element for element, _ in completed] == list(range(10))
+# END test__window_bounds_requests_in_flight
+
+
+def test__failed_request_is_handed_back(ordered_window: AsyncRequestWindow):
+    async def fail():
+        raise ValueError("failed")
+
+    completed = ordered_window.submit("failing", fail())
+    completed.extend(ordered_window.drain(timeout=1))
+    [(element, future)] = completed
+
+    assert element == "failing"
+    with pytest.raises(ValueError):
+        future.result()
+# END test__failed_request_is_handed_back
+
+
+def test__close_returns_pending_requests():
+    window = AsyncRequestWindow(max_in_flight=3)
+    never_released = threading.Event()
+
+    window.submit("pending", respond("pending", never_released))
+    cancelled = window.close()
+
+    assert [element for element, _ in cancelled] == ["pending"]
+    assert cancelled[0][1].cancelled()
+    assert len(window) == 0
+# END test__close_returns_pending_requests
@@ -0,0 +1,62 @@
+from contextlib import asynccontextmanager
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from .AtlasClient import AtlasClient
+
+
+@asynccontextmanager
+async def atlas_server():
+    requests = []
+
+    async def get_entity(request: web.Request):
+        requests.append(request)
+        guid = request.match_info["guid"]
+        if guid == "missing":
+            return web.json_response({"errorCode": "ATLAS-404-00-005"}, status=404)
+        return web.json_response({"entity": {"guid": guid, "typeName": "m4i_data_domain"}})
+
+    async def get_entities(request: web.Request):
+        requests.append(request)
+        entities = [{"guid": guid, "typeName": "m4i_data_domain"} for guid in request.query.getall("guid") if guid != "missing"]
+        return web.json_response({"entities": entities})
+
+    app = web.Application()
+    app.router.add_get("/api/atlas/v2/entity/guid/{guid}", get_entity)
+    app.router.add_get("/api/atlas/v2/entity/bulk", get_entities)
+
+    server = TestServer(app)
+    await server.start_server()
+    client = AtlasClient(base_url=str(server.make_url("/api/atlas")))
+
+    try:
+        yield client, requests
+    finally:
+        await client.close()
+        await server.close()
+# END atlas_server
+
+
+@pytest.mark.asyncio
+async def test__get_entity_by_guid():
+    async with atlas_server() as (client, requests):
+        entity = await client.get_entity_by_guid("guid-1", access_token="token")
+
+        assert entity.guid == "guid-1"
+        assert requests[0].headers["Authorization"] == "Bearer token"
+        assert requests[0].query["ignoreRelationships"] == "false"
+        assert await client.get_entity_by_guid("missing", access_token="token") is None
+# END test__get_entity_by_guid
+
+
+@pytest.mark.asyncio
+async def test__get_entities_by_guid_uses_one_request():
+    async with atlas_server() as (client, requests):
+        entities = await client.get_entities_by_guid(["guid-1", "guid-2", "guid-1", "missing"], access_token="token")
+
+        assert sorted(entities) == ["guid-1", "guid-2"]
+        assert len(requests) == 1
+        assert requests[0].query.getall("guid") == ["guid-1", "guid-2", "missing"]
+# END test__get_entities_by_guid_uses_one_request
@@ -0,0 +1,89 @@
+import sys
+
+import pytest
+from aiohttp import ClientResponseError
+
+from .AsyncRequestWindow import AsyncRequestWindow
+from .BulkEntityBatch import BulkEntityBatch
+
+
+class FakeAtlasClient(object):
+
+    def __init__(self, entities: dict = None, error: Exception = None):
+        self.entities = entities or {}
+        self.error = error
+        self.requests = []
+
+    async def get_entities_by_guid(self, guids, access_token: str, ignore_relationships: bool = False):
+        self.requests.append(list(guids))
+        if self.error is not None:
+            raise self.error
+        return {guid: self.entities[guid] for guid in guids if guid in self.entities}
+# END FakeAtlasClient
+
+
+@pytest.fixture(autouse=True)
+def access_token(monkeypatch):
+    async def call_with_access_token(func, *args, **kwargs):
+        return await func(*args, access_token="token", **kwargs)
+
+    monkeypatch.setattr(sys.modules[BulkEntityBatch.__module__], "call_with_access_token", call_with_access_token)
+# END access_token
+
+
+@pytest.fixture
+def window():
+    window = AsyncRequestWindow(max_in_flight=1)
+    yield window
+    window.close()
+# END window
+
+
+def test__add_reports_full_batch(window: AsyncRequestWindow):
+    batch = BulkEntityBatch(FakeAtlasClient(), window, max_size=2)
+
+    assert batch.add("first", "a") is False
+    assert batch.add("second", "b") is True
+    assert len(batch) == 2
+# END test__add_reports_full_batch
+
+
+def test__flush_retrieves_all_entities_in_one_request(window: AsyncRequestWindow):
+    atlas = FakeAtlasClient(entities={"a": "entity a"})
+    batch = BulkEntityBatch(atlas, window)
+    batch.add("first", "a")
+    batch.add("second", "missing")
+
+    retrieved, failed = batch.flush()
+
+    assert retrieved == [("first", "entity a")]
+    assert [element for element, _ in failed] == ["second"]
+    assert atlas.requests == [["a", "missing"]]
+    assert len(batch) == 0
+# END test__flush_retrieves_all_entities_in_one_request
+
+
+def test__failed_request_fails_every_element(window: AsyncRequestWindow):
+    batch = BulkEntityBatch(FakeAtlasClient(error=ClientResponseError(None, (), status=500)), window)
+    batch.add("first", "a")
+    batch.add("second", "b")
+
+    retrieved, failed = batch.flush()
+
+    assert retrieved == []
+    assert [element for element, _ in failed] == ["first", "second"]
+    assert "ClientResponseError" in failed[0][1]
+# END test__failed_request_fails_every_element
+
+
+def test__drain_hands_back_pending_elements(window: AsyncRequestWindow):
+    atlas = FakeAtlasClient()
+    batch = BulkEntityBatch(atlas, window, max_size=50)
+    batch.add("first", "a")
+    batch.add("second", "b")
+
+    assert batch.drain() == ["first", "second"]
+    assert len(batch) == 0
+    assert batch.flush() == ([], [])
+    assert atlas.requests == []
+# END test__drain_hands_back_pending_elements
@@ -0,0 +1,178 @@
+import json
+import sys
+
+import pytest
+from kafka.errors import KafkaError
+from m4i_atlas_core import ConfigStore
+
+from .DeadLetterBoxProducer import DeadLetterBoxProducer
+
+producer_module = sys.modules[DeadLetterBoxProducer.__module__]
+
+
+class FakeFuture(object):
+
+    def __init__(self):
+        self.callbacks = []
+        self.errbacks = []
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def add_errback(self, errback):
+        self.errbacks.append(errback)
+# END FakeFuture
+
+
+class FakeKafkaProducer(object):
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.sent = []
+        self.futures = []
+        self.error = None
+        self.flushed = False
+        self.closed = False
+
+    def send(self, topic, value):
+        if self.error is not None:
+            raise self.error
+        self.sent.append((topic, value))
+        future = FakeFuture()
+        self.futures.append(future)
+        return future
+
+    def flush(self, timeout=None):
+        self.flushed = True
+
+    def close(self, timeout=None):
+        self.closed = True
+# END FakeKafkaProducer
+
+
+class FakeCounter(object):
+
+    def __init__(self):
+        self.count = 0
+
+    def inc(self):
+        self.count += 1
+# END FakeCounter
+
+
+class FakeRuntimeContext(object):
+
+    def __init__(self):
+        self.counters = {}
+
+    def get_metrics_group(self):
+        return self
+
+    def counter(self, name):
+        return self.counters.setdefault(name, FakeCounter())
+# END FakeRuntimeContext
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch):
+    config_store = ConfigStore.get_instance()
+    config_store.load({
+        "kafka.bootstrap.server.hostname": "localhost",
+        "kafka.bootstrap.server.port": "9092",
+        "exception.events.topic.name": "DEADLETTERBOX"
+    })
+    monkeypatch.setattr(producer_module, "KafkaProducer", FakeKafkaProducer)
+
+    yield config_store
+
+    config_store.reset()
+# END store
+
+
+@pytest.fixture
+def dead_letter_box():
+    dead_letter_box = DeadLetterBoxProducer(job="test")
+    dead_letter_box.open()
+    return dead_letter_box
+# END dead_letter_box
+
+
+def test__open_applies_default_producer_settings(dead_letter_box: DeadLetterBoxProducer):
+    kwargs = dead_letter_box.producer.kwargs
+
+    assert kwargs["bootstrap_servers"] == "localhost:9092"
+    assert kwargs["linger_ms"] == 1000
+    assert kwargs["buffer_memory"] == 8 * 1024 * 1024
+    # The first send may wait for the topic metadata, so kafka-python's own max_block_ms applies unless configured.
+    assert "max_block_ms" not in kwargs
+# END test__open_applies_default_producer_settings
+
+
+def test__open_applies_configured_producer_settings(store: ConfigStore):
+    store.load({
+        "exception.events.linger.ms": "50",
+        "exception.events.buffer.memory": 1024,
+        "exception.events.max.block.ms": 0
+    })
+
+    dead_letter_box = DeadLetterBoxProducer(job="test")
+    dead_letter_box.open()
+
+    kwargs = dead_letter_box.producer.kwargs
+    assert kwargs["linger_ms"] == 50
+    assert kwargs["buffer_memory"] == 1024
+    assert kwargs["max_block_ms"] == 0
+# END test__open_applies_configured_producer_settings
+
+
+def test__send_produces_dead_letter_to_topic(dead_letter_box: DeadLetterBoxProducer):
+    dead_letter_box.send("original", "failed")
+
+    [(topic, value)] = dead_letter_box.producer.sent
+    event = json.loads(value)
+
+    assert topic == "DEADLETTERBOX"
+    assert event["originalNotification"] == "original"
+    assert event["job"] == "test"
+    assert event["description"] == "failed"
+# END test__send_produces_dead_letter_to_topic
+
+
+def test__delivery_results_are_counted():
+    runtime_context = FakeRuntimeContext()
+    dead_letter_box = DeadLetterBoxProducer(job="test")
+    dead_letter_box.open(runtime_context)
+
+    dead_letter_box.send("first", "failed")
+    dead_letter_box.send("second", "failed")
+
+    first, second = dead_letter_box.producer.futures
+    first.callbacks[0]("metadata")
+    second.errbacks[0](KafkaError("delivery failed"))
+
+    assert (dead_letter_box.sent, dead_letter_box.dropped) == (1, 1)
+    assert runtime_context.counters["deadLettersSent"].count == 1
+    assert runtime_context.counters["deadLettersDropped"].count == 1
+# END test__delivery_results_are_counted
+
+
+def test__full_producer_drops_dead_letter(dead_letter_box: DeadLetterBoxProducer):
+    dead_letter_box.producer.error = KafkaError("buffer full")
+
+    dead_letter_box.send("original", "failed")
+
+    assert dead_letter_box.dropped == 1
+    assert dead_letter_box.producer.sent == []
+# END test__full_producer_drops_dead_letter
+
+
+def test__closed_producer_drops_dead_letter(dead_letter_box: DeadLetterBoxProducer):
+    producer = dead_letter_box.producer
+
+    dead_letter_box.close()
+    dead_letter_box.send("original", "failed")
+
+    assert producer.flushed and producer.closed
+    assert dead_letter_box.producer is None
+    assert dead_letter_box.dropped == 1
+# END test__closed_producer_drops_dead_letter
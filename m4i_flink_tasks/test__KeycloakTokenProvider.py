@@ -0,0 +1,153 @@
+import base64
+import json
+import sys
+import time
+
+import pytest
+from aiohttp.client_exceptions import ClientResponseError
+
+from .KeycloakTokenProvider import KeycloakTokenProvider, call_with_access_token, get_token_expiry
+
+token_provider_module = sys.modules[KeycloakTokenProvider.__module__]
+
+
+def make_token(expires_in: float) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": time.time() + expires_in}).encode()).decode().rstrip("=")
+    return f"header.{payload}.signature"
+# END make_token
+
+
+def test__get_token_expiry():
+    assert get_token_expiry(make_token(300)) == pytest.approx(time.time() + 300, abs=5)
+    assert get_token_expiry("not-a-jwt") is None
+# END test__get_token_expiry
+
+
+def test__token_is_fetched_once_while_fresh():
+    tokens = []
+
+    def fetch_token():
+        tokens.append(make_token(300))
+        return tokens[-1]
+
+    provider = KeycloakTokenProvider(fetch_token=fetch_token, refresh_margin=30)
+
+    assert provider.get_token() == provider.get_token()
+    assert len(tokens) == 1
+
+    provider.stop()
+# END test__token_is_fetched_once_while_fresh
+
+
+def test__invalidate_renews_the_token():
+    tokens = []
+
+    def fetch_token():
+        tokens.append(make_token(300))
+        return tokens[-1]
+
+    provider = KeycloakTokenProvider(fetch_token=fetch_token, refresh_margin=30)
+
+    first_token = provider.get_token()
+    provider.invalidate(first_token)
+    provider.invalidate(first_token)
+
+    assert provider.get_token() == tokens[-1]
+    assert len(tokens) == 2
+
+    provider.stop()
+# END test__invalidate_renews_the_token
+
+
+class InvalidatedDuringCheckProvider(KeycloakTokenProvider):
+    """This provider discards its token right after a caller read its refresh time, as a concurrent invalidate() would."""
+
+    invalidate_on_read = False
+
+    @property
+    def _refresh_at(self) -> float:
+        refresh_at = self._refresh_at_value
+        if self.invalidate_on_read:
+            self.invalidate_on_read = False
+            self._access_token, self._refresh_at_value = None, 0
+        return refresh_at
+
+    @_refresh_at.setter
+    def _refresh_at(self, refresh_at: float):
+        self._refresh_at_value = refresh_at
+# END InvalidatedDuringCheckProvider
+
+
+def test__concurrent_invalidate_never_returns_missing_token():
+    token = make_token(300)
+    provider = InvalidatedDuringCheckProvider(fetch_token=lambda: token, refresh_margin=30)
+    provider.get_token()
+
+    provider.invalidate_on_read = True
+
+    assert provider.get_token() == token
+
+    provider.stop()
+# END test__concurrent_invalidate_never_returns_missing_token
+
+
+@pytest.mark.asyncio
+async def test__call_with_access_token_retries_on_401(monkeypatch):
+    tokens = iter([make_token(300), make_token(600)])
+    provider = KeycloakTokenProvider(fetch_token=lambda: next(tokens))
+    monkeypatch.setattr(token_provider_module, "keycloak_token_provider", provider)
+
+    used_tokens = []
+
+    async def atlas_call(access_token=None):
+        used_tokens.append(access_token)
+        if len(used_tokens) == 1:
+            raise ClientResponseError(request_info=None, history=(), status=401)
+        return "entity"
+
+    assert await call_with_access_token(atlas_call) == "entity"
+    assert len(set(used_tokens)) == 2
+
+    provider.stop()
+# END test__call_with_access_token_retries_on_401
+
+
+def test__expired_token_is_not_fetched_again_right_away():
+    tokens = []
+
+    def fetch_token():
+        # The token seems expired already, as happens with clock skew.
+        tokens.append(make_token(-10))
+        return tokens[-1]
+
+    provider = KeycloakTokenProvider(fetch_token=fetch_token, refresh_margin=30)
+
+    provider.get_token()
+    provider.get_token()
+    time.sleep(0.2)
+
+    assert len(tokens) == 1
+
+    provider.stop()
+# END test__expired_token_is_not_fetched_again_right_away
+
+
+def test__background_refresh_backs_off_after_errors(monkeypatch):
+    monkeypatch.setattr(token_provider_module, "MIN_REFRESH_INTERVAL", 0.05)
+    attempts = []
+
+    def fetch_token():
+        attempts.append(time.time())
+        if len(attempts) > 1:
+            raise ConnectionError("keycloak is unavailable")
+        return make_token(-10)
+
+    provider = KeycloakTokenProvider(fetch_token=fetch_token, refresh_margin=30)
+    provider.get_token()
+    time.sleep(0.5)
+    provider.stop()
+
+    # The token is renewed after 0.05 seconds, and the failed attempts are retried after 0.05, 0.1 and 0.2 seconds.
+    assert 2 <= len(attempts) <= 6
+    assert attempts[-1] - attempts[-2] >= 0.05
+# END test__background_refresh_backs_off_after_errors
@@ -0,0 +1,84 @@
+import json
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import List, Optional
+
+import pytest
+from dataclasses_json import DataClassJsonMixin, LetterCase, dataclass_json
+
+from .codec import COMPACT_ENCODING, COMPACT_HEADER, JSON_ENCODING, dumps, encode_default, loads
+
+
+class Operation(Enum):
+    CREATE = "ENTITY_CREATE"
+# END Operation
+
+
+@dataclass_json(letter_case=LetterCase.CAMEL)
+@dataclass
+class Reference(DataClassJsonMixin):
+    type_name: str
+    unique_attributes: Optional[dict] = None
+# END Reference
+
+
+@dataclass_json(letter_case=LetterCase.CAMEL)
+@dataclass
+class Message(DataClassJsonMixin):
+    operation_type: Operation
+    references: List[Reference]
+    old_value: dict = field(default_factory=dict)
+# END Message
+
+
+def make_message() -> Message:
+    return Message(
+        operation_type=Operation.CREATE,
+        references=[Reference(type_name="m4i_data_domain", unique_attributes={"qualifiedName": "finance"})],
+        old_value={"reference": Reference(type_name="m4i_person")}
+    )
+# END make_message
+
+
+def test__dumps_matches_to_json():
+    message = make_message()
+
+    assert loads(dumps(message)) == json.loads(message.to_json())
+# END test__dumps_matches_to_json
+
+
+def test__json_fallback_matches_to_json():
+    message = make_message()
+
+    assert json.loads(json.dumps({"message": message}, default=encode_default)) == {"message": json.loads(message.to_json())}
+# END test__json_fallback_matches_to_json
+
+
+def test__loads_from_dict_round_trip():
+    message = make_message()
+
+    assert Message.from_dict(loads(dumps(message))) == Message.from_json(message.to_json())
+# END test__loads_from_dict_round_trip
+
+
+def test__compact_encoding_round_trip():
+    pytest.importorskip("msgpack")
+    message = make_message()
+
+    encoded = dumps({"message": message}, COMPACT_ENCODING)
+
+    assert encoded.startswith(f"{COMPACT_HEADER}:")
+    assert loads(encoded) == {"message": json.loads(message.to_json())}
+# END test__compact_encoding_round_trip
+
+
+def test__loads_detects_json():
+    assert loads('{"guid": "1234"}') == {"guid": "1234"}
+    assert loads(dumps({"guid": "1234"}, JSON_ENCODING)) == {"guid": "1234"}
+# END test__loads_detects_json
+
+
+def test__unsupported_compact_version_is_rejected():
+    with pytest.raises(ValueError):
+        loads("m4i/msgpack+zlib;v=99:AAAA")
+# END test__unsupported_compact_version_is_rejected
@@ -0,0 +1,33 @@
+import pytest
+
+from .config_values import parse_bool, parse_int
+
+
+def test__parse_bool_accepts_strings_and_booleans():
+    assert parse_bool("false") is False
+    assert parse_bool("False ") is False
+    assert parse_bool("true") is True
+    assert parse_bool(True) is True
+    assert parse_bool(0) is False
+# END test__parse_bool_accepts_strings_and_booleans
+
+
+def test__parse_bool_returns_default_for_none():
+    assert parse_bool(None, default=True) is True
+    assert parse_bool(None) is False
+# END test__parse_bool_returns_default_for_none
+
+
+def test__parse_bool_rejects_unknown_strings():
+    with pytest.raises(ValueError):
+        parse_bool("maybe")
+# END test__parse_bool_rejects_unknown_strings
+
+
+def test__parse_int_keeps_zero():
+    assert parse_int("0", default=100) == 0
+    assert parse_int(0, default=100) == 0
+    assert parse_int("50", default=100) == 50
+    assert parse_int(None, default=100) == 100
+    assert parse_int("", default=100) == 100
+# END test__parse_int_keeps_zero
@@ -0,0 +1,50 @@
+import json
+
+from .notification_coalescing import (coalesce_notification, get_collapsed_operation_types, get_effective_operation_type)
+
+
+def make_notification(operation_type: str, event_time: int) -> str:
+    return json.dumps({
+        "msgCreationTime": event_time,
+        "message": {
+            "eventTime": event_time,
+            "operationType": operation_type,
+            "type": "ENTITY_NOTIFICATION_V2",
+            "entity": {"guid": "36b7f0d4-76f2-405c-8043-f8c143d2c387", "typeName": "hdfs_path"}
+        }
+    })
+# END make_notification
+
+
+def coalesce(*notifications: str) -> dict:
+    pending_notification = None
+    for kafka_notification in notifications:
+        pending_notification = coalesce_notification(pending_notification, kafka_notification)
+    return json.loads(pending_notification)
+# END coalesce
+
+
+def test__get_effective_operation_type():
+    assert get_effective_operation_type(["ENTITY_UPDATE", "ENTITY_UPDATE"]) == "ENTITY_UPDATE"
+    assert get_effective_operation_type(["ENTITY_CREATE", "ENTITY_UPDATE"]) == "ENTITY_CREATE"
+    assert get_effective_operation_type(["ENTITY_CREATE", "ENTITY_UPDATE", "ENTITY_DELETE"]) == "ENTITY_DELETE"
+# END test__get_effective_operation_type
+
+
+def test__coalesced_notification_is_the_latest_one():
+    result = coalesce(
+        make_notification("ENTITY_CREATE", 1),
+        make_notification("ENTITY_UPDATE", 2),
+        make_notification("ENTITY_UPDATE", 3)
+    )
+
+    assert result["msgCreationTime"] == 3
+    assert result["message"]["operationType"] == "ENTITY_CREATE"
+    assert result["collapsedOperationTypes"] == ["ENTITY_CREATE", "ENTITY_UPDATE", "ENTITY_UPDATE"]
+# END test__coalesced_notification_is_the_latest_one
+
+
+def test__get_collapsed_operation_types():
+    assert get_collapsed_operation_types(json.loads(make_notification("ENTITY_UPDATE", 1))) is None
+    assert get_collapsed_operation_types(coalesce(make_notification("ENTITY_UPDATE", 1))) == ["ENTITY_UPDATE"]
+# END test__get_collapsed_operation_types
@@ -0,0 +1,60 @@
+import sys
+
+import pytest
+from m4i_atlas_core import ConfigStore
+
+from .codec import COMPACT_ENCODING, dumps
+from .partitioning import (get_atlas_entity_guid, get_default_parallelism, get_document_change_id, get_entity_message_guid,
+                           get_notification_entity_guid, get_parallelism)
+
+
+@pytest.fixture(autouse=True)
+def store():
+    config_store = ConfigStore.get_instance()
+
+    yield config_store
+
+    config_store.reset()
+# END store
+
+
+def test__key_selectors_return_entity_guid():
+    assert get_notification_entity_guid(dumps({"message": {"entity": {"guid": "a"}}})) == "a"
+    assert get_atlas_entity_guid(dumps({"atlas_entity": {"guid": "b"}})) == "b"
+    assert get_entity_message_guid(dumps({"guid": "c"}, COMPACT_ENCODING)) == "c"
+    assert get_document_change_id(dumps({"action": "index", "id": "d"})) == "d"
+# END test__key_selectors_return_entity_guid
+
+
+def test__key_selectors_return_empty_key_for_invalid_messages():
+    assert get_notification_entity_guid("not json") == ""
+    assert get_atlas_entity_guid(dumps({"kafka_notification": {}})) == ""
+    assert get_entity_message_guid(dumps([])) == ""
+# END test__key_selectors_return_empty_key_for_invalid_messages
+
+
+def test__atlas_entity_guid_is_read_from_leading_guid(monkeypatch):
+    partitioning = sys.modules[get_atlas_entity_guid.__module__]
+    monkeypatch.setattr(partitioning, "loads", lambda message: pytest.fail("the notification should not be parsed"))
+
+    assert get_atlas_entity_guid('{"guid": "a", "kafka_notification": {}, "atlas_entity": {"guid": "a"}}') == "a"
+    assert get_atlas_entity_guid(dumps({"guid": "b", "atlas_entity": {"guid": "b"}})) == "b"
+# END test__atlas_entity_guid_is_read_from_leading_guid
+
+
+def test__operator_parallelism_overrides_default(store: ConfigStore):
+    store.load({"flink.parallelism": 4, "get.entity.parallelism": "12"})
+
+    assert get_parallelism("get.entity") == 12
+    assert get_parallelism("publish.state") == 4
+# END test__operator_parallelism_overrides_default
+
+
+def test__parallelism_is_none_when_not_configured():
+    assert get_parallelism("get.entity") is None
+# END test__parallelism_is_none_when_not_configured
+
+
+def test__default_parallelism_is_one_when_not_configured():
+    assert get_default_parallelism() == 1
+# END test__default_parallelism_is_one_when_not_configured
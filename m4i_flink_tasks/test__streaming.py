@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+from .streaming import iter_in_background
+
+
+def test__items_are_yielded_in_order():
+    def produce(emit):
+        for index in range(10):
+            emit(index)
+
+    assert list(iter_in_background(produce, max_pending=2)) == list(range(10))
+# END test__items_are_yielded_in_order
+
+
+def test__producer_waits_for_consumer():
+    emitted = []
+
+    def produce(emit):
+        for index in range(10):
+            emit(index)
+            emitted.append(index)
+
+    items = iter_in_background(produce, max_pending=2)
+
+    assert next(items) == 0
+    threading.Event().wait(0.05)
+    assert len(emitted) <= 3
+
+    assert list(items) == list(range(1, 10))
+# END test__producer_waits_for_consumer
+
+
+def test__producer_failure_is_raised_after_emitted_items():
+    def produce(emit):
+        emit("first")
+        raise ValueError("failed")
+
+    items = iter_in_background(produce)
+
+    assert next(items) == "first"
+    with pytest.raises(ValueError):
+        next(items)
+# END test__producer_failure_is_raised_after_emitted_items
+
+
+def test__closing_the_iterator_stops_the_producer():
+    stopped = threading.Event()
+
+    def produce(emit):
+        try:
+            while True:
+                emit("item")
+        finally:
+            stopped.set()
+
+    items = iter_in_background(produce, max_pending=1)
+    next(items)
+    items.close()
+
+    assert stopped.is_set()
+# END test__closing_the_iterator_stops_the_producer
@@ -1,20 +1,58 @@
 config = {
     "atlas.server.url": "127.0.0.1:21000/api/atlas",
+    "atlas.type.cache.ttl": 3600,
+    "atlas.type.cache.size": 1024,
+    "atlas.get.entity.coalesce.window": 0,
+    "atlas.get.entity.async.enabled": False,
+    "atlas.get.entity.async.capacity": 10,
+    "atlas.get.entity.async.ordered": True,
+    "atlas.get.entity.async.drain.interval": 100,
+    "atlas.get.entity.bulk.enabled": False,
+    "atlas.get.entity.bulk.size": 50,
+    "atlas.get.entity.bulk.window": 100,
+    "flink.parallelism": 1,
+    "get.entity.coalesce.parallelism": None,
+    "get.entity.parallelism": None,
+    "determine.change.parallelism": None,
+    "publish.state.parallelism": None,
+    "synchronize.app.search.parallelism": None,
+    "write.app.search.parallelism": None,
     "kafka.bootstrap.server.hostname": "127.0.0.1",
     "kafka.bootstrap.server.port": "9027",
     "kafka.consumer.group.id": None,
     "atlas.audit.events.topic.name": "ATLAS_ENTITIES",
     "enriched.events.topic.name": "ENRICHED_ENTITIES",
+    "enriched.events.encoding": "json",
     "determined.events.topic.name": "DETERMINED_CHANGE",
+    "determined.events.encoding": "json",
+    "determined.events.payload": "full",
     "exception.events.topic.name": "DEAD_LETTER_BOX",
+    "exception.events.linger.ms": 1000,
+    "exception.events.buffer.memory": 8388608,
+    "exception.events.max.block.ms": None,
 
     "elastic.search.index" : "atlas-dev-test",
+    "elastic.search.bulk.enabled" : False,
+    "elastic.search.bulk.flush.size" : 500,
+    "elastic.search.bulk.flush.bytes" : 5242880,
+    "elastic.search.bulk.flush.interval" : 1.0,
     "elastic.app.search.engine.name" : "atlas-dev-test",
+    "elastic.app.search.flush.size" : 100,
+    "elastic.app.search.flush.interval" : 1.0,
+    "elastic.app.search.patch.enabled" : True,
+    "elastic.app.search.schema.refresh.interval" : 300,
+    "elastic.app.search.partition.field" : None,
+    "elastic.app.search.fetch.workers" : 4,
+    "elastic.app.search.stream.max.pending" : 1000,
+    "elastic.app.search.hierarchy.index.enabled" : False,
+    "elastic.app.search.hierarchy.index.refresh.interval" : 3600,
 
     "elastic.cloud.username": "elastic",
     "elastic.cloud.id": "YOUR CLOUD ID",
     "elastic.base.endpoint" : "APP-SEACRH-HOSTNAME/api/as/v1",
     "elastic.search.endpoint" : "YOUR_ELASTIC_ENDPOINT",
+    "elastic.connection.pool.size" : 10,
+    "elastic.connection.request.timeout" : 10,
     "elastic.enterprise.search.endpoint": "YOUR_ELASTIC_SEARCH_ENDPOINT",
     
     "keycloak.server.url" : "http://127.0.0.1:9100/auth/",
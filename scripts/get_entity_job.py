@@ -6,15 +6,22 @@ import os
 
 from pyflink.common.typeinfo import Types
 
-from m4i_atlas_core import AtlasChangeMessage, ConfigStore, EntityAuditAction, get_entity_by_guid, get_keycloak_token
+from m4i_atlas_core import AtlasChangeMessage, ConfigStore, EntityAuditAction, get_entity_by_guid
 from pyflink.common.serialization import SimpleStringSchema
 from pyflink.datastream import StreamExecutionEnvironment
 from pyflink.datastream.connectors import FlinkKafkaConsumer, FlinkKafkaProducer
-from pyflink.datastream.functions import MapFunction, RuntimeContext
-from kafka import KafkaProducer
-import time
+from pyflink.datastream.functions import KeyedProcessFunction, MapFunction, RuntimeContext
+from pyflink.datastream.state import ValueStateDescriptor
 import os
-from m4i_flink_tasks.DeadLetterBoxMessage import DeadLetterBoxMesage
+from m4i_flink_tasks.AsyncRequestWindow import AsyncRequestWindow
+from m4i_flink_tasks.AtlasClient import AtlasClient
+from m4i_flink_tasks.BulkEntityBatch import BulkEntityBatch
+from m4i_flink_tasks.DeadLetterBoxProducer import DeadLetterBoxProducer
+from m4i_flink_tasks.KeycloakTokenProvider import call_with_access_token, get_access_token
+from m4i_flink_tasks.codec import dumps, loads
+from m4i_flink_tasks.config_values import parse_bool
+from m4i_flink_tasks.notification_coalescing import coalesce_notification, get_collapsed_operation_types
+from m4i_flink_tasks.partitioning import get_default_parallelism, get_notification_entity_guid, set_parallelism
 from config import config
 from credentials import credentials
 import traceback
@@ -23,35 +30,55 @@ from  aiohttp.client_exceptions import ClientResponseError
 
 store = ConfigStore.get_instance()
 
+ENRICHED_OPERATION_TYPES = [EntityAuditAction.ENTITY_CREATE, EntityAuditAction.ENTITY_UPDATE, EntityAuditAction.ENTITY_DELETE]
+
+
+def create_enriched_notification(kafka_notification: AtlasChangeMessage, event_entity, collapsed_operation_types = None) -> str:
+    """
+    This function combines the kafka notification and the entity retrieved from Atlas into the enriched notification.
+    In case the notification replaces several coalesced notifications, their operation types are included as collapsed_operation_types.
+    The enriched notification is written in the encoding configured as enriched.events.encoding, json by default.
+    """
+    logging.warning(repr(kafka_notification))
+    logging.warning(repr(event_entity))
+    # The guid goes first, so the next job derives the key of the notification without parsing it in full.
+    enriched_notification = {"guid" : kafka_notification.message.entity.guid, "kafka_notification" : kafka_notification, "atlas_entity" : event_entity}
+    if collapsed_operation_types:
+        enriched_notification["collapsed_operation_types"] = collapsed_operation_types
+
+    enriched_notification = dumps(enriched_notification, store.get("enriched.events.encoding"))
+    logging.warning(enriched_notification)
+    return enriched_notification
+
 
 class GetEntity(MapFunction):
 
     def open(self, runtime_context: RuntimeContext):
         store.load({**config, **credentials})
+        get_access_token()
+        self.dead_letter_box = DeadLetterBoxProducer(job="get_entity")
+        self.dead_letter_box.open(runtime_context)
+
+    def close(self):
+        self.dead_letter_box.close()
 
     def map(self, kafka_notification: str):
         async def get_entity(kafka_notification):
 
             logging.warning(repr(kafka_notification))
-            kafka_notification = AtlasChangeMessage.from_json(kafka_notification)
-            access_token = get_keycloak_token()
-            logging.warning(access_token)
+            kafka_notification_json = loads(kafka_notification)
+            collapsed_operation_types = get_collapsed_operation_types(kafka_notification_json)
+            kafka_notification = AtlasChangeMessage.from_dict(kafka_notification_json)
 
-            if kafka_notification.message.operation_type in [EntityAuditAction.ENTITY_CREATE, EntityAuditAction.ENTITY_UPDATE, EntityAuditAction.ENTITY_DELETE]:
+            if kafka_notification.message.operation_type in ENRICHED_OPERATION_TYPES:
                 entity_guid = kafka_notification.message.entity.guid
                 await get_entity_by_guid.cache.clear()
-                event_entity = await get_entity_by_guid(guid=entity_guid, ignore_relationships=False, access_token=access_token)
+                event_entity = await call_with_access_token(get_entity_by_guid, guid=entity_guid, ignore_relationships=False)
                 # event_entity = await get_entity_by_guid(guid=entity_guid, ignore_relationships=False)
                 if not event_entity:
                     raise Exception(f"No entity could be retreived from Atlas with guid {entity_guid}")
 
-                logging.warning(repr(kafka_notification))
-                logging.warning(repr(event_entity))
-                kafka_notification_json =  json.loads(kafka_notification.to_json())
-                entity_json =   json.loads(event_entity.to_json())
-
-                logging.warning(json.dumps({"kafka_notification" : kafka_notification_json, "atlas_entity" : entity_json}))
-                return json.dumps({"kafka_notification" : kafka_notification_json, "atlas_entity" : entity_json})
+                return create_enriched_notification(kafka_notification, event_entity, collapsed_operation_types)
 
         # END func
         try:
@@ -59,35 +86,211 @@ class GetEntity(MapFunction):
 
         except ClientResponseError as e:
 
-            bootstrap_server_hostname, bootstrap_server_port =  store.get_many("kafka.bootstrap.server.hostname", "kafka.bootstrap.server.port")
-
             exc_info = sys.exc_info()
             e = (''.join(traceback.format_exception(*exc_info)))
 
-            event = DeadLetterBoxMesage(timestamp=time.time(), original_notification=kafka_notification.to_json(), job="get_entity", description = (e))
-            logging.warning("this goes into dead letter box: ")
-            logging.warning(repr(event))
+            self.dead_letter_box.send(kafka_notification, e)
+
+
+class CoalesceNotifications(KeyedProcessFunction):
+    """
+    This function collapses the entity notifications for the same guid that arrive within atlas.get.entity.coalesce.window milliseconds
+    after the first one into a single notification, so the entity is retrieved from Atlas once in its latest state.
+    The emitted notification is the latest one, with the effective operation type of all collapsed notifications and their
+    operation types listed under collapsedOperationTypes. Notifications that do not belong to an entity are passed on directly.
+    """
+
+    def open(self, runtime_context: RuntimeContext):
+        store.load({**config, **credentials})
+        self.window = int(store.get("atlas.get.entity.coalesce.window") or 0)
+        self.pending_notification = runtime_context.get_state(
+            ValueStateDescriptor("pending_notification", Types.STRING()))
+
+    def process_element(self, kafka_notification: str, ctx: 'KeyedProcessFunction.Context'):
+        if not ctx.get_current_key():
+            yield kafka_notification
+            return
+
+        pending_notification = self.pending_notification.value()
+
+        if pending_notification is None:
+            ctx.timer_service().register_processing_time_timer(ctx.timer_service().current_processing_time() + self.window)
+
+        self.pending_notification.update(coalesce_notification(pending_notification, kafka_notification))
+
+    def on_timer(self, timestamp: int, ctx: 'KeyedProcessFunction.OnTimerContext'):
+        pending_notification = self.pending_notification.value()
+        self.pending_notification.clear()
+
+        if pending_notification is not None:
+            yield pending_notification
+
 
-            producer = KafkaProducer(
-                bootstrap_servers=  f"{bootstrap_server_hostname}:{bootstrap_server_port}",
-                value_serializer=str.encode,
-                request_timeout_ms = 1000,
-                api_version = (2,0,2),
-                retries = 1,
-                linger_ms = 1000
-            )
+class AsyncGetEntity(KeyedProcessFunction):
+    """
+    This function retrieves the entities from Atlas with up to atlas.get.entity.async.capacity requests in flight at the same time.
+    The requests run on an event loop and over an HTTP session that live as long as the task.
+    With atlas.get.entity.async.ordered set, the enriched notifications are emitted in the order the notifications arrived,
+    otherwise they are emitted as soon as the entity is retrieved.
+    Completed requests are emitted when the next notification arrives or on a processing time timer after
+    atlas.get.entity.async.drain.interval milliseconds, so results do not wait for the next notification on a quiet topic.
+    Requests that fail for any reason, including entities that do not exist in Atlas, go to the dead letter box.
+    """
 
-            dead_lettter_box_topic = store.get("exception.events.topic.name")
+    def open(self, runtime_context: RuntimeContext):
+        store.load({**config, **credentials})
+        get_access_token()
+        self.dead_letter_box = DeadLetterBoxProducer(job="get_entity")
+        self.dead_letter_box.open(runtime_context)
+
+        capacity, ordered, drain_interval = store.get_many(
+            "atlas.get.entity.async.capacity",
+            "atlas.get.entity.async.ordered",
+            "atlas.get.entity.async.drain.interval"
+        )
+
+        capacity = int(capacity or 10)
+        self.drain_interval = int(drain_interval or 100)
+        self.drain_timer = None
+
+        self.window = AsyncRequestWindow(max_in_flight=capacity, ordered=parse_bool(ordered, default=True))
+        self.atlas = AtlasClient(connection_limit=capacity)
+
+    def close(self):
+        # A python function cannot emit elements from close, so the requests that are still in flight are awaited
+        # and their notifications are handed to the dead letter box instead of being lost.
+        for kafka_notification, future in self.window.drain(timeout=self.atlas.timeout):
+            try:
+                future.result()
+                description = "The task closed before the enriched notification could be emitted"
+            except Exception:
+                description = ''.join(traceback.format_exception(*sys.exc_info()))
+            self.dead_letter_box.send(kafka_notification, description)
+
+        self.window.run(self.atlas.close())
+
+        for kafka_notification, _ in self.window.close():
+            self.dead_letter_box.send(kafka_notification, "The task closed before the entity could be retrieved from Atlas")
+
+        self.dead_letter_box.close()
+
+    async def get_entity(self, kafka_notification: AtlasChangeMessage, collapsed_operation_types = None):
+        entity_guid = kafka_notification.message.entity.guid
+        event_entity = await call_with_access_token(self.atlas.get_entity_by_guid, guid=entity_guid, ignore_relationships=False)
+        if not event_entity:
+            raise Exception(f"No entity could be retreived from Atlas with guid {entity_guid}")
+        return create_enriched_notification(kafka_notification, event_entity, collapsed_operation_types)
+
+    def emit(self, completed_requests):
+        for kafka_notification, future in completed_requests:
+            try:
+                yield future.result()
+            except Exception as e:
+                exc_info = sys.exc_info()
+                e = (''.join(traceback.format_exception(*exc_info)))
+
+                self.dead_letter_box.send(kafka_notification, e)
+
+    def schedule_drain(self, ctx: 'KeyedProcessFunction.Context'):
+        """This function registers a processing time timer to emit the requests that are still in flight, unless one is registered already."""
+        if len(self.window) == 0 or self.drain_timer is not None:
+            return
+        self.drain_timer = ctx.timer_service().current_processing_time() + self.drain_interval
+        ctx.timer_service().register_processing_time_timer(self.drain_timer)
+
+    def process_element(self, kafka_notification: str, ctx: 'KeyedProcessFunction.Context'):
+        logging.warning(repr(kafka_notification))
+        kafka_notification_json = loads(kafka_notification)
+        atlas_kafka_notification = AtlasChangeMessage.from_dict(kafka_notification_json)
+
+        if atlas_kafka_notification.message.operation_type in ENRICHED_OPERATION_TYPES:
+            collapsed_operation_types = get_collapsed_operation_types(kafka_notification_json)
+            yield from self.emit(self.window.submit(kafka_notification, self.get_entity(atlas_kafka_notification, collapsed_operation_types)))
+        else:
+            yield from self.emit(self.window.poll())
+
+        self.schedule_drain(ctx)
+
+    def on_timer(self, timestamp: int, ctx: 'KeyedProcessFunction.OnTimerContext'):
+        if timestamp == self.drain_timer:
+            self.drain_timer = None
+        yield from self.emit(self.window.poll())
+        self.schedule_drain(ctx)
+
+
+class BulkGetEntity(KeyedProcessFunction):
+    """
+    This function collects the notifications that arrive within atlas.get.entity.bulk.window milliseconds, up to atlas.get.entity.bulk.size,
+    and retrieves their entities from Atlas in a single request to the bulk entity api.
+    Every notification is then enriched with its own entity. Notifications of which the entity is not returned by Atlas go to the dead letter box.
+    """
+
+    def open(self, runtime_context: RuntimeContext):
+        store.load({**config, **credentials})
+        get_access_token()
+        self.dead_letter_box = DeadLetterBoxProducer(job="get_entity")
+        self.dead_letter_box.open(runtime_context)
+
+        batch_size, batch_window = store.get_many(
+            "atlas.get.entity.bulk.size",
+            "atlas.get.entity.bulk.window"
+        )
+
+        self.batch_window = int(batch_window or 100)
+        self.flush_timer = None
+
+        self.window = AsyncRequestWindow(max_in_flight=1)
+        self.atlas = AtlasClient(connection_limit=1)
+        self.batch = BulkEntityBatch(self.atlas, self.window, max_size=int(batch_size or 50))
+
+    def close(self):
+        # A python function cannot emit elements from close, so the notifications that are still in the batch
+        # are handed to the dead letter box instead of being lost.
+        for kafka_notification, _, _ in self.batch.drain():
+            self.dead_letter_box.send(kafka_notification, "The task closed before the entity could be retrieved from Atlas")
+
+        self.window.run(self.atlas.close())
+        self.window.close()
+        self.dead_letter_box.close()
 
-            producer.send(topic=dead_lettter_box_topic, value=event.to_json())
+    def flush(self):
+        retrieved, failed = self.batch.flush()
 
+        for (kafka_notification, _, _), description in failed:
+            self.dead_letter_box.send(kafka_notification, description)
+
+        for (_, atlas_kafka_notification, collapsed_operation_types), event_entity in retrieved:
+            yield create_enriched_notification(atlas_kafka_notification, event_entity, collapsed_operation_types)
+
+    def process_element(self, kafka_notification: str, ctx: 'KeyedProcessFunction.Context'):
+        logging.warning(repr(kafka_notification))
+        kafka_notification_json = loads(kafka_notification)
+        atlas_kafka_notification = AtlasChangeMessage.from_dict(kafka_notification_json)
+
+        if atlas_kafka_notification.message.operation_type not in ENRICHED_OPERATION_TYPES:
+            return
+
+        element = (kafka_notification, atlas_kafka_notification, get_collapsed_operation_types(kafka_notification_json))
+
+        if self.batch.add(element, atlas_kafka_notification.message.entity.guid):
+            yield from self.flush()
+        elif self.flush_timer is None:
+            self.flush_timer = ctx.timer_service().current_processing_time() + self.batch_window
+            ctx.timer_service().register_processing_time_timer(self.flush_timer)
+
+    def on_timer(self, timestamp: int, ctx: 'KeyedProcessFunction.OnTimerContext'):
+        if timestamp == self.flush_timer:
+            self.flush_timer = None
+        yield from self.flush()
 
 
 def run_get_entity_job():
 
+    store.load({**config, **credentials})
+
     env = StreamExecutionEnvironment.get_execution_environment()
     #set_env(env)
-    env.set_parallelism(1)
+    env.set_parallelism(get_default_parallelism())
 
     path = os.path.dirname(__file__)
 
@@ -114,7 +317,19 @@ def run_get_entity_job():
 
     data_stream = env.add_source(kafka_source).name(f"consuming atlas events")
 
-    data_stream = data_stream.map(GetEntity(), Types.STRING()).name("retrieve entity from atlas").filter(lambda notif: notif)
+    # The stream is partitioned by entity guid, so the notifications of an entity are handled in order by the same subtask.
+    if config.get("atlas.get.entity.coalesce.window"):
+        data_stream = data_stream.key_by(get_notification_entity_guid, key_type=Types.STRING())
+        data_stream = set_parallelism(data_stream.process(CoalesceNotifications(), Types.STRING()), "get.entity.coalesce").name("coalesce notifications per entity")
+
+    data_stream = data_stream.key_by(get_notification_entity_guid, key_type=Types.STRING())
+
+    if parse_bool(config.get("atlas.get.entity.bulk.enabled")):
+        data_stream = set_parallelism(data_stream.process(BulkGetEntity(), Types.STRING()), "get.entity").name("retrieve entities from atlas in bulk").filter(lambda notif: notif)
+    elif parse_bool(config.get("atlas.get.entity.async.enabled")):
+        data_stream = set_parallelism(data_stream.process(AsyncGetEntity(), Types.STRING()), "get.entity").name("retrieve entity from atlas").filter(lambda notif: notif)
+    else:
+        data_stream = set_parallelism(data_stream.map(GetEntity(), Types.STRING()), "get.entity").name("retrieve entity from atlas").filter(lambda notif: notif)
 
     data_stream.print()
 
@@ -19,13 +19,14 @@ from credentials import credentials
 
 # from m4i_data_management import make_elastic_connection
 # from m4i_data_management import ConfigStore as m4i_ConfigStore
-from kafka import KafkaProducer
-import time
-from m4i_flink_tasks.DeadLetterBoxMessage import DeadLetterBoxMesage
+from m4i_flink_tasks.DeadLetterBoxProducer import DeadLetterBoxProducer
+from m4i_flink_tasks.codec import loads
+from m4i_flink_tasks.config_values import parse_bool
+from m4i_flink_tasks.partitioning import get_atlas_entity_guid, get_default_parallelism, set_parallelism
 import traceback
 import os
 from elasticsearch import Elasticsearch
-from m4i_flink_tasks.synchronize_app_search import make_elastic_connection
+from m4i_flink_tasks.synchronize_app_search import make_elastic_connection, ElasticBulkBuffer
 config_store = ConfigStore.get_instance()
 # config_store = m4i_ConfigStore.get_instance()
 
@@ -46,42 +47,50 @@ config_store = ConfigStore.get_instance()
 
 #     return connection
 
+def get_atlas_entity_document(kafka_notification: str):
+    """This function validates the enriched kafka notification and returns the document id and the atlas entity to be indexed."""
+    kafka_notification_json = loads(kafka_notification)
+
+    if "kafka_notification" not in kafka_notification_json.keys() or "atlas_entity" not in kafka_notification_json.keys():
+        raise Exception("Kafka event does not match the predefined structure: {\"kafka_notification\" : {}, \"atlas_entity\" : {}}")
+    
+    if not kafka_notification_json.get("kafka_notification"):
+        logging.warning(kafka_notification)
+        logging.warning("No kafka notification.")
+        raise Exception("Original Kafka notification which is produced by Atlas is missing")
+
+    if not kafka_notification_json.get("atlas_entity"):
+        logging.warning(kafka_notification)
+        logging.warning("No atlas entity.")
+        raise Exception("Atlas Entity in Kafka notification is missing.")
+
+    atlas_entity_json = kafka_notification_json["atlas_entity"]
+
+    doc_id = "{}_{}".format(atlas_entity_json.get("guid"), atlas_entity_json.get("updateTime"))
+
+    return doc_id, atlas_entity_json
+
+
 class PublishState(MapFunction):
 
     def open(self, runtime_context: RuntimeContext):
         config_store.load({**config, **credentials})
+        self.dead_letter_box = DeadLetterBoxProducer(job="publish_state")
+        self.dead_letter_box.open(runtime_context)
+        self.elastic = make_elastic_connection()
+
+    def close(self):
+        self.elastic.close()
+        self.dead_letter_box.close()
 
     def map(self, kafka_notification: str):
         try: 
-            kafka_notification_json = json.loads(kafka_notification)
-
-            if "kafka_notification" not in kafka_notification_json.keys() or "atlas_entity" not in kafka_notification_json.keys():
-                raise Exception("Kafka event does not match the predefined structure: {\"kafka_notification\" : {}, \"atlas_entity\" : {}}")
-            
-            if not kafka_notification_json.get("kafka_notification"):
-                logging.warning(kafka_notification)
-                logging.warning("No kafka notification.")
-                raise Exception("Original Kafka notification which is produced by Atlas is missing")
-
-            if not kafka_notification_json.get("atlas_entity"):
-                logging.warning(kafka_notification)
-                logging.warning("No atlas entity.")
-                raise Exception("Atlas Entity in Kafka notification is missing.")
-
-            atlas_entity_json = kafka_notification_json["atlas_entity"]
-            atlas_entity = json.dumps(atlas_entity_json)
-            logging.warning(atlas_entity)
-
-            atlas_entity = Entity.from_json(atlas_entity)
-            
-            doc_id = "{}_{}".format(atlas_entity.guid, atlas_entity.update_time)
+            doc_id, atlas_entity_json = get_atlas_entity_document(kafka_notification)
             
             logging.warning(kafka_notification)
 
             elastic_search_index = config_store.get("elastic.search.index")
-            elastic = make_elastic_connection()
-            elastic.index(index=elastic_search_index, id = doc_id, document=atlas_entity_json)
-            elastic.close()
+            self.elastic.index(index=elastic_search_index, id = doc_id, document=atlas_entity_json)
 
             return kafka_notification
         
@@ -90,25 +99,66 @@ class PublishState(MapFunction):
             e = (''.join(traceback.format_exception(*exc_info)))
             logging.warning(e)
 
-            event = DeadLetterBoxMesage(timestamp=time.time(), original_notification=kafka_notification, job="publish_state", description = (e))
-            bootstrap_server_hostname, bootstrap_server_port =  config_store.get_many("kafka.bootstrap.server.hostname", "kafka.bootstrap.server.port")
-            producer = KafkaProducer(
-                bootstrap_servers=  f"{bootstrap_server_hostname}:{bootstrap_server_port}",
-                value_serializer=str.encode,
-                request_timeout_ms = 1000,
-                api_version = (2,0,2),
-                retries = 1,
-                linger_ms = 1000
-            )
-            dead_lettter_box_topic = config_store.get("exception.events.topic.name") 
-            producer.send(topic = dead_lettter_box_topic, value=event.to_json())
+            self.dead_letter_box.send(kafka_notification, e)
+
+
+class BulkPublishState(MapFunction):
+    """
+    This function buffers the atlas entity snapshots and indexes them in bulk through the elastic search _bulk api.
+    Snapshots that elastic search rejects are forwarded to the dead letter box one by one.
+    """
+
+    def open(self, runtime_context: RuntimeContext):
+        config_store.load({**config, **credentials})
+        self.dead_letter_box = DeadLetterBoxProducer(job="publish_state")
+        self.dead_letter_box.open(runtime_context)
+        self.elastic = make_elastic_connection()
+
+        elastic_search_index, flush_size, flush_bytes, flush_interval = config_store.get_many(
+            "elastic.search.index",
+            "elastic.search.bulk.flush.size",
+            "elastic.search.bulk.flush.bytes",
+            "elastic.search.bulk.flush.interval"
+        )
+
+        self.buffer = ElasticBulkBuffer(
+            elastic=self.elastic,
+            index=elastic_search_index,
+            on_failure=self.dead_letter_box.send,
+            flush_size=int(flush_size or 500),
+            flush_bytes=int(flush_bytes or 5 * 1024 * 1024),
+            flush_interval=float(flush_interval or 1.0)
+        )
+        self.buffer.start()
+
+    def close(self):
+        self.buffer.close()
+        self.elastic.close()
+        self.dead_letter_box.close()
+
+    def map(self, kafka_notification: str):
+        try:
+            doc_id, atlas_entity_json = get_atlas_entity_document(kafka_notification)
+            self.buffer.add(doc_id, atlas_entity_json, kafka_notification)
+            self.buffer.flush_if_due()
+
+            return kafka_notification
+
+        except Exception as e:
+            exc_info = sys.exc_info()
+            e = (''.join(traceback.format_exception(*exc_info)))
+            logging.warning(e)
+
+            self.dead_letter_box.send(kafka_notification, e)
         
        
 def run_publish_state_job():
 
+    config_store.load({**config, **credentials})
+
     env = StreamExecutionEnvironment.get_execution_environment()
     # set_env(env)
-    env.set_parallelism(1)
+    env.set_parallelism(get_default_parallelism())
 
     path = os.path.dirname(__file__) 
 
@@ -134,7 +184,13 @@ def run_publish_state_job():
 
     data_stream = env.add_source(kafka_source)
 
-    data_stream = data_stream.map(PublishState()).name("my_mapping")
+    # The stream is partitioned by entity guid, so the versions of an entity are published in order by the same subtask.
+    data_stream = data_stream.key_by(get_atlas_entity_guid, key_type=Types.STRING())
+
+    if parse_bool(config.get("elastic.search.bulk.enabled")):
+        data_stream = set_parallelism(data_stream.map(BulkPublishState()), "publish.state").name("publish state in bulk")
+    else:
+        data_stream = set_parallelism(data_stream.map(PublishState()), "publish.state").name("my_mapping")
 
     data_stream.print()
 
@@ -9,20 +9,23 @@ from typing import List, Optional
 from elastic_app_search import Client
 
 from pyflink.common.typeinfo import Types
-from m4i_flink_tasks import create_doc, delete_document,  handle_updated_attributes, handle_deleted_attributes, handle_inserted_relationships, handle_deleted_relationships
+from m4i_flink_tasks import EntityMessageHandler
+from m4i_flink_tasks import AppSearchDocumentBuffer
+from m4i_flink_tasks import super_type_cache, schema_cache, hierarchy_index, iter_all_documents
 
 from pyflink.common.serialization import SimpleStringSchema
 from pyflink.datastream import StreamExecutionEnvironment
 from pyflink.datastream.connectors import FlinkKafkaConsumer
-from pyflink.datastream.functions import MapFunction, RuntimeContext
+from pyflink.datastream.functions import MapFunction, FlatMapFunction, RuntimeContext
 
 from config import config
 from credentials import credentials
 
 from m4i_flink_tasks import EntityMessage
-from m4i_flink_tasks import DeadLetterBoxMesage
-import time
-from kafka import KafkaProducer
+from m4i_flink_tasks import DeadLetterBoxProducer
+from m4i_flink_tasks.codec import dumps, loads
+from m4i_flink_tasks.config_values import parse_bool
+from m4i_flink_tasks.partitioning import get_default_parallelism, get_document_change_id, get_entity_message_guid, set_parallelism
 import traceback
 from elastic_enterprise_search import EnterpriseSearch, AppSearch
 # from set_environment import set_env
@@ -52,7 +55,7 @@ def get_app_search():
     
     return app_search
 
-class SynchronizeAppsearch(MapFunction):
+class SynchronizeAppsearch(FlatMapFunction):
 
 
 
@@ -60,16 +63,51 @@ class SynchronizeAppsearch(MapFunction):
         global app_search
         config_store.load({**config, **credentials})
         app_search = get_app_search()
+        self.engine_name = config_store.get("elastic.app.search.engine.name")
 
+        type_cache_ttl, type_cache_size = config_store.get_many("atlas.type.cache.ttl", "atlas.type.cache.size")
+        super_type_cache.ttl = float(type_cache_ttl or super_type_cache.ttl)
+        super_type_cache.max_size = int(type_cache_size or super_type_cache.max_size)
 
+        schema_refresh_interval = config_store.get("elastic.app.search.schema.refresh.interval")
+        schema_cache.refresh_interval = float(schema_refresh_interval or schema_cache.refresh_interval)
 
-    def map(self, kafka_notification: str):
+        hierarchy_index_enabled, hierarchy_index_refresh_interval = config_store.get_many(
+            "elastic.app.search.hierarchy.index.enabled",
+            "elastic.app.search.hierarchy.index.refresh.interval"
+        )
+        patch_enabled = parse_bool(config_store.get("elastic.app.search.patch.enabled"))
+        self.max_pending_changes = int(config_store.get("elastic.app.search.stream.max.pending") or 1000)
+        self.hierarchy_index_enabled = parse_bool(hierarchy_index_enabled)
+        self.hierarchy_index_refresh_interval = float(hierarchy_index_refresh_interval or 0)
+        self.load_hierarchy_index()
+
+        # A single handler, and with it a single event loop, is kept for the lifetime of the task.
+        self.handler = EntityMessageHandler(app_search, self.engine_name, patch_enabled)
+        self.handler.open()
+
+        self.dead_letter_box = DeadLetterBoxProducer(job="synchronize_app_search")
+        self.dead_letter_box.open(runtime_context)
+
+    def close(self):
+        self.handler.close()
+        self.dead_letter_box.close()
+
+    def load_hierarchy_index(self):
+        """
+        This function reads the hierarchy index from app search when the task starts, and again after its refresh interval,
+        since other tasks may write documents this task does not see. Until it is loaded, subtrees are retrieved with search queries.
+        """
+        if self.hierarchy_index_enabled and hierarchy_index.is_expired(self.hierarchy_index_refresh_interval):
+            hierarchy_index.bootstrap(iter_all_documents(app_search, self.engine_name))
+            logging.warning(f"Hierarchy index loaded with {len(hierarchy_index)} entities.")
+
+
+
+    def flat_map(self, kafka_notification: str):
         try:
             logging.warning(kafka_notification)
-            entity_message = EntityMessage.from_json((kafka_notification))
-
-            updated_docs = []
-            entity_doc = None
+            entity_message = EntityMessage.from_dict(loads(kafka_notification))
 
             if entity_message.direct_change == False:
                 logging.warning("This message is a consequence of an indirect change. No further action is taken.")
@@ -77,46 +115,11 @@ class SynchronizeAppsearch(MapFunction):
 
             logging.warning("handle kafka notification start.")
 
-            if entity_message.event_type=="EntityCreated":
-                logging.warning("New document will be created.")
-                entity_doc = asyncio.run(create_doc(entity_message, app_search))
-                logging.warning("New document is created.")
-                logging.warning(repr(entity_doc))
-            if entity_message.inserted_attributes != []:
-                logging.warning("handle inserted attributes.")
-                updated_docs = handle_updated_attributes(entity_message, entity_message.new_value,entity_message.inserted_attributes, app_search, entity_doc)
-                logging.warning("inserted attributes handled.")
-
-            if entity_message.changed_attributes != []:
-                logging.warning("handle updated attributes.")
-                updated_docs = handle_updated_attributes(entity_message, entity_message.new_value,entity_message.changed_attributes, app_search)
-                logging.warning("updated attributes handled.")
-  
-
-            if entity_message.deleted_attributes != []:
-                logging.warning("handle deleted attributes.")
-                updated_docs = handle_deleted_attributes(entity_message, entity_message.new_value,entity_message.deleted_attributes, app_search, entity_doc)
-                logging.warning("deleted attributes handled.")
-
-            if entity_message.deleted_relationships != {}:
-                logging.warning("handle deleted relationships.")
-                updated_docs = asyncio.run(handle_deleted_relationships(entity_message, entity_message.old_value,entity_message.deleted_relationships, app_search, entity_doc))
-                logging.warning("deleted relationships handled.")
-
-            if entity_message.inserted_relationships != {}:
-                logging.warning("handle inserted relationships.")
-                updated_docs = asyncio.run(handle_inserted_relationships(entity_message, entity_message.new_value, entity_message.inserted_relationships, app_search, entity_doc))
-                logging.warning("inserted relationships handled.")
-
-            if entity_message.event_type=="EntityDeleted":
-                logging.warning("entity docuemnt is deleted.")
-                delete_document(entity_message.guid, app_search)
-
-            for key, updated_doc in updated_docs.items():
-                logging.warning(repr(updated_doc))
+            self.load_hierarchy_index()
 
-            logging.warning("kafka notification is handled.")
+            yield from self.handler.iter_changes(entity_message, self.max_pending_changes)
 
+            logging.warning("kafka notification is handled.")
 
 
 
@@ -128,26 +131,77 @@ class SynchronizeAppsearch(MapFunction):
             exc_info = sys.exc_info()
             e = (''.join(traceback.format_exception(*exc_info)))
 
-            event = DeadLetterBoxMesage(timestamp=time.time(), original_notification=kafka_notification, job="determine_change", description = (e))
-            bootstrap_server_hostname, bootstrap_server_port =  config_store.get_many("kafka.bootstrap.server.hostname", "kafka.bootstrap.server.port")
-            producer = KafkaProducer(
-                bootstrap_servers=  f"{bootstrap_server_hostname}:{bootstrap_server_port}",
-                value_serializer=str.encode,
-                request_timeout_ms = 1000,
-                api_version = (2,0,2),
-                retries = 1,
-                linger_ms = 1000
-            )
-            dead_lettter_box_topic = config_store.get("exception.events.topic.name")
-            producer.send(topic=dead_lettter_box_topic, value=event.to_json())
+            self.dead_letter_box.send(kafka_notification, e)
+
+
+
+class WriteToAppSearch(MapFunction):
+    """
+    This function collects the document changes of many messages and writes them to app search in bulk.
+    A later change of the same document within a flush window replaces the earlier one.
+    In case a flush fails, the changes that could not be written go to the dead letter box and the job carries on.
+    The buffered changes are not part of the Flink checkpoints, since python functions have no checkpoint hook.
+    On a failure of the task, at most elastic.app.search.flush.size changes, or those of the last elastic.app.search.flush.interval seconds, are lost.
+    """
 
+    def open(self, runtime_context: RuntimeContext):
+        config_store.load({**config, **credentials})
+
+        engine_name, flush_size, flush_interval = config_store.get_many(
+            "elastic.app.search.engine.name",
+            "elastic.app.search.flush.size",
+            "elastic.app.search.flush.interval"
+        )
+
+        self.dead_letter_box = DeadLetterBoxProducer(job="synchronize_app_search")
+        self.dead_letter_box.open(runtime_context)
+
+        self.buffer = AppSearchDocumentBuffer(
+            app_search=get_app_search(),
+            engine_name=engine_name,
+            flush_size=int(flush_size or 100),
+            flush_interval=float(flush_interval or 1.0),
+            on_rejected=lambda rejected: schema_cache.observe_rejected(engine_name, rejected)
+        )
+        self.buffer.start()
+
+    def send_to_dead_letter_box(self, description: str):
+        """This function hands the changes that are still in the buffer to the dead letter box."""
+        for change in self.buffer.drain():
+            self.dead_letter_box.send(dumps(change), description)
+
+    def map(self, change: str):
+        try:
+            change_json = loads(change)
+            self.buffer.apply(change_json)
+        except Exception:
+            self.dead_letter_box.send(change, ''.join(traceback.format_exception(*sys.exc_info())))
+            return None
+
+        try:
+            self.buffer.flush_if_due()
+        except Exception:
+            logging.warning("The document changes could not be written to app search.")
+            self.send_to_dead_letter_box(''.join(traceback.format_exception(*sys.exc_info())))
+
+        return change_json["id"]
+
+    def close(self):
+        try:
+            self.buffer.close()
+        except Exception:
+            self.send_to_dead_letter_box(''.join(traceback.format_exception(*sys.exc_info())))
+        finally:
+            self.dead_letter_box.close()
 
 
 def synchronize_app_search():
 
+    config_store.load({**config, **credentials})
+
     env = StreamExecutionEnvironment.get_execution_environment()
     # set_env(env)
-    env.set_parallelism(1)
+    env.set_parallelism(get_default_parallelism())
 
 
     path = os.path.dirname(__file__)
@@ -174,7 +228,15 @@ def synchronize_app_search():
 
     data_stream = env.add_source(kafka_source).name(f"consuming determined change events")
 
-    data_stream = data_stream.map(SynchronizeAppsearch(), Types.STRING()).name("determine change").filter(lambda notif: notif)
+    # The change messages are partitioned by entity guid and the document changes by document id,
+    # so the changes of an entity and the writes of a document each stay in order.
+    data_stream = data_stream.key_by(get_entity_message_guid, key_type = Types.STRING())
+
+    data_stream = set_parallelism(data_stream.flat_map(SynchronizeAppsearch(), Types.STRING()), "synchronize.app.search").name("synchronize app search")
+
+    data_stream = data_stream.key_by(get_document_change_id, key_type = Types.STRING())
+
+    data_stream = set_parallelism(data_stream.map(WriteToAppSearch(), Types.STRING()), "write.app.search").name("write documents to app search").filter(lambda notif: notif)
 
     data_stream.print()
 
@@ -25,6 +25,12 @@ setup(
         # "python-dotenv",
     ],
     extras_require={
+        "fast": [
+            "orjson"
+        ],
+        "compact": [
+            "msgpack"
+        ],
         "dev": [
             "mock",
             "pytest",